@@ -0,0 +1,170 @@
+import argparse
+import contextlib
+import functools
+import json
+import os
+import re
+from pathlib import Path
+
+# Coarse-to-fine frame sampling driven by verification gaps.
+# The first pass extracts frames at ADAPTIVE_LADDER[0] seconds and runs OCR + step verification as
+# usual. Every step still "missing" afterwards gets a time window bounded by its neighbouring matched
+# steps; the next ladder level extracts denser frames only inside those windows, OCRs them and
+# re-verifies only the missing steps against them. Levels repeat until nothing is missing or the
+# ladder ends, so decode/OCR/LLM compute goes where evidence is lacking.
+#   ADAPTIVE_SAMPLING=1 python batch_pipeline.py runs.jsonl      # as the "refine" stage
+#   python adaptive_sampling.py runs/run_01                      # on an already verified run dir
+
+ADAPTIVE_SAMPLING = os.getenv("ADAPTIVE_SAMPLING", "0") == "1"
+# Frames are named by whole second (frame_<sec>s.jpg), so finer levels than 1 s would only hit existing names
+ADAPTIVE_LADDER = [max(float(x), 1.0) for x in os.getenv("ADAPTIVE_LADDER", "6,2,1").split(",")]
+MAX_WINDOW_FRAMES = int(os.getenv("ADAPTIVE_MAX_WINDOW_FRAMES", "30"))
+
+_FRAME_TIME = re.compile(r"frame_(\d+)s\.jpg$")
+
+
+def frame_time(name: str) -> int:
+    match = _FRAME_TIME.search(name)
+    return int(match.group(1)) if match else 0
+
+
+def gap_windows(verification: list, duration_s: float, slack_s: float) -> dict:
+    """
+    step_no -> (start_s, end_s) for every missing step. Steps run in order, so the window opens at the
+    latest first sighting among earlier matched steps and closes at the earliest sighting of a later
+    matched step after that (plus `slack_s`, since the coarse pass may have sampled just past the action).
+    """
+    matched_times = {
+        entry["step_no"]: sorted(frame_time(f) for f in entry["matched_frames"])
+        for entry in verification if entry["status"] == "matched"
+    }
+    windows = {}
+    for idx, entry in enumerate(verification):
+        if entry["status"] != "missing":
+            continue
+        earlier = [matched_times[e["step_no"]][0] for e in verification[:idx] if e["step_no"] in matched_times]
+        start = max(earlier, default=0.0)
+
+        later = [t for e in verification[idx + 1:] if e["step_no"] in matched_times
+                 for t in matched_times[e["step_no"]] if t >= start]
+        end = min(min(later) + slack_s, duration_s) if later else duration_s
+        windows[entry["step_no"]] = (start, max(end, start))
+    return windows
+
+
+def merge_windows(windows: list) -> list:
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def refine_missing_steps(video_path, frames_dir, steps: list, ocr_results: list, verification: list,
+                         get_ocr_model, llm, debug_path, store=None, ladder: list = None, ocr_lock=None):
+    """
+    Run the finer ladder levels for missing steps. `get_ocr_model()` returns (model, processor) and is
+    only called if a window actually yields new frames. `ocr_lock` is held around OCR when the model and
+    store are shared with another thread. Returns (ocr_results, verification, report).
+    """
+    import detective
+    import frames
+    import ocr
+
+    ladder = ladder or ADAPTIVE_LADDER
+    steps_by_no = {entry["step_no"]: steps[entry["step_no"] - 1] for entry in verification}
+    known = {r["frame"] for r in ocr_results}
+    duration_s = max((frame_time(name) for name in known), default=0) + ladder[0]
+    report = {"ladder": ladder, "levels": [], "initially_missing": [e["step_no"] for e in verification if e["status"] == "missing"]}
+
+    with open(debug_path, "a") as debug_f:
+        for level, interval_s in enumerate(ladder[1:], start=1):
+            windows = gap_windows(verification, duration_s, slack_s=ladder[level - 1])
+            if not windows:
+                break
+
+            # Decode only the (merged) gap windows at this level's density
+            new_names = []
+            for start, end in merge_windows(list(windows.values())):
+                step_s = max(interval_s, (end - start) / MAX_WINDOW_FRAMES)
+                new_names += [Path(p).name for p in frames.extract_frames_in_window(video_path, frames_dir, start, end, step_s)]
+            new_names = sorted(set(new_names) - known, key=frame_time)
+
+            new_results = []
+            if new_names:
+                with ocr_lock or contextlib.nullcontext():
+                    model, processor = get_ocr_model()
+                    new_results = ocr.ocr_frames(model, processor, frames_dir, store=store, names=new_names)
+                ocr_results = sorted(ocr_results + new_results, key=lambda r: frame_time(r["frame"]))
+                known.update(new_names)
+
+            # Re-verify each missing step against the new frames inside its own window only
+            recovered = []
+            index = detective.build_index(new_results) if new_results else None
+            for step_no, (start, end) in windows.items():
+                in_window = [r for r in new_results if start <= frame_time(r["frame"]) <= end]
+                if not in_window:
+                    continue
+                entry = detective.verify_step(llm, step_no, steps_by_no[step_no], in_window, debug_f, index)
+                if entry["status"] == "matched":
+                    idx = next(i for i, e in enumerate(verification) if e["step_no"] == step_no)
+                    verification[idx] = entry
+                    recovered.append(step_no)
+
+            report["levels"].append({
+                "interval_s": interval_s,
+                "windows": {str(k): [round(v[0], 1), round(v[1], 1)] for k, v in windows.items()},
+                "new_frames": len(new_names),
+                "recovered_steps": recovered,
+            })
+            print(f"🔍 Level {level} ({interval_s}s): {len(windows)} gap windows, {len(new_names)} new frames, "
+                  f"recovered steps {recovered or 'none'}")
+
+    report["still_missing"] = [e["step_no"] for e in verification if e["status"] == "missing"]
+    report["frames_total"] = len(ocr_results)
+    return ocr_results, verification, report
+
+
+def refine_run(run_dir: Path, get_ocr_model, get_llm, store=None, ocr_lock=None) -> dict:
+    """Refine an already verified run directory in place (batch_pipeline layout)."""
+    import batch_pipeline as bp
+    import ocr
+
+    with open(run_dir / bp.SUMMARY_JSON, "r", encoding="utf-8") as f:
+        steps = json.load(f)
+    with open(run_dir / bp.OCR_RESULTS, "r", encoding="utf-8") as f:
+        ocr_results = json.load(f)
+    with open(run_dir / bp.STEP_VERIFICATION, "r", encoding="utf-8") as f:
+        verification = json.load(f)
+    if not any(e["status"] == "missing" for e in verification):
+        return {"initially_missing": [], "levels": [], "still_missing": []}
+
+    ocr_results, verification, report = refine_missing_steps(
+        str(run_dir / bp.VIDEO_FILE), str(run_dir / bp.FRAMES_DIR), steps, ocr_results, verification,
+        get_ocr_model, get_llm(), str(run_dir / bp.STEP_VERIFICATION).replace(".json", "_debug.txt"), store,
+        ocr_lock=ocr_lock,
+    )
+    ocr.save_results(ocr_results, str(run_dir / bp.OCR_RESULTS))
+    with open(run_dir / bp.STEP_VERIFICATION, "w", encoding="utf-8") as f:
+        json.dump(verification, f, indent=2)
+    with open(run_dir / bp.ADAPTIVE_REPORT, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Denser frame sampling around steps left missing by verification")
+    cli.add_argument("run_dir", type=Path, nargs="?", default=Path("."))
+    args = cli.parse_args()
+
+    import detective
+    import ocr
+    report = refine_run(args.run_dir, functools.lru_cache(maxsize=1)(ocr.load_ocr_model), detective.load_llm,
+                        ocr.open_ocr_store())
+    print(f"✅ Missing steps: {report['initially_missing']} → {report['still_missing']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,59 @@
+import argparse
+import asyncio
 import json
+from pathlib import Path
 from bs4 import BeautifulSoup
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 import os
 
+import batch_jobs
+from llm_client import AsyncLLMClient
+from prompt_compaction import TokenCounter, compact_to_budget
+from response_cache import ResponseCache
+
 # ---------- Config ---------- #
 endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
 deployment = "gpt-4o"
 subscription_key = os.getenv("AZURE_API_KEY")
 api_version = "2024-12-01-preview"
 
-# Initialize client
-client = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
+# Concurrent mode limits (python azure_gpt.py <run_dir> [<run_dir> ...])
+MAX_CONCURRENCY = int(os.getenv("AZURE_MAX_CONCURRENCY", "8"))
+RPM_LIMIT = int(os.getenv("AZURE_RPM_LIMIT", "0")) or None
+TPM_LIMIT = int(os.getenv("AZURE_TPM_LIMIT", "0")) or None
+MAX_RETRIES = int(os.getenv("AZURE_MAX_RETRIES", "6"))
+
+# Offline batch-job mode (OpenAI batch JSONL instead of synchronous calls)
+BATCH_REQUESTS = Path("output/batch/requests.jsonl")
+
+# Prompt compaction (dedup OCR evidence, enforce an input token budget)
+PROMPT_COMPACTION = os.getenv("PROMPT_COMPACTION", "1") == "1"
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "12000"))
+
+# Response cache (LLM_CACHE_MODE=on|off|strict, LLM_CACHE_DIR, LLM_CACHE_TTL_S, LLM_CACHE_MAX_BYTES)
+response_cache = ResponseCache()
+CACHE_SCOPE = {"deployment": deployment, "api_version": api_version}
+
+# Paths relative to a run directory
+VIDEO_REPORT = Path("output/comparison/llm_verification_report.json")
+TEST_REPORT = Path("logs/test_result.html")
+DEVIATION_DIR = Path("output/deviation_report")
+
+SYSTEM_PROMPT = (
+    "You are an expert in test validation. Analyze agent logs, plan expectations, video evidence, and test report to determine step alignment. "
+    "Use the provided decision tree and return only in valid JSON in the expected format only."
 )
 
 # ---------- Load Inputs ---------- #
 
-with open('output/comparison/llm_verification_report.json', 'r') as f:
-    video_data = json.load(f)
+def load_inputs(run_dir: Path):
+    with open(run_dir / VIDEO_REPORT, 'r') as f:
+        video_data = json.load(f)
 
-with open('logs/test_result.html', 'r', encoding='utf-8') as f:
-    soup = BeautifulSoup(f, 'html.parser')
+    with open(run_dir / TEST_REPORT, 'r', encoding='utf-8') as f:
+        soup = BeautifulSoup(f, 'html.parser')
+
+    return video_data, soup
 
 # ---------- Parse Agent Report ---------- #
 
@@ -39,14 +70,25 @@ def extract_test_outcome(soup):
                 outcome[key] = val
     return outcome
 
-agent_report = extract_test_outcome(soup)
-
 # ---------- Build Prompt for LLM ---------- #
 
 def build_llm_prompt(video_data, agent_report):
     matched = video_data.get("matched", [])
     missing = video_data.get("missing", [])
-    
+    evidence = video_data.get("evidence")
+
+    evidence_block = ""
+    if evidence:
+        evidence_lines = "\n".join(
+            f"{evidence_id} [{', '.join(item['frames'])}]: {item.get('snippet', '')}"
+            for evidence_id, item in evidence.items()
+        )
+        evidence_block = f"""
+Frame Evidence (OCR snippets, referenced by "evidence_ids" in Matched Steps):
+Text common to most screens: {video_data.get("common_screen_text", "")}
+{evidence_lines}
+"""
+
     return f"""
 You are an expert in test validation. Analyze if the agent’s behavior aligns with the video evidence and final test output.
 
@@ -70,7 +112,7 @@ Matched Steps:
 
 Missing Steps:
 {json.dumps(missing, indent=2)}
-
+{evidence_block}
 Return ONLY in this JSON format:
 {{
   "steps_aligned": [...matched step IDs...],
@@ -90,31 +132,39 @@ Return ONLY in this JSON format:
 Respond ONLY in valid JSON.
 """
 
-# ---------- Call Azure OpenAI ---------- #
+def prepare_prompt(video_data, agent_report, run_dir: Path = Path(".")) -> str:
+    if not PROMPT_COMPACTION:
+        return build_llm_prompt(video_data, agent_report)
 
-def call_llm(prompt: str) -> dict:
-    response = client.chat.completions.create(
-        model=deployment,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are an expert in test validation. Analyze agent logs, plan expectations, video evidence, and test report to determine step alignment. "
-                    "Use the provided decision tree and return only in valid JSON in the expected format only."
-                )
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        max_tokens=2048,
-        temperature=0,
+    prompt, stats = compact_to_budget(
+        video_data,
+        lambda data: build_llm_prompt(data, agent_report),
+        TokenCounter(deployment),
+        PROMPT_TOKEN_BUDGET,
     )
-    content = response.choices[0].message.content
-    print("Raw LLM response content:")
-    print(content)
+    print(f"✂️ [{run_dir}] Prompt tokens {stats['original_tokens']} → {stats['compacted_tokens']} "
+          f"(saved {stats['saved_pct']}%, budget {stats['token_budget']})")
+
+    (run_dir / DEVIATION_DIR).mkdir(parents=True, exist_ok=True)
+    with open(run_dir / DEVIATION_DIR / 'prompt_stats.json', 'w') as f:
+        json.dump(stats, f, indent=2)
+    return prompt
+
+def build_messages(prompt: str) -> list:
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
 
+# ---------- Call Azure OpenAI ---------- #
+
+def parse_llm_content(content: str, run_dir: Path = Path(".")) -> dict:
     if content.startswith("```"):
         lines = content.splitlines()
         if lines[0].startswith("```"):
@@ -122,24 +172,165 @@ def call_llm(prompt: str) -> dict:
         if lines and lines[-1].strip() == "```":
             lines = lines[:-1]
         content = "\n".join(lines).strip()
-    
+
     try:
         return json.loads(content)
     except json.JSONDecodeError as e:
         print(f"JSON parsing error: {e}")
-        with open('output/deviation_report/llm_raw_response.txt', 'w') as f:
+        (run_dir / DEVIATION_DIR).mkdir(parents=True, exist_ok=True)
+        with open(run_dir / DEVIATION_DIR / 'llm_raw_response.txt', 'w') as f:
             f.write(content)
         raise
 
+def call_llm(prompt: str, run_dir: Path = Path(".")) -> dict:
+    params = {
+        "model": deployment,
+        "messages": build_messages(prompt),
+        "max_tokens": 2048,
+        "temperature": 0,
+    }
+
+    def create():
+        client = AzureOpenAI(
+            api_version=api_version,
+            azure_endpoint=endpoint,
+            api_key=subscription_key,
+        )
+        response = client.chat.completions.create(**params)
+        return response.choices[0].message.content
+
+    # Unparseable replies are not cached, so a rerun asks again instead of failing on the same entry
+    content = response_cache.get_or_call({**CACHE_SCOPE, **params}, create,
+                                         validate=lambda c: parse_llm_content(c, run_dir))
+    print("Raw LLM response content:")
+    print(content)
+
+    return parse_llm_content(content, run_dir)
+
+# ---------- Save Result ---------- #
+
+def save_report(alignment_report: dict, run_dir: Path = Path(".")):
+    (run_dir / DEVIATION_DIR).mkdir(parents=True, exist_ok=True)
+    with open(run_dir / DEVIATION_DIR / 'final_alignment_report.json', 'w') as f:
+        json.dump(alignment_report, f, indent=2)
+
+# ---------- Concurrent Mode (async, many runs) ---------- #
+
+async def analyze_run_async(llm: AsyncLLMClient, run_dir: Path) -> dict:
+    video_data, soup = load_inputs(run_dir)
+    prompt = prepare_prompt(video_data, extract_test_outcome(soup), run_dir)
+    content = await llm.chat(build_messages(prompt), label=str(run_dir), max_tokens=2048, temperature=0,
+                             validate=lambda c: parse_llm_content(c, run_dir))
+    alignment_report = parse_llm_content(content, run_dir)
+    save_report(alignment_report, run_dir)
+    return alignment_report
+
+async def analyze_runs(run_dirs: list) -> dict:
+    client = AsyncAzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=subscription_key,
+        max_retries=0,  # retries are handled by AsyncLLMClient
+    )
+    llm = AsyncLLMClient(
+        client,
+        deployment,
+        max_concurrency=MAX_CONCURRENCY,
+        rpm_limit=RPM_LIMIT,
+        tpm_limit=TPM_LIMIT,
+        max_retries=MAX_RETRIES,
+        cache=response_cache,
+        cache_scope=CACHE_SCOPE,
+    )
+    results = await asyncio.gather(
+        *(analyze_run_async(llm, Path(run_dir)) for run_dir in run_dirs),
+        return_exceptions=True,
+    )
+    await client.close()
+
+    for run_dir, result in zip(run_dirs, results):
+        if isinstance(result, Exception):
+            print(f"❌ {run_dir}: {type(result).__name__}: {result}")
+        else:
+            print(f"✅ {run_dir}: {result.get('overall_alignment_status')}")
+    return llm.summary()
+
+# ---------- Offline Batch-job Mode ---------- #
+
+def emit_batch(run_dirs: list, requests_path: Path = BATCH_REQUESTS):
+    """Write one deviation-analysis request per run instead of calling the API."""
+    requests, contexts = [], {}
+    for idx, run_dir in enumerate(run_dirs):
+        run_dir = Path(run_dir)
+        video_data, soup = load_inputs(run_dir)
+        prompt = prepare_prompt(video_data, extract_test_outcome(soup), run_dir)
+        custom_id = f"deviation-{idx}"
+        requests.append(batch_jobs.build_request(
+            custom_id, deployment, build_messages(prompt), max_tokens=2048, temperature=0
+        ))
+        contexts[custom_id] = {"run_dir": str(run_dir)}
+    batch_jobs.write_batch(requests, contexts, requests_path)
+
+def ingest_batch(results_path: Path, requests_path: Path = BATCH_REQUESTS):
+    """Finish report generation for every run from a batch results file."""
+    contexts = batch_jobs.load_manifest(requests_path)
+    results = batch_jobs.read_results(results_path)
+    for custom_id, context in contexts.items():
+        run_dir = Path(context["run_dir"])
+        result = results.get(custom_id)
+        if result is None:
+            print(f"⚠️ {run_dir}: no result for {custom_id}")
+            continue
+        if "error" in result:
+            print(f"❌ {run_dir}: {result['error']}")
+            continue
+        try:
+            save_report(parse_llm_content(result["content"], run_dir), run_dir)
+        except json.JSONDecodeError:
+            continue
+        print(f"✅ {run_dir}: final_alignment_report.json written")
+
 # ---------- Run Pipeline ---------- #
 
-prompt = build_llm_prompt(video_data, agent_report)
-alignment_report = call_llm(prompt)
+def main():
+    parser = argparse.ArgumentParser(description="Deviation analysis via Azure GPT-4o")
+    parser.add_argument("run_dirs", nargs="*", help="Run directories (default: current directory, single synchronous run)")
+    # Always takes a value: with an optional one, "--emit-batch run1 run2" would swallow run1 as the path
+    parser.add_argument("--emit-batch", type=Path, metavar="REQUESTS_JSONL",
+                        help=f"Write batch requests for the run directories instead of calling the API (e.g. {BATCH_REQUESTS})")
+    parser.add_argument("--ingest-batch", type=Path, metavar="RESULTS_JSONL",
+                        help="Write final reports from a batch results file")
+    parser.add_argument("--batch-requests", type=Path, default=BATCH_REQUESTS,
+                        help="Requests file (and manifest) the results belong to")
+    args = parser.parse_args()
+
+    if args.emit_batch:
+        emit_batch(args.run_dirs or ["."], args.emit_batch)
+        return
+    if args.ingest_batch:
+        ingest_batch(args.ingest_batch, args.batch_requests)
+        return
+
+    run_dirs = args.run_dirs
+    if run_dirs:
+        summary = asyncio.run(analyze_runs(run_dirs))
+        print("\n📊 LLM call metrics:")
+        print(json.dumps({k: v for k, v in summary.items() if k != "per_call"}, indent=2))
+        with open("llm_call_metrics.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        return
+
+    video_data, soup = load_inputs(Path("."))
+    agent_report = extract_test_outcome(soup)
+
+    prompt = prepare_prompt(video_data, agent_report)
+    alignment_report = call_llm(prompt)
+
+    print("\n✅ Final Alignment Report:")
+    print(json.dumps(alignment_report, indent=2))
 
-# ---------- Save/Print Result ---------- #
+    save_report(alignment_report)
 
-print("\n✅ Final Alignment Report:")
-print(json.dumps(alignment_report, indent=2))
 
-with open('output/deviation_report/final_alignment_report.json', 'w') as f:
-    json.dump(alignment_report, f, indent=2)
+if __name__ == "__main__":
+    main()
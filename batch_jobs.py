@@ -0,0 +1,148 @@
+import argparse
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+# OpenAI / Azure OpenAI batch file format:
+#   request line: {"custom_id", "method": "POST", "url": "/chat/completions", "body": {...}}
+#   result line:  {"id", "custom_id", "response": {"status_code", "request_id", "body": {...}}, "error"}
+# Every requests file has a sidecar <name>.manifest.json mapping custom_id -> context needed to
+# finish the work (run directory, output paths) once results come back.
+
+BATCH_URL = "/chat/completions"
+
+
+def manifest_path(requests_path: Path) -> Path:
+    return requests_path.with_suffix(".manifest.json")
+
+
+# ---------- Emit ---------- #
+
+def build_request(custom_id: str, model: str, messages: List[Dict], **params) -> Dict:
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_URL,
+        "body": {"model": model, "messages": messages, **params},
+    }
+
+
+def write_batch(requests: List[Dict], contexts: Dict[str, Dict], requests_path: Path):
+    requests_path = Path(requests_path)
+    requests_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(requests_path, "w", encoding="utf-8") as f:
+        for request in requests:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+    with open(manifest_path(requests_path), "w", encoding="utf-8") as f:
+        json.dump(contexts, f, indent=2)
+    print(f"📦 Wrote {len(requests)} batch requests to {requests_path}")
+
+
+# ---------- Ingest ---------- #
+
+def read_results(results_path: Path) -> Dict[str, Dict]:
+    """Return custom_id -> {"content": str} or {"error": str} for every line of a results file."""
+    results = {}
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if item.get("error") or response.get("status_code", 200) != 200:
+                results[item["custom_id"]] = {"error": json.dumps(item.get("error") or body)}
+                continue
+            results[item["custom_id"]] = {
+                "content": body["choices"][0]["message"]["content"],
+                "usage": body.get("usage", {}),
+            }
+    return results
+
+
+def load_manifest(requests_path: Path) -> Dict[str, Dict]:
+    with open(manifest_path(Path(requests_path)), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# ---------- Submit (Azure OpenAI Batch API) ---------- #
+
+def submit_batch(client, requests_path: Path) -> str:
+    """Upload a requests file and start a 24h batch job. Returns the batch id."""
+    with open(requests_path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_URL,
+        completion_window="24h",
+    )
+    print(f"🚀 Submitted batch {batch.id} ({requests_path})")
+    return batch.id
+
+
+def download_results(client, batch_id: str, results_path: Path) -> bool:
+    """Fetch the output file of a finished batch. Returns False while the batch is still running."""
+    batch = client.batches.retrieve(batch_id)
+    print(f"⏳ Batch {batch_id}: {batch.status}")
+    if batch.status != "completed":
+        return False
+    Path(results_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(results_path).write_bytes(client.files.content(batch.output_file_id).read())
+    return True
+
+
+# ---------- Local Stand-in Processor ---------- #
+
+def process_locally(requests_path: Path, results_path: Path, base_url: str = None, api_key: str = "local"):
+    """
+    Produce a results file for a requests file without the batch service.
+    With `base_url` each request is sent to that OpenAI-compatible server (e.g. fake_openai_server.py),
+    otherwise a canned empty JSON object is returned for every request.
+    """
+    client = None
+    if base_url:
+        from openai import OpenAI
+        client = OpenAI(base_url=base_url, api_key=api_key)
+
+    Path(results_path).parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(requests_path, "r", encoding="utf-8") as src, open(results_path, "w", encoding="utf-8") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if client is not None:
+                body = client.chat.completions.create(**request["body"]).model_dump()
+            else:
+                body = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request["body"].get("model"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "{}"}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }
+            dst.write(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": body},
+                "error": None,
+            }) + "\n")
+            count += 1
+    print(f"✅ Processed {count} requests locally → {results_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI batch endpoint")
+    parser.add_argument("requests", type=Path, help="Batch requests JSONL")
+    parser.add_argument("results", type=Path, help="Where to write the results JSONL")
+    parser.add_argument("--base-url", help="Forward requests to this OpenAI-compatible server, e.g. http://127.0.0.1:8089/v1")
+    args = parser.parse_args()
+    process_locally(args.requests, args.results, args.base_url)
+
+
+if __name__ == "__main__":
+    main()
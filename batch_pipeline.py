@@ -0,0 +1,402 @@
+import argparse
+import importlib
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# Runs the whole Medusa Watcher pipeline over many test runs at once.
+#   python batch_pipeline.py manifest.jsonl --out runs/ --cpu-workers 8
+#
+# Manifest: a JSON list or JSONL file, one run per entry:
+#   {"run_id": "run_01", "log": ".../agent_inner_logs.json", "video": ".../video.webm", "report": ".../test_result.html"}
+#
+# Every run gets its own directory laid out like the single-run tree (logs/, media/, output/),
+# so stages never share output paths. CPU-bound stages (log parse, frame decode) run on a
+# process pool; model-bound stages (Qwen2-VL OCR, step verification LLM) each run on one
+# thread that loads its model once and serves every run in turn; the Azure deviation call
+# is last. Per-run progress lives in <run_dir>/status.json, so a rerun resumes after the
+# last finished stage.
+
+OUTPUT_ROOT = Path(os.getenv("BATCH_OUTPUT_ROOT", "output/batch_runs"))
+CPU_WORKERS = int(os.getenv("BATCH_CPU_WORKERS", str(os.cpu_count() or 4)))
+STAGE_RETRIES = int(os.getenv("BATCH_STAGE_RETRIES", "2"))
+# OCR straight from the recording through a shared-memory frame ring (ocr.ocr_video) instead of JPEGs
+# written by the frames stage. Screen segmentation reads the JPEGs, so they are still written when it is on.
+OCR_STREAM_FRAMES = os.getenv("OCR_STREAM_FRAMES", "0") == "1"
+
+STAGES = ["parse", "frames", "ocr", "detective", "refine", "postprocess", "deviation"]
+CPU_STAGES = ["parse", "frames"]
+
+# Per-run layout, relative to the run directory (mirrors the single-run paths)
+LOG_FILE = Path("logs/agent_inner_logs.json")
+TEST_REPORT = Path("logs/test_result.html")
+VIDEO_FILE = Path("media/video.webm")
+SUMMARY_JSON = Path("output/summary.json")
+CSV_REPORT = Path("output/report.csv")
+FRAMES_DIR = Path("output/frames")
+OCR_RESULTS = Path("output/ocr_caption_results.json")
+OCR_STATS = Path("output/ocr_stats.json")
+STEP_VERIFICATION = Path("output/comparison/step_verification_llm.json")
+VERIFICATION_REPORT = Path("output/comparison/llm_verification_report.json")
+ADAPTIVE_REPORT = Path("output/comparison/adaptive_sampling.json")
+SCREEN_SEGMENTS_JSON = Path("output/comparison/screen_segments.json")
+STATUS_FILE = "status.json"
+
+
+# ---------- Manifest & Run Directories ---------- #
+
+def load_manifest(path: Path) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    seen = set()
+    for idx, entry in enumerate(entries):
+        entry.setdefault("run_id", f"run_{idx:04d}")
+        if entry["run_id"] in seen:
+            raise ValueError(f"Duplicate run_id '{entry['run_id']}' in {path}")
+        seen.add(entry["run_id"])
+    return entries
+
+
+def _link(src: str, dst: Path):
+    if not src:
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.is_symlink() or dst.exists():
+        dst.unlink()
+    try:
+        dst.symlink_to(Path(src).resolve())
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def prepare_run_dir(entry: dict, output_root: Path) -> Path:
+    run_dir = output_root / entry["run_id"]
+    run_dir.mkdir(parents=True, exist_ok=True)
+    _link(entry.get("log"), run_dir / LOG_FILE)
+    _link(entry.get("report"), run_dir / TEST_REPORT)
+    _link(entry.get("video"), run_dir / VIDEO_FILE)
+    return run_dir
+
+
+class RunStatus:
+    """Per-run stage status persisted to <run_dir>/status.json after every change."""
+
+    def __init__(self, run_id: str, run_dir: Path):
+        self.run_id = run_id
+        self.path = run_dir / STATUS_FILE
+        self.lock = threading.Lock()
+        self.stages = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                stages = json.load(f).get("stages", {})
+            # Resume: keep finished stages, retry anything that failed or was interrupted
+            self.stages = {k: v for k, v in stages.items() if v.get("status") == "done"}
+
+    def done(self, stage: str) -> bool:
+        return self.stages.get(stage, {}).get("status") == "done"
+
+    @property
+    def failed(self) -> bool:
+        return any(s.get("status") == "failed" for s in self.stages.values())
+
+    def record(self, stage: str, status: str, attempts: int = 0, seconds: float = 0.0, error: str = None):
+        with self.lock:
+            self.stages[stage] = {"status": status, "attempts": attempts, "seconds": round(seconds, 2)}
+            if error:
+                self.stages[stage]["error"] = error
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"run_id": self.run_id, "stages": self.stages}, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+# ---------- Stages ---------- #
+# CPU stages are module-level functions of the run directory so the process pool can pickle them.
+
+def stage_parse(run_dir: Path):
+    import parser as log_parser
+    log_parser.write_outputs(
+        log_parser.parse_steps(log_parser.iter_log(run_dir / LOG_FILE)),
+        run_dir / SUMMARY_JSON,
+        run_dir / CSV_REPORT,
+    )
+
+
+def frame_interval_s() -> float:
+    import frames
+    from adaptive_sampling import ADAPTIVE_LADDER, ADAPTIVE_SAMPLING
+    return ADAPTIVE_LADDER[0] if ADAPTIVE_SAMPLING else frames.FRAME_INTERVAL_S
+
+
+def stage_frames(run_dir: Path, stream_ocr: bool = OCR_STREAM_FRAMES):
+    """`stream_ocr`: the ocr stage decodes the video itself, so JPEGs are only written if something else reads them."""
+    import frames
+    from screen_segments import SCREEN_SEGMENTS
+    if stream_ocr and not SCREEN_SEGMENTS:
+        return  # decoded by the ocr stage
+    if not frames.extract_frames_cached(str(run_dir / VIDEO_FILE), str(run_dir / FRAMES_DIR), frame_interval_s()):
+        raise RuntimeError(f"No frames decoded from {run_dir / VIDEO_FILE}")
+
+
+class SharedModels:
+    """Loads each model once, on first use, for all runs in the batch."""
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        # Held for all OCR work: the Qwen2-VL model and the OCR store are used by the ocr stage and by
+        # refine (on the detective thread), and neither tolerates concurrent use
+        self.ocr_lock = threading.Lock()
+
+    def get(self, name: str):
+        with self._lock:
+            if name not in self._models:
+                start = time.perf_counter()
+                if name == "ocr":
+                    self._models[name] = importlib.import_module("ocr").load_ocr_model()
+                elif name == "ocr_store":
+                    self._models[name] = importlib.import_module("ocr").open_ocr_store()
+                elif name == "detective":
+                    self._models[name] = importlib.import_module("detective").load_llm()
+                else:
+                    raise KeyError(name)
+                print(f"📦 Loaded {name} model in {time.perf_counter() - start:.1f}s")
+            return self._models[name]
+
+
+def stage_ocr(run_dir: Path, models: SharedModels):
+    import ocr
+    from video_cache import VideoCache
+    frames_dir = str(run_dir / FRAMES_DIR)
+    # The model is only loaded on a video cache miss
+    store = models.get("ocr_store")
+    # Under the lock, the store metrics diff covers this run's OCR only (not a concurrent refine)
+    with models.ocr_lock:
+        before = dict(store.metrics)
+        if OCR_STREAM_FRAMES:
+            results = ocr.ocr_video(*models.get("ocr"), str(run_dir / VIDEO_FILE), frame_interval_s(), store=store)
+            if not results:
+                raise RuntimeError(f"No frames decoded from {run_dir / VIDEO_FILE}")
+        else:
+            results = VideoCache().ocr(
+                frames_dir, ocr.OCR_SETTINGS, lambda: ocr.ocr_frames(*models.get("ocr"), frames_dir, store=store)
+            )
+        store_metrics = {k: store.metrics[k] - before[k] for k in store.metrics}
+    ocr.save_results(results, str(run_dir / OCR_RESULTS))
+    store_metrics["hit_rate"] = round(store_metrics["hits"] / store_metrics["lookups"], 3) if store_metrics["lookups"] else 0.0
+    skipped = [r["skipped"] for r in results if r.get("skipped")]
+    run_metrics = {
+        "frames": len(results),
+        "skipped_frames": len(skipped),
+        "skipped_by_reason": {reason: skipped.count(reason) for reason in sorted(set(skipped))},
+        "store": store_metrics,
+    }
+    with open(run_dir / OCR_STATS, "w", encoding="utf-8") as f:
+        json.dump(run_metrics, f, indent=2)
+
+
+def stage_detective(run_dir: Path, models: SharedModels):
+    import detective
+    with open(run_dir / SUMMARY_JSON, "r", encoding="utf-8") as f:
+        steps = json.load(f)
+    with open(run_dir / OCR_RESULTS, "r", encoding="utf-8") as f:
+        frames = json.load(f)
+    from screen_segments import SCREEN_SEGMENTS, save_segments, segment_frames
+    if SCREEN_SEGMENTS:
+        segmentation = segment_frames(run_dir / FRAMES_DIR, frames)
+        save_segments(segmentation, run_dir / SCREEN_SEGMENTS_JSON)
+        detective.verify_steps_by_segment(models.get("detective"), steps, frames, segmentation,
+                                          str(run_dir / STEP_VERIFICATION))
+    else:
+        detective.verify_steps(models.get("detective"), steps, frames, str(run_dir / STEP_VERIFICATION))
+
+
+def stage_refine(run_dir: Path, models: SharedModels):
+    """Coarse-to-fine pass for steps left missing; a no-op unless ADAPTIVE_SAMPLING=1."""
+    import adaptive_sampling
+    if adaptive_sampling.ADAPTIVE_SAMPLING:
+        adaptive_sampling.refine_run(
+            run_dir, lambda: models.get("ocr"), lambda: models.get("detective"), models.get("ocr_store"),
+            ocr_lock=models.ocr_lock,
+        )
+
+
+def stage_postprocess(run_dir: Path, models: SharedModels):
+    importlib.import_module("output-postprocessing").postprocess(
+        run_dir / STEP_VERIFICATION, run_dir / VERIFICATION_REPORT
+    )
+
+
+def stage_deviation(run_dir: Path, models: SharedModels):
+    import azure_gpt
+    video_data, soup = azure_gpt.load_inputs(run_dir)
+    prompt = azure_gpt.prepare_prompt(video_data, azure_gpt.extract_test_outcome(soup), run_dir)
+    azure_gpt.save_report(azure_gpt.call_llm(prompt, run_dir), run_dir)
+
+
+STAGE_FUNCS = {
+    "parse": stage_parse,
+    "frames": stage_frames,
+    "ocr": stage_ocr,
+    "detective": stage_detective,
+    "refine": stage_refine,
+    "postprocess": stage_postprocess,
+    "deviation": stage_deviation,
+}
+
+
+def run_with_retries(stage: str, run_dir: Path, retries: int, *args):
+    """Run one stage, retrying on any exception. Returns (ok, attempts, seconds, error)."""
+    start = time.perf_counter()
+    error = None
+    for attempt in range(1, retries + 2):
+        try:
+            STAGE_FUNCS[stage](Path(run_dir), *args)
+            return True, attempt, time.perf_counter() - start, None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            print(f"⚠️ {Path(run_dir).name} {stage} attempt {attempt} failed: {error}")
+            if attempt == retries + 1:
+                traceback.print_exc()
+    return False, retries + 1, time.perf_counter() - start, error
+
+
+# ---------- Driver ---------- #
+
+class BatchPipeline:
+    def __init__(self, entries: list, output_root: Path = OUTPUT_ROOT, cpu_workers: int = CPU_WORKERS,
+                 retries: int = STAGE_RETRIES, stages: list = None):
+        self.output_root = Path(output_root)
+        self.cpu_workers = cpu_workers
+        self.retries = retries
+        self.stages = [s for s in STAGES if s in (stages or STAGES)]
+        self.models = SharedModels()
+        self.runs = {}
+        for entry in entries:
+            run_dir = prepare_run_dir(entry, self.output_root)
+            self.runs[entry["run_id"]] = (run_dir, RunStatus(entry["run_id"], run_dir))
+        # Runs already finished by an earlier invocation don't count towards this one's throughput
+        self.already_done = {rid for rid, (_, s) in self.runs.items() if all(s.done(stage) for stage in self.stages)}
+
+    def _record(self, run_id: str, stage: str, ok: bool, attempts: int, seconds: float, error: str):
+        _, status = self.runs[run_id]
+        status.record(stage, "done" if ok else "failed", attempts, seconds, error)
+        icon = "✅" if ok else "❌"
+        print(f"{icon} {run_id} {stage} ({seconds:.1f}s, {attempts} attempt{'s' if attempts > 1 else ''})")
+
+    def _model_worker(self, stages: list, inbox: queue.Queue, outbox: queue.Queue):
+        """One thread per model-bound stage group; runs arrive in the order their inputs are ready."""
+        while True:
+            run_id = inbox.get()
+            if run_id is None:
+                outbox.put(None)
+                return
+            run_dir, status = self.runs[run_id]
+            for stage in stages:
+                if status.failed:
+                    break
+                if stage not in self.stages or status.done(stage):
+                    continue
+                status.record(stage, "running")
+                self._record(run_id, stage, *run_with_retries(stage, run_dir, self.retries, self.models))
+            outbox.put(run_id)
+
+    def run(self) -> dict:
+        start = time.perf_counter()
+
+        # ocr thread -> detective (+ adaptive refine) thread -> report thread (postprocess + Azure deviation call)
+        ocr_q, detective_q, report_q, done_q = (queue.Queue() for _ in range(4))
+        workers = [
+            threading.Thread(target=self._model_worker, args=(["ocr"], ocr_q, detective_q), daemon=True),
+            threading.Thread(target=self._model_worker, args=(["detective", "refine"], detective_q, report_q), daemon=True),
+            threading.Thread(target=self._model_worker, args=(["postprocess", "deviation"], report_q, done_q), daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        with ProcessPoolExecutor(max_workers=self.cpu_workers) as pool:
+            futures, pending = {}, {}
+            for run_id, (run_dir, status) in self.runs.items():
+                todo = [s for s in CPU_STAGES if s in self.stages and not status.done(s)]
+                pending[run_id] = len(todo)
+                for stage in todo:
+                    status.record(stage, "running")
+                    futures[pool.submit(run_with_retries, stage, str(run_dir), self.retries)] = (run_id, stage)
+                if not todo:
+                    ocr_q.put(run_id)
+
+            for future in as_completed(futures):
+                run_id, stage = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:  # worker process died
+                    result = (False, 0, 0.0, f"{type(e).__name__}: {e}")
+                self._record(run_id, stage, *result)
+                pending[run_id] -= 1
+                if pending[run_id] == 0:
+                    ocr_q.put(run_id)
+
+        ocr_q.put(None)
+        while done_q.get() is not None:
+            pass
+
+        return self.summarize(time.perf_counter() - start)
+
+    def summarize(self, elapsed: float) -> dict:
+        completed = [rid for rid, (_, s) in self.runs.items() if all(s.done(stage) for stage in self.stages)]
+        processed = [rid for rid in completed if rid not in self.already_done]
+        failed = [rid for rid, (_, s) in self.runs.items() if s.failed]
+        stage_seconds = {stage: 0.0 for stage in self.stages}
+        for _, status in self.runs.values():
+            for stage in self.stages:
+                stage_seconds[stage] += status.stages.get(stage, {}).get("seconds", 0.0)
+
+        skipped_frames = 0
+        for run_dir, _ in self.runs.values():
+            if (run_dir / OCR_STATS).exists():
+                with open(run_dir / OCR_STATS, "r", encoding="utf-8") as f:
+                    skipped_frames += json.load(f).get("skipped_frames", 0)
+
+        summary = {
+            "runs": len(self.runs),
+            "completed": len(completed),
+            "completed_this_invocation": len(processed),
+            "failed": failed,
+            "wall_seconds": round(elapsed, 2),
+            "runs_per_hour": round(len(processed) / elapsed * 3600, 2) if elapsed > 0 else 0.0,
+            "stage_seconds": {k: round(v, 2) for k, v in stage_seconds.items()},
+            "skipped_blank_frames": skipped_frames,
+        }
+        with open(self.output_root / "batch_summary.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"📊 {summary['completed']}/{summary['runs']} runs in {summary['wall_seconds']}s "
+              f"→ {summary['runs_per_hour']} runs/hour ({len(failed)} failed)")
+        return summary
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Run the Medusa Watcher pipeline over a manifest of test runs")
+    cli.add_argument("manifest", type=Path, help="JSON list or JSONL of {run_id, log, video, report}")
+    cli.add_argument("--out", type=Path, default=OUTPUT_ROOT, help="Root for per-run output directories")
+    cli.add_argument("--cpu-workers", type=int, default=CPU_WORKERS)
+    cli.add_argument("--retries", type=int, default=STAGE_RETRIES, help="Retries per stage before a run is marked failed")
+    cli.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Subset of stages to run")
+    args = cli.parse_args()
+
+    pipeline = BatchPipeline(load_manifest(args.manifest), args.out, args.cpu_workers, args.retries, args.stages)
+    pipeline.run()
+
+
+if __name__ == "__main__":
+    main()
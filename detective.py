@@ -4,18 +4,17 @@ import re
 import ast
 from transformers import pipeline, AutoModelForCausalLM, AutoTokenizer
 
-# --- Load LLM ---
 model_path = "local_path../model/qwen7b-instruct"
-tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
-model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True)
-llm = pipeline("text-generation", model=model, tokenizer=tokenizer)
+summary_path = "/data/shared/users/antara/rag/video/output/summary.json"
+frames_path = "/data/shared/users/antara/rag/video/output/ocr_caption_results.json"
+output_path = "/output/comparison/step_verification_llm.json"
 
-# --- Load Data ---
-with open("/data/shared/users/antara/rag/video/output/summary.json") as f:
-    steps = json.load(f)
 
-with open("/data/shared/users/antara/rag/video/output/ocr_caption_results.json") as f:
-    frames = json.load(f)
+# --- Load LLM ---
+def load_llm():
+    tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+    model = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True)
+    return pipeline("text-generation", model=model, tokenizer=tokenizer)
 
 # --- Prompt Template ---
 def build_prompt(step_no, frame_no, step_text, frame_text):
@@ -42,7 +41,7 @@ Respond in **JSON only** (no explanation outside JSON):
 """
 
 # --- Check Match Function ---
-def check_llm_match(step_no, frame_no, step_text, frame_text, debug_f):
+def check_llm_match(llm, step_no, frame_no, step_text, frame_text, debug_f):
     prompt = build_prompt(step_no, frame_no, step_text, frame_text)
     print(f"\n====================")
     print(f"🔎 Checking Step {step_no} with Frame {frame_no}")
@@ -65,43 +64,147 @@ def check_llm_match(step_no, frame_no, step_text, frame_text, debug_f):
     except Exception as e:
         return False, f"Parsing failed: {str(e)}"
 
+# --- Literal Lookup ---
+def literal_entry(index, step_no, step, frames, debug_f):
+    """Verification entry from the UI literal index if every quoted literal is visible, else None."""
+    if index is None:
+        return None
+    refs = index.resolve(step["description"], [f["frame"] for f in frames])
+    if not refs:
+        return None
+    debug_f.write(f"\n=== Step {step_no}: resolved by literal index ===\n")
+    debug_f.write("\n".join(f"{r['frame_no']}: {r['reason']}" for r in refs) + "\n")
+    entry = verification_entry(step, step_no, [dict(r, step_no=step_no) for r in refs])
+    entry["resolved_by"] = "literal_index"
+    return entry
+
+
+def build_index(frames):
+    from ui_index import LITERAL_INDEX, UIIndex
+    return UIIndex(frames) if LITERAL_INDEX else None
+
+# --- Single Step ---
+def verify_step(llm, step_no, step, frames, debug_f, index=None):
+    entry = literal_entry(index, step_no, step, frames, debug_f)
+    if entry:
+        return entry
+
+    step_text = step["description"].strip()
+    matches = []
+
+    for frame in frames:
+        if frame.get("skipped"):
+            continue  # blank/loading frame tagged by the pre-OCR filter, nothing to match
+        frame_no = frame["frame"]
+        matched, reason = check_llm_match(llm, step_no, frame_no, step_text, frame["description"], debug_f)
+
+        if matched:
+            matches.append({
+                "step_no": step_no,
+                "frame_no": frame_no,
+                "description": frame["description"],
+                "reason": reason
+            })
+
+    return verification_entry(step, step_no, matches)
+
+
+def verification_entry(step, step_no, matches):
+    return {
+        "step_id": step["step_id"],
+        "step_no": step_no,
+        "description": step["description"].strip(),
+        "status": "matched" if matches else "missing",
+        "matched_frames": [m["frame_no"] for m in matches],
+        "matched_descriptions": [m["description"] for m in matches],
+        "reasons": [m["reason"] for m in matches],
+        "frame_refs": matches
+    }
+
+# --- Segment-level Verification ---
+def verify_steps_by_segment(llm, steps, frames, segmentation, output_path, start_no=1):
+    """
+    Same output as verify_steps, but each step is checked against one representative frame per screen
+    segment (see screen_segments.py). Member frames are only checked when no representative matched,
+    and only for segments that are not cohesive or that share most words with the step.
+    """
+    from screen_segments import expansion_candidates
+
+    debug_log_path = output_path.replace(".json", "_debug.txt")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    by_name = {frame["frame"]: frame for frame in frames}
+    segments = segmentation["segments"]
+    representatives = [by_name[seg["representative"]] for seg in segments]
+    index = build_index(frames)
+    calls = 0
+
+    verification = []
+    with open(debug_log_path, "w") as debug_f:
+        for idx, step in enumerate(steps, start=start_no):
+            # Quoted literals are looked up over all frames, not just the representatives
+            entry = literal_entry(index, idx, step, frames, debug_f)
+            if entry is None:
+                entry = verify_step(llm, idx, step, representatives, debug_f)
+                calls += len(representatives)
+            matched_segments = [seg for seg in segments if set(seg["frames"]) & set(entry["matched_frames"])]
+
+            if not matched_segments:
+                for seg in expansion_candidates(step["description"], segments):
+                    members = [by_name[name] for name in seg["frames"] if name != seg["representative"]]
+                    member_entry = verify_step(llm, idx, step, members, debug_f)
+                    calls += len(members)
+                    if member_entry["status"] == "matched":
+                        entry = verification_entry(step, idx, entry["frame_refs"] + member_entry["frame_refs"])
+                        matched_segments.append(seg)
+
+            entry["matched_segments"] = [
+                {"segment_id": seg["segment_id"], "screen_id": seg["screen_id"],
+                 "start_s": seg["start_s"], "end_s": seg["end_s"]}
+                for seg in matched_segments
+            ]
+            verification.append(entry)
+
+    with open(output_path, "w") as f:
+        json.dump(verification, f, indent=2)
+
+    usable = sum(1 for frame in frames if not frame.get("skipped"))
+    print(f"\n✅ Step verification report saved to: {output_path}")
+    print(f"📊 {calls} LLM checks over {len(segments)} segments (per-frame would be {usable * len(steps)})")
+    return verification
+
 # --- Verification Pipeline ---
-output_path = "/output/comparison/step_verification_llm.json"
-debug_log_path = output_path.replace(".json", "_debug.txt")
-os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-verification = []
-with open(debug_log_path, "w") as debug_f:
-    for idx, step in enumerate(steps, start=1):
-        step_text = step["description"].strip()
-        matches = []
-
-        for frame in frames:
-            frame_no = frame["frame"]
-            matched, reason = check_llm_match(idx, frame_no, step_text, frame["description"], debug_f)
-
-            if matched:
-                matches.append({
-                    "step_no": idx,
-                    "frame_no": frame_no,
-                    "description": frame["description"],
-                    "reason": reason
-                })
-
-        verification.append({
-            "step_id": step["step_id"],
-            "step_no": idx,
-            "description": step_text, 
-            "status": "matched" if matches else "missing",
-            "matched_frames": [m["frame_no"] for m in matches],
-            "matched_descriptions": [m["description"] for m in matches],
-            "reasons": [m["reason"] for m in matches],
-            "frame_refs": matches
-        })
-
-# --- Save Output ---
-with open(output_path, "w") as f:
-    json.dump(verification, f, indent=2)
-
-print(f"\n✅ Step verification report saved to: {output_path}")
-print(f"🪵 Debug log saved to: {debug_log_path}")
+def verify_steps(llm, steps, frames, output_path, start_no=1):
+    debug_log_path = output_path.replace(".json", "_debug.txt")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    index = build_index(frames)
+    verification = []
+    with open(debug_log_path, "w") as debug_f:
+        for idx, step in enumerate(steps, start=start_no):
+            verification.append(verify_step(llm, idx, step, frames, debug_f, index))
+
+    # --- Save Output ---
+    with open(output_path, "w") as f:
+        json.dump(verification, f, indent=2)
+
+    print(f"\n✅ Step verification report saved to: {output_path}")
+    print(f"🪵 Debug log saved to: {debug_log_path}")
+    return verification
+
+
+if __name__ == "__main__":
+    # --- Load Data ---
+    with open(summary_path) as f:
+        steps = json.load(f)
+
+    with open(frames_path) as f:
+        frames = json.load(f)
+
+    from screen_segments import SCREEN_SEGMENTS, save_segments, segment_frames
+    if SCREEN_SEGMENTS:
+        # frames_path sits next to the frames/ directory it was produced from
+        segmentation = segment_frames(os.path.join(os.path.dirname(frames_path), "frames"), frames)
+        save_segments(segmentation, os.path.join(os.path.dirname(output_path), "screen_segments.json"))
+        verify_steps_by_segment(load_llm(), steps, frames, segmentation, output_path)
+    else:
+        verify_steps(load_llm(), steps, frames, output_path)
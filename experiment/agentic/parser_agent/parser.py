@@ -1,17 +1,28 @@
+import argparse
 import json
+import os
+import sys
 from pathlib import Path
 from typing import List, Dict, Any
 from openai import AzureOpenAI
 
+sys.path.append(str(Path(__file__).resolve().parents[3]))  # repo root, for the shared response cache and batch format
+import batch_jobs
+from response_cache import ResponseCache
+
 # Azure OpenAI config
+API_VERSION = "2024-12-01-preview"
 client = AzureOpenAI(
-    api_version="2024-12-01-preview",
-    azure_endpoint="",
-    api_key="",
+    api_version=API_VERSION,
+    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+    api_key=os.getenv("AZURE_API_KEY", ""),
 )
 
 SUMMARY_PATH = Path("/data/shared/users/antara/rag/agentic/output/summary.json")
 REFLECTION_PATH = Path("/data/shared/users/antara/rag/agentic/output/plan_review.txt")
+response_cache = ResponseCache()
+
+BATCH_REQUESTS = Path("/data/shared/users/antara/rag/agentic/output/batch/requests.jsonl")
 
 
 class PlannerAgent:
@@ -85,7 +96,8 @@ class PlannerAgent:
             }
         return {}
 
-    def reflect_on_plan(self, steps: List[Dict[str, Any]]) -> str:
+    @staticmethod
+    def build_reflection_messages(steps: List[Dict[str, Any]]) -> List[Dict[str, str]]:
         plan_text = "\n".join(
             [f"{step['step_id']}. {step['description']}" for step in steps if step.get("description")]
         )
@@ -103,16 +115,24 @@ Please reflect on this plan and answer:
 Return your thoughts followed by a revised step list if needed.
 """
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an expert in validating AI reasoning and plans."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3
-        )
+        return [
+            {"role": "system", "content": "You are an expert in validating AI reasoning and plans."},
+            {"role": "user", "content": prompt}
+        ]
 
-        return response.choices[0].message.content.strip()
+    def reflect_on_plan(self, steps: List[Dict[str, Any]]) -> str:
+        params = {
+            "model": "gpt-4o",
+            "messages": self.build_reflection_messages(steps),
+            "temperature": 0.3
+        }
+
+        def create():
+            response = client.chat.completions.create(**params)
+            return response.choices[0].message.content
+
+        content = response_cache.get_or_call({"deployment": "gpt-4o", "api_version": API_VERSION, **params}, create)
+        return content.strip()
 
     def revise_steps_if_suggested(self, original_steps: List[Dict[str, Any]], reflection: str) -> List[Dict[str, Any]]:
         if "Revised Step List" in reflection or "Revised Plan" in reflection:
@@ -160,6 +180,19 @@ Return your thoughts followed by a revised step list if needed.
 
 # ---- Callable interface ----
 
+def finish_planner_run(agent: PlannerAgent, steps, reflection: str, output_file, reflection_output):
+    agent.save_reflection(reflection, Path(reflection_output))
+    print("\n🧠 Plan Reflection:\n" + reflection + "\n")
+
+    # ✨ Auto-revise if needed
+    revised_steps = agent.revise_steps_if_suggested(steps, reflection)
+    agent.save_summary(revised_steps, Path(output_file))
+
+    print(f"✅ Final step list saved to {output_file}")
+    print(f"📝 Reflection saved to {reflection_output}")
+    return revised_steps
+
+
 def run_planner_agent(input_file="/data/shared/users/antara/rag/agentic/logs/agent_inner_logs.json",
                       output_file="/data/shared/users/antara/rag/agentic/output/summary.json",
                       reflection_output="/data/shared/users/antara/rag/agentic/output/plan_review.txt"):
@@ -169,17 +202,57 @@ def run_planner_agent(input_file="/data/shared/users/antara/rag/agentic/logs/age
 
     # 🔍 Reflect
     reflection = agent.reflect_on_plan(steps)
-    agent.save_reflection(reflection, Path(reflection_output))
-    print("\n🧠 Plan Reflection:\n" + reflection + "\n")
+    return finish_planner_run(agent, steps, reflection, output_file, reflection_output)
 
-    # ✨ Auto-revise if needed
-    revised_steps = agent.revise_steps_if_suggested(steps, reflection)
-    agent.save_summary(revised_steps, Path(output_file))
 
-    print(f"✅ Final step list saved to {output_file}")
-    print(f"📝 Reflection saved to {reflection_output}")
-    return revised_steps
+# ---- Offline batch-job interface ----
+# Requests use the OpenAI batch JSONL format; <requests>.manifest.json maps custom_id -> run paths.
+# batch_jobs.py at the repo root can stand in for the batch service when testing.
+
+def emit_reflection_batch(input_files: List[str], requests_path: Path = BATCH_REQUESTS):
+    requests, contexts = [], {}
+    for idx, input_file in enumerate(input_files):
+        run_dir = Path(input_file).parent.parent
+        custom_id = f"reflection-{idx}"
+        agent = PlannerAgent(Path(input_file))
+        requests.append(batch_jobs.build_request(
+            custom_id, "gpt-4o", agent.build_reflection_messages(agent.parse_steps()), temperature=0.3
+        ))
+        contexts[custom_id] = {
+            "input_file": str(input_file),
+            "output_file": str(run_dir / "output" / "summary.json"),
+            "reflection_output": str(run_dir / "output" / "plan_review.txt")
+        }
+    batch_jobs.write_batch(requests, contexts, requests_path)
+
+
+def ingest_reflection_batch(results_path: Path, requests_path: Path = BATCH_REQUESTS):
+    contexts = batch_jobs.load_manifest(requests_path)
+    results = batch_jobs.read_results(results_path)
+
+    for custom_id, context in contexts.items():
+        result = results.get(custom_id)
+        if result is None or "error" in result:
+            print(f"❌ {context['input_file']}: no successful result for {custom_id}")
+            continue
+
+        reflection = result["content"].strip()
+        agent = PlannerAgent(Path(context["input_file"]))
+        finish_planner_run(agent, agent.parse_steps(), reflection, context["output_file"], context["reflection_output"])
 
 
 if __name__ == "__main__":
-    run_planner_agent()
+    cli = argparse.ArgumentParser(description="Planner log parser with plan reflection")
+    cli.add_argument("--emit-batch", nargs="+", metavar="AGENT_LOG",
+                     help="Write reflection requests for these <run>/logs/agent_inner_logs.json files")
+    cli.add_argument("--ingest-batch", type=Path, metavar="RESULTS_JSONL",
+                     help="Finish runs from a batch results file")
+    cli.add_argument("--batch-requests", type=Path, default=BATCH_REQUESTS)
+    args = cli.parse_args()
+
+    if args.emit_batch:
+        emit_reflection_batch(args.emit_batch, args.batch_requests)
+    elif args.ingest_batch:
+        ingest_reflection_batch(args.ingest_batch, args.batch_requests)
+    else:
+        run_planner_agent()
@@ -1,24 +1,39 @@
 import os
 import json
 import re
+import sys
+from collections import OrderedDict
 from pathlib import Path
 from PIL import Image
 import torch
 from transformers import Qwen2VLForConditionalGeneration, AutoProcessor
 from qwen_vl_utils import process_vision_info
 
+sys.path.append(str(Path(__file__).resolve().parents[3]))  # repo root, for the shared frame prefetcher
+from frame_prefetch import CopyPool, FramePrefetcher
+
 # ==== Setup Paths ====
 summary_path = "/data/shared/users/antara/rag/video/output/summary.json"
 input_verification_path = "/data/shared/users/antara/rag/video/output/comparison/step_verification_llm.json"
 frame_folder = "/data/shared/users/antara/rag/video/output/frames"
 output_path = "/data/shared/users/antara/rag/agentic/output/video_agent/visual_verification_report.json"
 
+# ==== Frame-major Settings ====
+# Encode every frame once and ask all of its candidate steps in one batched generate call.
+FRAME_MAJOR = os.getenv("FRAME_MAJOR", "1") == "1"
+VISION_CACHE_MAX_BYTES = int(os.getenv("VISION_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+STEP_BATCH_SIZE = int(os.getenv("STEP_BATCH_SIZE", "8"))
+# Re-check the first N frames with the per-pair verifier and report any disagreement
+PARITY_CHECK_FRAMES = int(os.getenv("PARITY_CHECK_FRAMES", "0"))
+
 # ==== Load Qwen2-VL ====
 device = "cuda" if torch.cuda.is_available() else "cpu"
 model = Qwen2VLForConditionalGeneration.from_pretrained(
     "Qwen/Qwen2-VL-7B-Instruct", torch_dtype=torch.bfloat16, device_map=device
 )
 processor = AutoProcessor.from_pretrained("Qwen/Qwen2-VL-7B-Instruct")
+# Prefetch threads tokenize on private copies; the shared fast tokenizer is not thread-safe
+loader_processors = CopyPool(processor)
 
 # ==== Load Data ====
 with open(summary_path) as f:
@@ -28,8 +43,8 @@ with open(input_verification_path) as f:
     verification_data = json.load(f)
 
 # ==== Helper: Qwen2-VL Visual Step Verifier ====
-def verify_step_with_frame(step_text, image: Image.Image) -> dict:
-    prompt = (
+def build_verifier_prompt(step_text) -> str:
+    return (
         f"You are a strict visual verifier.\n"
         f"Does this image clearly confirm that the following step was completed?\n\n"
         f"Step: {step_text}\n\n"
@@ -37,62 +52,281 @@ def verify_step_with_frame(step_text, image: Image.Image) -> dict:
         f"Reply in JSON like: {{\"match\": true/false, \"reason\": \"...\"}}"
     )
 
+
+def parse_verifier_response(response: str) -> dict:
+    try:
+        match = re.search(r'\{.*?\}', response, flags=re.DOTALL)
+        parsed = json.loads(match.group(0)) if match else {}
+        return parsed
+    except:
+        return {"match": False, "reason": "Failed to parse model response"}
+
+
+def prepare_verifier_inputs(step_text, image: Image.Image, processor=processor):
+    """CPU half of verify_step_with_frame (chat template, image resize, tensors); threads pass a private processor."""
     messages = [
         {
             "role": "user",
             "content": [
                 {"type": "image", "image": image},
-                {"type": "text", "text": prompt},
+                {"type": "text", "text": build_verifier_prompt(step_text)},
             ]
         }
     ]
 
     text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
     image_inputs, _ = process_vision_info(messages)
-    inputs = processor(text=[text], images=image_inputs, return_tensors="pt").to(device)
+    return processor(text=[text], images=image_inputs, return_tensors="pt")
+
+
+def verify_step_with_frame(step_text, image: Image.Image, inputs=None) -> dict:
+    inputs = (inputs if inputs is not None else prepare_verifier_inputs(step_text, image)).to(device)
 
     with torch.no_grad():
         output_ids = model.generate(**inputs, max_new_tokens=256)
         response = processor.batch_decode(output_ids[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)[0]
 
+    return parse_verifier_response(response)
+
+
+# ==== Helper: Frame-major Verifier (cached vision encoder outputs) ====
+class VisionEmbeddingCache:
+    """In-memory LRU of vision tower outputs, bounded by total tensor bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self._entries
+
+    @staticmethod
+    def _nbytes(entry) -> int:
+        return sum(t.numel() * t.element_size() for t in entry)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        size = self._nbytes(entry)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.current_bytes -= self._nbytes(self._entries.pop(key))
+        while self._entries and self.current_bytes + size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= self._nbytes(evicted)
+        self._entries[key] = entry
+        self.current_bytes += size
+
+
+vision_cache = VisionEmbeddingCache(VISION_CACHE_MAX_BYTES)
+
+
+def preprocess_frame(frame_path):
+    """Decode and run the image processor on CPU; returns pixel_values and image_grid_thw tensors."""
+    image = Image.open(frame_path)
+    messages = [{"role": "user", "content": [{"type": "image", "image": image}]}]
+    image_inputs, _ = process_vision_info(messages)
+    return processor.image_processor(images=image_inputs, return_tensors="pt")
+
+
+def encode_frame(frame_path, vision_inputs=None):
+    """Run the image processor and Qwen2-VL vision tower once per frame (LRU cached)."""
+    cached = vision_cache.get(frame_path)
+    if cached is not None:
+        return cached
+
+    if vision_inputs is None:
+        vision_inputs = preprocess_frame(frame_path)
+    pixel_values = vision_inputs["pixel_values"].to(device)
+    image_grid_thw = vision_inputs["image_grid_thw"].to(device)
+
+    with torch.no_grad():
+        image_embeds = model.visual(pixel_values.type(model.visual.dtype), grid_thw=image_grid_thw)
+
+    entry = (image_embeds, image_grid_thw)
+    vision_cache.put(frame_path, entry)
+    return entry
+
+
+def verify_steps_with_frame(step_texts, frame_path, vision_inputs=None) -> list:
+    """Ask every candidate step for one frame as batched continuations of the cached image."""
+    image_embeds, image_grid_thw = encode_frame(frame_path, vision_inputs)
+    merge_length = processor.image_processor.merge_size ** 2
+    num_image_tokens = int(image_grid_thw[0].prod()) // merge_length
+
+    texts = []
+    for step_text in step_texts:
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "image"},
+                    {"type": "text", "text": build_verifier_prompt(step_text)},
+                ]
+            }
+        ]
+        text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        texts.append(text.replace("<|image_pad|>", "<|image_pad|>" * num_image_tokens))
+
+    # Left padding keeps every prompt's last token in the final column; the shared tokenizer is restored
+    padding_side = processor.tokenizer.padding_side
+    processor.tokenizer.padding_side = "left"
     try:
-        match = re.search(r'\{.*?\}', response, flags=re.DOTALL)
-        parsed = json.loads(match.group(0)) if match else {}
-        return parsed
-    except:
-        return {"match": False, "reason": "Failed to parse model response"}
+        inputs = processor.tokenizer(texts, padding=True, return_tensors="pt").to(device)
+    finally:
+        processor.tokenizer.padding_side = padding_side
+    input_ids, attention_mask = inputs["input_ids"], inputs["attention_mask"]
+    batch_size = len(texts)
+    grid_thw = image_grid_thw.repeat(batch_size, 1)
+
+    with torch.no_grad():
+        inputs_embeds = model.get_input_embeddings()(input_ids)
+        image_mask = input_ids == model.config.image_token_id
+        inputs_embeds[image_mask] = image_embeds.repeat(batch_size, 1).to(inputs_embeds.dtype)
+
+        # 3-D M-RoPE positions for the image tokens, computed here rather than left to generate(), which
+        # rebuilds them from input_ids only in some transformers versions (others fall back to 1-D text
+        # positions when inputs_embeds is given). The prompt minus its last token is prefilled with these
+        # positions; generate() then decodes from that cache, offsetting later positions by rope_deltas.
+        position_ids, rope_deltas = model.get_rope_index(input_ids, grid_thw, None, attention_mask)
+        prefill = model(
+            inputs_embeds=inputs_embeds[:, :-1],
+            attention_mask=attention_mask[:, :-1],
+            position_ids=position_ids[..., :-1],
+            use_cache=True,
+        )
+        for owner in (model, getattr(model, "model", None)):
+            if hasattr(owner, "rope_deltas"):
+                owner.rope_deltas = rope_deltas
+
+        output_ids = model.generate(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=prefill.past_key_values,
+            rope_deltas=rope_deltas,
+            image_grid_thw=grid_thw,
+            max_new_tokens=256,
+        )
+        responses = processor.batch_decode(output_ids[:, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+
+    return [parse_verifier_response(response) for response in responses]
+
+
+def run_frame_major_verification(verification_data) -> dict:
+    """Invert step -> frame_refs into frame -> steps and verify each frame's steps together."""
+    steps_by_frame = OrderedDict()
+    for item in verification_data:
+        for frame_ref in item.get("frame_refs", []):
+            steps_by_frame.setdefault(frame_ref["frame_no"], []).append(item)
+
+    def load(frame_no):
+        # Frames already in the vision cache skip preprocessing; encode_frame will return the cached entry
+        frame_path = os.path.join(frame_folder, frame_no)
+        return None if frame_path in vision_cache else preprocess_frame(frame_path)
+
+    confirmed = {item["step_id"]: [] for item in verification_data}
+    parity = {"checked": 0, "mismatched": 0}
+    parity_frames = set()
+    present = [frame_no for frame_no in steps_by_frame if os.path.exists(os.path.join(frame_folder, frame_no))]
+    prefetcher = FramePrefetcher(present, load)
+    for frame_no, vision_inputs in prefetcher:
+        frame_path = os.path.join(frame_folder, frame_no)
+        items = steps_by_frame[frame_no]
+
+        for start in range(0, len(items), STEP_BATCH_SIZE):
+            batch = items[start:start + STEP_BATCH_SIZE]
+            results = verify_steps_with_frame([item["description"] for item in batch], frame_path, vision_inputs)
+
+            for item, result in zip(batch, results):
+                print(f"🧪 Step {item['step_id']} Frame {frame_no} → Match: {result.get('match')}")
+                if len(parity_frames) < PARITY_CHECK_FRAMES or frame_no in parity_frames:
+                    parity_frames.add(frame_no)
+                    reference = verify_step_with_frame(item["description"], Image.open(frame_path))
+                    parity["checked"] += 1
+                    if (reference.get("match") is True) != (result.get("match") is True):
+                        parity["mismatched"] += 1
+                        print(f"⚠️ Parity: step {item['step_id']} frame {frame_no} is {result.get('match')} "
+                              f"frame-major but {reference.get('match')} per pair")
+                if result.get("match") is True:
+                    confirmed[item["step_id"]].append({
+                        "frame": frame_no,
+                        "reason": result.get("reason", "")
+                    })
+
+    print(f"🧠 Vision cache: {vision_cache.hits} hits, {vision_cache.misses} misses, "
+          f"{vision_cache.current_bytes / 1024 ** 2:.1f} MiB resident")
+    print(f"📥 Prefetch: {prefetcher.summary()}")
+    if parity["checked"]:
+        print(f"⚖️ Parity vs per-pair verifier: {parity['mismatched']}/{parity['checked']} step/frame pairs differ")
+    return confirmed
+
 
 # ==== Run Verification ====
 final_verification = []
-for item in verification_data:
-    step_id = item["step_id"]
-    step_desc = item["description"]
-    matched = False
-    confirmed_frames = []
-
-    for frame_ref in item.get("frame_refs", []):
-        frame_path = os.path.join(frame_folder, frame_ref["frame_no"])
-        if not os.path.exists(frame_path):
-            continue
-
-        image = Image.open(frame_path)
-        result = verify_step_with_frame(step_desc, image)
-        print(f"🧪 Step {step_id} Frame {frame_ref['frame_no']} → Match: {result['match']}")
-
-        if result["match"] is True:
-            matched = True
-            confirmed_frames.append({
-                "frame": frame_ref["frame_no"],
-                "reason": result.get("reason", "")
-            })
-
-    status = "matched" if matched else "unverified"
-    final_verification.append({
-        "step_id": step_id,
-        "description": step_desc,
-        "status": status,
-        "confirmed_frames": confirmed_frames
-    })
+if FRAME_MAJOR:
+    confirmed_by_step = run_frame_major_verification(verification_data)
+    for item in verification_data:
+        frame_order = [ref["frame_no"] for ref in item.get("frame_refs", [])]
+        confirmed_frames = sorted(confirmed_by_step[item["step_id"]], key=lambda c: frame_order.index(c["frame"]))
+        final_verification.append({
+            "step_id": item["step_id"],
+            "description": item["description"],
+            "status": "matched" if confirmed_frames else "unverified",
+            "confirmed_frames": confirmed_frames
+        })
+else:
+    def load_pair(pair):
+        item, frame_ref = pair
+        image = Image.open(os.path.join(frame_folder, frame_ref["frame_no"]))
+        with loader_processors.borrow() as private:
+            return image, prepare_verifier_inputs(item["description"], image, private)
+
+    # One flat (step, frame) stream so the prefetcher also runs ahead across step boundaries
+    pairs = [(item, frame_ref) for item in verification_data for frame_ref in item.get("frame_refs", [])
+             if os.path.exists(os.path.join(frame_folder, frame_ref["frame_no"]))]
+    prefetcher = FramePrefetcher(pairs, load_pair)
+    loaded = iter(prefetcher)
+
+    for item in verification_data:
+        step_id = item["step_id"]
+        step_desc = item["description"]
+        matched = False
+        confirmed_frames = []
+
+        for frame_ref in item.get("frame_refs", []):
+            if not os.path.exists(os.path.join(frame_folder, frame_ref["frame_no"])):
+                continue
+
+            _, (image, inputs) = next(loaded)
+            result = verify_step_with_frame(step_desc, image, inputs)
+            print(f"🧪 Step {step_id} Frame {frame_ref['frame_no']} → Match: {result['match']}")
+
+            if result["match"] is True:
+                matched = True
+                confirmed_frames.append({
+                    "frame": frame_ref["frame_no"],
+                    "reason": result.get("reason", "")
+                })
+
+        status = "matched" if matched else "unverified"
+        final_verification.append({
+            "step_id": step_id,
+            "description": step_desc,
+            "status": status,
+            "confirmed_frames": confirmed_frames
+        })
+    print(f"📥 Prefetch: {prefetcher.summary()}")
 
 # ==== Save Output ====
 Path(output_path).parent.mkdir(parents=True, exist_ok=True)
@@ -3,9 +3,16 @@ import pixeltable as pxt
 import pandas as pd
 from loguru import logger
 from pathlib import Path
+import os
 
-# Load Pixeltable view/table
-view = pxt.get_table("zeus_cache.demo_video_6dd4_table_frames")
+from batch_aligner import default_video_hash, default_view_name
+from ingestion import video_hash
+
+# Load Pixeltable view (shared frame view written by ingestion.py), restricted to this recording's frames.
+# ALIGN_VIDEO picks the recording when several videos were ingested.
+view = pxt.get_table(default_view_name())
+video_path = os.getenv("ALIGN_VIDEO")
+frames = view.where(view.video_hash == (video_hash(video_path) if video_path else default_video_hash(view)))
 
 # Load test steps from summary.json
 summary_path = Path("output/summary.json")
@@ -27,7 +34,7 @@ for step in test_steps:
 
     # Query top matching frame (no aliasing for score)
     result = (
-        view
+        frames
         .order_by(sim_expr, asc=False)
         .limit(1)
         .select(
@@ -1,11 +1,19 @@
 import json
-import pixeltable as pxt
+import os
+from pathlib import Path
+
 import pandas as pd
+import pixeltable as pxt
 from loguru import logger
-from pathlib import Path
 
-# Load Pixeltable view
-view = pxt.get_table("zeus_cache.demo_video_6dd4_table_frames")
+from batch_aligner import TextEncoder, align_steps, default_video_hash, default_view_name, load_frame_matrix
+from ingestion import video_hash
+
+# Load Pixeltable view (shared frame view written by ingestion.py) and this recording's frame embeddings, once.
+# ALIGN_VIDEO picks the recording when several videos were ingested.
+view = pxt.get_table(default_view_name())
+video_path = os.getenv("ALIGN_VIDEO")
+frames = load_frame_matrix(view, video_hash(video_path) if video_path else default_video_hash(view))
 
 # Load test steps from summary.json
 summary_path = Path("output/summary.json")
@@ -15,52 +23,14 @@ with summary_path.open("r", encoding="utf-8") as f:
 # Extract step_id and description
 test_steps = [{"step_id": step["step_id"], "description": step["description"]} for step in summary_data]
 
-aligned_steps = []
-
-for step in test_steps:
-    step_id = step["step_id"]
-    description = step["description"]
-
-    # Compute similarity expression (and give it a name)
-    sim_expr = view.im_caption.similarity(description).with_name("score")
-
-    # Run Pixeltable query
-    result = (
-        view
-        .order_by(sim_expr, asc=False)
-        .limit(1)
-        .select(
-            view.im_caption,
-            view.pos_msec,
-            view.frame_idx,
-            sim_expr  # already labeled "score"
-        )
-        .collect()
-    )
-
-    if not result:
-        logger.warning(f"No match found for Step {step_id}")
-        continue
-
-    matched_caption, timestamp, frame_id, score = result[0]
-
-    # score is already a float
-    status = "Observed" if score >= 0.75 else "Skipped"
-
-    aligned_steps.append({
-        "step_id": step_id,
-        "step_description": description,
-        "matched_frame_caption": matched_caption,
-        "timestamp": str(timestamp),
-        "frame_id": frame_id,
-        "score": round(score, 4),
-        "status": status,
-    })
+# All steps embedded and scored in one batch (image + caption similarity fused) instead of one query per step
+aligned_steps = align_steps(test_steps, frames, TextEncoder(), k=1)
 
-    logger.info(f"[{status}] Step {step_id} → Frame {frame_id} | Score: {score:.4f}")
+for step in aligned_steps:
+    logger.info(f"[{step['status']}] Step {step['step_id']} → Frame {step['frame_id']} | Score: {step['score']:.4f}")
 
 # Convert to DataFrame
-df = pd.DataFrame(aligned_steps)
+df = pd.DataFrame(aligned_steps).drop(columns=["top_k"])
 print(df)
 
 # Optional: Save to CSV
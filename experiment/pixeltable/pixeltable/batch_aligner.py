@@ -0,0 +1,201 @@
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pixeltable as pxt
+from loguru import logger
+
+from clip_encoder import SharedCLIP
+from utils import get_settings
+
+logger = logger.bind(name="BatchAligner")
+# Same settings source as ingestion.py, so steps are embedded with the models that wrote the stored columns
+settings = get_settings()
+
+# Step-to-frame alignment in one pass: all step descriptions are CLIP-embedded in a single batch, the
+# stored frame embeddings (image_embedding / caption_embedding columns written at ingestion) are pulled
+# once, and top-k frames per step come from one matrix product per modality, fused by weight.
+# Replaces one order_by(similarity).limit(1) query per step, each re-embedding the step and
+# rescanning the index.
+IMAGE_WEIGHT = 0.5
+CAPTION_WEIGHT = 0.5
+OBSERVED_THRESHOLD = 0.75  # on the aligned frame's caption similarity, as in the per-step aligners
+TEXT_BATCH_SIZE = 256
+
+
+@dataclass
+class FrameMatrix:
+    frame_idx: np.ndarray
+    pos_msec: np.ndarray
+    captions: List[str]
+    image_emb: np.ndarray    # (frames, d), L2-normalised
+    caption_emb: np.ndarray  # (frames, d), L2-normalised
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def default_view_name(namespace: str = "zeus_cache") -> str:
+    """The shared frame view ingestion.py uses for the current settings."""
+    from ingestion import VideoProcessor
+    return VideoProcessor(namespace=namespace).frame_view_path()
+
+
+def default_video_hash(view) -> str:
+    """The one video in the view; with several, the caller has to say which (--video / --video-hash)."""
+    hashes = sorted(set(view.select(view.video_hash).collect().to_pandas()["video_hash"]))
+    if len(hashes) != 1:
+        raise ValueError(f"Frame view holds {len(hashes)} videos; pass the video (or its hash) to align against")
+    return hashes[0]
+
+
+def load_frame_matrix(view, video_hash: Optional[str]) -> FrameMatrix:
+    """
+    Pull one video's stored frame embeddings once. The view is shared by every ingested video, so the
+    hash is required; None explicitly aligns against all of them.
+    """
+    query = view.where(view.video_hash == video_hash) if video_hash else view
+    df = query.select(
+        view.frame_idx, view.pos_msec, view.im_caption, view.image_embedding, view.caption_embedding
+    ).collect().to_pandas()
+    return FrameMatrix(
+        frame_idx=df["frame_idx"].to_numpy(),
+        pos_msec=df["pos_msec"].to_numpy(),
+        captions=df["im_caption"].tolist(),
+        image_emb=_normalize(np.stack(df["image_embedding"].to_list())),
+        caption_emb=_normalize(np.stack(df["caption_embedding"].to_list())),
+    )
+
+
+class TextEncoder:
+    """
+    Step text encoders on the shared CLIP instances (see clip_encoder.py) of the image and caption index
+    models; one encoder when both ids match.
+    """
+
+    def __init__(self, image_model_id: str = settings.IMAGE_SIMILARITY_EMBD_MODEL,
+                 caption_model_id: str = settings.CAPTION_SIMILARITY_EMBD_MODEL):
+        self.image_encoder = SharedCLIP.get(image_model_id)
+        self.caption_encoder = SharedCLIP.get(caption_model_id)
+
+    @staticmethod
+    def _encode(encoder: SharedCLIP, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), TEXT_BATCH_SIZE):
+            vectors += encoder.encode_texts(texts[start:start + TEXT_BATCH_SIZE])
+        return _normalize(np.stack(vectors))
+
+    def encode(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """(queries for image_embedding, queries for caption_embedding)."""
+        caption_q = self._encode(self.caption_encoder, texts)
+        if self.image_encoder is self.caption_encoder:
+            return caption_q, caption_q
+        return self._encode(self.image_encoder, texts), caption_q
+
+
+def _zscore(sim: np.ndarray) -> np.ndarray:
+    # Text-image and text-text cosines live on different scales (~0.3 vs ~0.8): standardise per step
+    return (sim - sim.mean(axis=1, keepdims=True)) / np.maximum(sim.std(axis=1, keepdims=True), 1e-6)
+
+
+def align_steps(steps: List[Dict], frames: FrameMatrix, encoder: TextEncoder, k: int = 3,
+                timings: Optional[Dict] = None) -> List[Dict]:
+    """
+    The aligned frame is the one with the best caption similarity, as in the per-step aligners, and `score` /
+    `status` are that frame's. `top_k` ranks frames by fused image + caption similarity as extra evidence.
+    """
+    timings = timings if timings is not None else {}
+
+    start = time.perf_counter()
+    image_q, caption_q = encoder.encode([step["description"] for step in steps])
+    timings["embed_steps"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image_sim = image_q @ frames.image_emb.T
+    caption_sim = caption_q @ frames.caption_emb.T
+    best_caption = caption_sim.argmax(axis=1)
+    fused = IMAGE_WEIGHT * _zscore(image_sim) + CAPTION_WEIGHT * _zscore(caption_sim)
+
+    k = min(k, fused.shape[1])
+    top = np.argpartition(-fused, k - 1, axis=1)[:, :k]
+    top = np.take_along_axis(top, np.argsort(-np.take_along_axis(fused, top, axis=1), axis=1), axis=1)
+    timings["similarity_topk"] = time.perf_counter() - start
+
+    aligned_steps = []
+    for row, step in enumerate(steps):
+        best = best_caption[row]
+        score = float(caption_sim[row, best])
+        aligned_steps.append({
+            "step_id": step["step_id"],
+            "step_description": step["description"],
+            "matched_frame_caption": frames.captions[best],
+            "timestamp": str(frames.pos_msec[best]),
+            "frame_id": int(frames.frame_idx[best]),
+            "score": round(score, 4),
+            "caption_score": round(float(caption_sim[row, best]), 4),
+            "image_score": round(float(image_sim[row, best]), 4),
+            "fused_score": round(float(fused[row, best]), 4),
+            "status": "Observed" if score >= OBSERVED_THRESHOLD else "Skipped",
+            "top_k": [{"frame_id": int(frames.frame_idx[f]), "fused_score": round(float(fused[row, f]), 4)}
+                      for f in top[row]],
+        })
+    return aligned_steps
+
+
+def benchmark(steps: List[Dict], frames: FrameMatrix, encoder: TextEncoder, sizes=(10, 100, 1000), k: int = 3):
+    """Times batched alignment for suites of `sizes` steps (summary steps repeated with an index suffix)."""
+    for n in sizes:
+        suite = [{"step_id": i + 1, "description": f"{steps[i % len(steps)]['description']} ({i})"}
+                 for i in range(n)]
+        timings = {}
+        start = time.perf_counter()
+        align_steps(suite, frames, encoder, k, timings)
+        total = time.perf_counter() - start
+        logger.info(f"⏱️ {n:>5} steps x {len(frames.captions)} frames: total {total:.3f}s "
+                    f"(embed {timings['embed_steps']:.3f}s, similarity+top-{k} {timings['similarity_topk'] * 1000:.1f} ms)")
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Batched step-to-frame alignment over a Pixeltable frame view")
+    cli.add_argument("--view", help="frame view path, default: the only *_frames view in zeus_cache")
+    cli.add_argument("--video", help="recording to align against (hashed like ingestion.py)")
+    cli.add_argument("--video-hash", help="video to align against; default: the only video in the view")
+    cli.add_argument("--summary", default="output/summary.json")
+    cli.add_argument("--top-k", type=int, default=3)
+    cli.add_argument("--out", default="alignment_output_batched.csv")
+    cli.add_argument("--benchmark", type=int, nargs="*", metavar="STEPS", help="e.g. --benchmark 10 100 1000")
+    args = cli.parse_args()
+
+    with Path(args.summary).open("r", encoding="utf-8") as f:
+        steps = [{"step_id": s["step_id"], "description": s["description"]} for s in json.load(f)]
+
+    start = time.perf_counter()
+    view = pxt.get_table(args.view or default_view_name())
+    if args.video:
+        from ingestion import video_hash
+        args.video_hash = video_hash(args.video)
+    frames = load_frame_matrix(view, args.video_hash or default_video_hash(view))
+    encoder = TextEncoder()
+    logger.info(f"Loaded {len(frames.captions)} frame embeddings and text encoder in {time.perf_counter() - start:.2f}s")
+
+    if args.benchmark is not None:
+        benchmark(steps, frames, encoder, args.benchmark or (10, 100, 1000), args.top_k)
+        return
+
+    import pandas as pd
+    aligned_steps = align_steps(steps, frames, encoder, args.top_k)
+    for step in aligned_steps:
+        logger.info(f"[{step['status']}] Step {step['step_id']} → Frame {step['frame_id']} | Score: {step['score']:.4f}")
+    df = pd.DataFrame(aligned_steps)
+    print(df.drop(columns=["top_k"]))
+    df.to_csv(args.out, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import CLIPConfig, CLIPModel, CLIPProcessor
+
+from onnx_backend import INFERENCE_BACKEND, OnnxCLIP
+
+# One CLIP model per model id for the whole process: the image index, the caption index, the stored
+# embedding columns and the aligners' text encoder all share it when their ids match (both default to
+# openai/clip-vit-base-patch32), instead of each clip.using(...) holding its own copy. Vectors are
+# memoised by content, so a frame or caption embedded for its stored column is not embedded again
+# when the embedding index over the same column is built. With INFERENCE_BACKEND=onnx the shared
+# instance runs the exported graphs through ONNX Runtime instead of eager PyTorch.
+MEMO_SIZE = 8192
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+@functools.lru_cache(maxsize=None)
+def embed_dim(model_id: str) -> int:
+    """Output width of a CLIP checkpoint (512 for ViT-B, 768 for ViT-L, ...); the shared UDFs declare it per model."""
+    return CLIPConfig.from_pretrained(model_id).projection_dim
+
+
+class SharedCLIP:
+    _instances: Dict[str, "SharedCLIP"] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, model_id: str) -> "SharedCLIP":
+        with cls._lock:
+            if model_id not in cls._instances:
+                cls._instances[model_id] = cls(model_id)
+            return cls._instances[model_id]
+
+    def __init__(self, model_id: str, backend: str = INFERENCE_BACKEND):
+        self.model_id = model_id
+        self.onnx = OnnxCLIP(model_id) if backend == "onnx" else None
+        if self.onnx is None:
+            dtype = torch.float16 if device.type == "cuda" else torch.float32
+            self.model = CLIPModel.from_pretrained(model_id, torch_dtype=dtype).to(device).eval()
+            self.processor = CLIPProcessor.from_pretrained(model_id)
+        self.memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.memo_lock = threading.Lock()
+        self.stats = {"forward_passes": 0, "encoded": 0, "memo_hits": 0}
+
+    # ---------- Memo ---------- #
+
+    def _lookup(self, keys: List[str]) -> List:
+        with self.memo_lock:
+            found = []
+            for key in keys:
+                vec = self.memo.get(key)
+                if vec is not None:
+                    self.memo.move_to_end(key)
+                found.append(vec)
+            self.stats["memo_hits"] += sum(v is not None for v in found)
+            return found
+
+    def _store(self, keys: List[str], vectors: np.ndarray):
+        with self.memo_lock:
+            for key, vec in zip(keys, vectors):
+                self.memo[key] = vec
+            while len(self.memo) > MEMO_SIZE:
+                self.memo.popitem(last=False)
+
+    def _encode(self, keys: List[str], items: List, forward) -> List[np.ndarray]:
+        found = self._lookup(keys)
+        missing = [i for i, vec in enumerate(found) if vec is None]
+        if missing:
+            features = forward([items[i] for i in missing])
+            vectors = features / np.maximum(np.linalg.norm(features, axis=-1, keepdims=True), 1e-12)
+            self._store([keys[i] for i in missing], vectors)
+            for i, vec in zip(missing, vectors):
+                found[i] = vec
+            self.stats["forward_passes"] += 1
+            self.stats["encoded"] += len(missing)
+        return found
+
+    # ---------- Encoders ---------- #
+
+    def encode_images(self, images: List[Image.Image]) -> List[np.ndarray]:
+        keys = ["img:" + hashlib.sha1(f"{image.mode}{image.size}".encode() + image.tobytes()).hexdigest()
+                for image in images]
+
+        def forward(batch):
+            if self.onnx:
+                return self.onnx.encode_images(batch)
+            inputs = self.processor(images=[image.convert("RGB") for image in batch], return_tensors="pt")
+            with torch.no_grad():
+                features = self.model.get_image_features(pixel_values=inputs["pixel_values"].to(device, self.model.dtype))
+            return features.float().cpu().numpy()
+
+        return self._encode(keys, images, forward)
+
+    def encode_texts(self, texts: List[str]) -> List[np.ndarray]:
+        keys = ["txt:" + hashlib.sha1(text.encode("utf-8")).hexdigest() for text in texts]
+
+        def forward(batch):
+            if self.onnx:
+                return self.onnx.encode_texts(batch)
+            inputs = self.processor(text=batch, padding=True, truncation=True, max_length=77, return_tensors="pt")
+            with torch.no_grad():
+                features = self.model.get_text_features(**{k: v.to(device) for k, v in inputs.items()})
+            return features.float().cpu().numpy()
+
+        return self._encode(keys, texts, forward)
+
+
+def encoder_stats() -> Dict[str, Dict]:
+    """Per model id: how many models were loaded (one per distinct id) and forward passes / memo hits."""
+    return {model_id: dict(enc.stats) for model_id, enc in SharedCLIP._instances.items()}
+
+
+def peak_memory_mb() -> float:
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated() / 1024 ** 2
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
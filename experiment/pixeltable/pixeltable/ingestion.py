@@ -1,40 +1,83 @@
-import uuid
-from typing import Optional
+import argparse
+import hashlib
+import json
+import time
+from typing import List, Optional
 
 import pixeltable as pxt
+import torch
 from loguru import logger
 from pixeltable.functions.huggingface import clip
 from pixeltable.iterators.video import FrameIterator
 
-from utils import resize_image, get_settings, image_to_text
+from clip_encoder import encoder_stats, peak_memory_mb
+from utils import (resize_image, get_settings, image_to_text, resize_images, images_to_text,
+                   clip_image_embed, clip_text_embed)
 
 logger = logger.bind(name="VideoProcessor")
 settings = get_settings()
 
+CAPTION_MODEL = "Salesforce/blip-image-captioning-base"
+
+
+def video_hash(video_path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of the video bytes: the same recording under another name or path is ingested once."""
+    digest = hashlib.sha256()
+    with open(video_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 class VideoProcessor:
-    def __init__(self):
+    def __init__(self, num_frames: Optional[int] = None, batched: Optional[bool] = None,
+                 shared_clip: Optional[bool] = None, namespace: str = "zeus_cache"):
         self._video_table: Optional[pxt.Table] = None
         self._frames_view: Optional[pxt.View] = None
         self._video_mapping_idx: Optional[str] = None
-        self._namespace: str = "zeus_cache"
+        self._video_hash: Optional[str] = None
+        self._namespace: str = namespace
+        self._num_frames = num_frames or settings.SPLIT_FRAMES_COUNT
+        self._batched = settings.BATCHED_FRAME_UDFS if batched is None else batched
+        self._shared_clip = settings.SHARED_CLIP_ENCODER if shared_clip is None else shared_clip
 
         logger.info(
-            f"VideoProcessor initialized:\n Split FPS: {settings.SPLIT_FRAMES_COUNT}"
+            f"VideoProcessor initialized:\n Split FPS: {self._num_frames}\n Batched frame UDFs: {self._batched}"
         )
 
+    def layout_key(self) -> str:
+        """Short hash of everything that changes the computed columns; one shared table per key."""
+        layout = {
+            "num_frames": self._num_frames,
+            "resize": [settings.IMAGE_RESIZE_WIDTH, settings.IMAGE_RESIZE_HEIGHT],
+            "caption_model": CAPTION_MODEL,
+            "image_embed": settings.IMAGE_SIMILARITY_EMBD_MODEL,
+            "caption_embed": settings.CAPTION_SIMILARITY_EMBD_MODEL,
+            # Computed columns are created with if_exists="ignore", so a UDF switch needs its own layout
+            "batched_udfs": self._batched,
+            "shared_clip": self._shared_clip,
+        }
+        return hashlib.sha256(json.dumps(layout, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+
+    def video_table_path(self) -> str:
+        """Path of the shared video table for the current settings (exists once setup_table() ran)."""
+        return f"{self._namespace}.videos_{self.layout_key()}_table"
+
+    def frame_view_path(self) -> str:
+        return f"{self.video_table_path()}_frames"
+
     def setup_table(self, video_name: str):
-        """Set up Pixeltable tables and views using logical paths (no local dirs)."""
+        """
+        Open the shared video table and frame view for the current settings, creating them (with their
+        computed columns and embedding indexes) only the first time. Videos are rows keyed by video_hash.
+        """
         self._video_mapping_idx = video_name
 
-        suffix = uuid.uuid4().hex[-4:]
-        table_base = f"{self._namespace}.{video_name}_{suffix}"
-
-        self._video_table_name = f"{table_base}_table"
-        self._frames_view_name = f"{self._video_table_name}_frames"
+        self._video_table_name = self.video_table_path()
+        self._frames_view_name = self.frame_view_path()
 
         self._setup_table()
-        logger.info(f"✅ Created video index: '{self._video_table_name}'")
+        logger.info(f"✅ Video index ready: '{self._video_table_name}' ({self._video_table.count()} videos)")
 
     def _setup_table(self):
         self._setup_namespace()
@@ -43,81 +86,161 @@ class VideoProcessor:
 
     def _setup_namespace(self):
         """Create a Pixeltable logical namespace if needed."""
-        logger.info(f"Creating Pixeltable namespace: {self._namespace}")
-        pxt.create_dir(self._namespace, if_exists="replace_force")
+        logger.info(f"Opening Pixeltable namespace: {self._namespace}")
+        pxt.create_dir(self._namespace, if_exists="ignore")
 
     def _create_video_table(self):
-        """Create the table that stores the input video."""
+        """Create (once) the table that stores the input videos."""
         self._video_table = pxt.create_table(
             self._video_table_name,
-            schema={"video": pxt.Video},
-            if_exists="replace_force",
+            schema={"video": pxt.Video, "video_hash": pxt.String, "video_name": pxt.String},
+            if_exists="ignore",
         )
 
     def _setup_frame_processing(self):
-        """Create a view that extracts, resizes, captions, and embeds frames."""
+        """
+        Create a view that extracts, resizes, captions, and embeds frames. Everything is if_exists="ignore":
+        on an existing layout this is a no-op and new rows are computed incrementally on insert.
+        """
         self._frames_view = pxt.create_view(
             self._frames_view_name,
             self._video_table,
             iterator=FrameIterator.create(
                 video=self._video_table.video,
-                num_frames=settings.SPLIT_FRAMES_COUNT,
+                num_frames=self._num_frames,
             ),
-            if_exists="replace_force",
+            if_exists="ignore",
         )
 
-        # Resize frames
+        # Resize frames (batched: one interpolate per batch instead of thumbnail() per row)
+        resize = resize_images if self._batched else resize_image
         self._frames_view.add_computed_column(
-            resized_frame=resize_image(
+            resized_frame=resize(
                 self._frames_view.frame,
                 width=settings.IMAGE_RESIZE_WIDTH,
                 height=settings.IMAGE_RESIZE_HEIGHT,
-            )
+            ),
+            if_exists="ignore",
+        )
+
+        # Generate captions using BLIP (custom UDF; batched: one generate() per FRAME_BATCH_SIZE frames)
+        caption = images_to_text if self._batched else image_to_text
+        self._frames_view.add_computed_column(
+            im_caption=caption(self._frames_view.resized_frame),
+            if_exists="ignore",
         )
 
-        # Generate captions using BLIP (custom UDF)
+        # One shared CLIP instance per distinct model id (image and caption default to the same one);
+        # otherwise pixeltable's clip(), which runs each use independently
+        if self._shared_clip:
+            image_embed, string_embed = clip_image_embed, clip_text_embed
+        else:
+            image_embed, string_embed = clip, clip
+
+        # Stored CLIP vectors, so aligners can pull the whole frame matrix once (see batch_aligner.py)
+        self._frames_view.add_computed_column(
+            image_embedding=image_embed(self._frames_view.resized_frame, model_id=settings.IMAGE_SIMILARITY_EMBD_MODEL),
+            if_exists="ignore",
+        )
         self._frames_view.add_computed_column(
-            im_caption=image_to_text(self._frames_view.resized_frame)
+            caption_embedding=string_embed(self._frames_view.im_caption, model_id=settings.CAPTION_SIMILARITY_EMBD_MODEL),
+            if_exists="ignore",
         )
 
-        # Embedding on image (CLIP)
+        # Embedding on image (CLIP); with the shared encoder these vectors are memo hits from the column above
         self._frames_view.add_embedding_index(
             column=self._frames_view.resized_frame,
-            image_embed=clip.using(model_id=settings.IMAGE_SIMILARITY_EMBD_MODEL),
-            if_exists="replace_force",
+            image_embed=image_embed.using(model_id=settings.IMAGE_SIMILARITY_EMBD_MODEL),
+            if_exists="ignore",
         )
 
         # Embedding on caption (CLIP)
         self._frames_view.add_embedding_index(
             column=self._frames_view.im_caption,
-            string_embed=clip.using(model_id=settings.CAPTION_SIMILARITY_EMBD_MODEL),
-            if_exists="replace_force",
+            string_embed=string_embed.using(model_id=settings.CAPTION_SIMILARITY_EMBD_MODEL),
+            if_exists="ignore",
         )
 
     def add_video(self, video_path: str) -> bool:
-        """Insert a video file into the Pixeltable table."""
+        """Append a video to the shared table; False if this recording was already ingested (nothing recomputed)."""
         if not self._video_table:
             raise ValueError("Video table is not initialized. Call setup_table() first.")
+        self._video_hash = video_hash(video_path)
+        existing = self._video_table.where(self._video_table.video_hash == self._video_hash)
+        if existing.count() > 0:
+            logger.info(f"♻️ Video {video_path} ({self._video_hash[:12]}) already in {self._video_table_name}, reusing it")
+            # Frames are reused, but the row takes the name this run knows the recording by
+            names = set(existing.select(self._video_table.video_name).collect().to_pandas()["video_name"])
+            if self._video_mapping_idx and names != {self._video_mapping_idx}:
+                self._video_table.update({"video_name": self._video_mapping_idx},
+                                         where=self._video_table.video_hash == self._video_hash)
+            return False
         logger.info(f"Inserting video {video_path} into {self._video_table_name}")
-        self._video_table.insert([{"video": video_path}])
+        self._video_table.insert([{"video": video_path, "video_hash": self._video_hash,
+                                   "video_name": self._video_mapping_idx}])
         return True
 
+    def frames(self):
+        """The frame view restricted to the last added video (other videos share the same view)."""
+        return self._frames_view.where(self._frames_view.video_hash == self._video_hash)
+
     def get_frame_view_name(self) -> str:
         return self._frames_view_name
 
+    def get_video_hash(self) -> Optional[str]:
+        return self._video_hash
+
     def get_video_mapping_index(self) -> str:
         return self._video_mapping_idx
 
 
+def benchmark_view_build(video_path: str, frame_counts: List[int], benchmark_modes: Optional[List[str]] = None):
+    """
+    Time table setup + insert (frames, resize, captions, CLIP columns and both indexes) per frame count
+    for: per-row UDFs, batched UDFs, and batched UDFs with the shared CLIP encoder. Peak memory is
+    CUDA peak allocation on GPU; on CPU it is the process max RSS, so run one mode per process
+    (--benchmark-modes) for a clean comparison.
+    """
+    modes = {"per_row": (False, False), "batched": (True, False), "batched_shared_clip": (True, True)}
+    for num_frames in frame_counts:
+        for mode in benchmark_modes or modes:
+            batched, shared_clip = modes[mode]
+            # Fresh namespace per measurement, otherwise later modes would reuse earlier rows
+            pxt.drop_dir("zeus_bench", force=True, if_not_exists="ignore")
+            if torch.cuda.is_available():
+                torch.cuda.reset_peak_memory_stats()
+            processor = VideoProcessor(num_frames=num_frames, batched=batched, shared_clip=shared_clip,
+                                       namespace="zeus_bench")
+            start = time.perf_counter()
+            processor.setup_table(f"bench_{num_frames}_{mode}")
+            processor.add_video(video_path)
+            logger.info(f"⏱️ {num_frames:>4} frames, {mode:<20}: {time.perf_counter() - start:.1f}s, "
+                        f"peak {peak_memory_mb():.0f} MB")
+    logger.info(f"📊 Shared CLIP encoders: {encoder_stats()}")
+
+
 # ✅ Run standalone
 if __name__ == "__main__":
     video_path = r"C:\Users\antara1001\Downloads\my\hackathon\zeus\media\video.webm"
     video_name = "demo_video"
 
+    cli = argparse.ArgumentParser(description="Ingest a video into Pixeltable")
+    cli.add_argument("--video", default=video_path)
+    cli.add_argument("--benchmark", type=int, nargs="*", metavar="FRAMES",
+                     help="time view build per-row vs batched for these frame counts, e.g. --benchmark 8 30 60 120")
+    cli.add_argument("--benchmark-modes", nargs="*", choices=["per_row", "batched", "batched_shared_clip"])
+    args = cli.parse_args()
+    video_path = args.video
+
+    if args.benchmark is not None:
+        benchmark_view_build(video_path, args.benchmark or [8, 30, 60, 120], args.benchmark_modes)
+        raise SystemExit(0)
+
     processor = VideoProcessor()
     processor.setup_table(video_name)
-    processor.add_video(video_path)
+    inserted = processor.add_video(video_path)
 
-    print("\n✅ Ingestion completed.")
+    print(f"\n✅ Ingestion completed ({'new video' if inserted else 'already ingested, reused'}).")
     print(f"📌 Table name: {processor._video_table_name}")
     print(f"📌 Frame view: {processor._frames_view_name}")
+    print(f"📌 Video hash: {processor.get_video_hash()}")
@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import numpy as np
+import onnxruntime as ort
+import torch
+from loguru import logger
+from PIL import Image
+
+logger = logger.bind(name="OnnxBackend")
+
+# CPU inference path for the auxiliary models: BLIP captioning and CLIP image/text features are
+# exported once with torch.onnx.export, optionally int8-quantized (dynamic, MatMul/Gemm weights only),
+# cached under ONNX_CACHE_DIR and run through ONNX Runtime with ONNX_THREADS intra-op threads.
+#   INFERENCE_BACKEND=onnx python ingestion.py           # captions + CLIP columns/indexes via ORT
+#   python onnx_backend.py --check [--int8] [--threads 4]  # parity + latency vs eager PyTorch
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+ONNX_CACHE_DIR = Path(os.getenv("ONNX_CACHE_DIR", os.path.expanduser("~/.cache/medusa_watcher/onnx")))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", str(os.cpu_count() or 1)))
+ONNX_INT8 = os.getenv("ONNX_INT8", "0") == "1"
+OPSET = 17
+
+
+def session_options(threads: int = ONNX_THREADS) -> ort.SessionOptions:
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+def cached_session(model_id: str, part: str, export: Callable[[Path], None], int8: bool = ONNX_INT8,
+                   threads: int = ONNX_THREADS) -> ort.InferenceSession:
+    """Session for `part` of `model_id`, exporting (and quantizing) into the cache on first use."""
+    folder = ONNX_CACHE_DIR / model_id.replace("/", "__")
+    fp32_path = folder / f"{part}.onnx"
+    path = folder / f"{part}.int8.onnx" if int8 else fp32_path
+
+    if not fp32_path.exists():
+        folder.mkdir(parents=True, exist_ok=True)
+        tmp = fp32_path.with_suffix(f".{os.getpid()}.tmp")
+        logger.info(f"📦 Exporting {model_id}:{part} to ONNX")
+        export(tmp)
+        os.replace(tmp, fp32_path)
+    if int8 and not path.exists():
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        quantize_dynamic(str(fp32_path), str(tmp), weight_type=QuantType.QInt8, op_types_to_quantize=["MatMul", "Gemm"])
+        os.replace(tmp, path)
+
+    return ort.InferenceSession(str(path), session_options(threads), providers=["CPUExecutionProvider"])
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+# ---------- CLIP ---------- #
+
+class _ClipImage(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
+class _ClipText(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class OnnxCLIP:
+    """get_image_features / get_text_features of a HF CLIP checkpoint, L2-normalised, via ONNX Runtime."""
+
+    def __init__(self, model_id: str, int8: bool = ONNX_INT8, threads: int = ONNX_THREADS):
+        from transformers import CLIPModel, CLIPProcessor
+        self.processor = CLIPProcessor.from_pretrained(model_id)
+        torch_model = None
+
+        def torch_clip():
+            nonlocal torch_model
+            if torch_model is None:
+                torch_model = CLIPModel.from_pretrained(model_id).eval()
+            return torch_model
+
+        def export_image(path):
+            dummy = torch.zeros(1, 3, 224, 224)
+            torch.onnx.export(_ClipImage(torch_clip()), (dummy,), str(path), opset_version=OPSET,
+                              input_names=["pixel_values"], output_names=["features"],
+                              dynamic_axes={"pixel_values": {0: "batch"}, "features": {0: "batch"}})
+
+        def export_text(path):
+            ids = torch.ones(1, 8, dtype=torch.long)
+            torch.onnx.export(_ClipText(torch_clip()), (ids, torch.ones_like(ids)), str(path), opset_version=OPSET,
+                              input_names=["input_ids", "attention_mask"], output_names=["features"],
+                              dynamic_axes={"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"},
+                                            "features": {0: "batch"}})
+
+        self.image_session = cached_session(model_id, "clip_image", export_image, int8, threads)
+        self.text_session = cached_session(model_id, "clip_text", export_text, int8, threads)
+
+    def encode_images(self, images: List[Image.Image]) -> np.ndarray:
+        pixels = self.processor(images=[image.convert("RGB") for image in images], return_tensors="np")["pixel_values"]
+        return _normalize(self.image_session.run(None, {"pixel_values": pixels.astype(np.float32)})[0])
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        inputs = self.processor(text=texts, padding=True, truncation=True, max_length=77, return_tensors="np")
+        feeds = {"input_ids": inputs["input_ids"].astype(np.int64), "attention_mask": inputs["attention_mask"].astype(np.int64)}
+        return _normalize(self.text_session.run(None, feeds)[0])
+
+
+# ---------- BLIP ---------- #
+
+class _BlipVision(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.vision = model.vision_model
+
+    def forward(self, pixel_values):
+        return self.vision(pixel_values=pixel_values)[0]
+
+
+class _BlipDecoder(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.decoder = model.text_decoder
+
+    def forward(self, input_ids, attention_mask, image_embeds):
+        return self.decoder(input_ids=input_ids, attention_mask=attention_mask,
+                            encoder_hidden_states=image_embeds, return_dict=False)[0]
+
+
+class OnnxBLIPCaptioner:
+    """
+    BLIP captioning as two ONNX graphs (vision encoder, text decoder) with a greedy loop in numpy, the
+    same decoding as model.generate(max_new_tokens=...) with default (greedy) settings. No KV cache:
+    captions are ~10-30 tokens, so re-running the decoder on the prefix stays cheap.
+    """
+
+    def __init__(self, model_id: str = "Salesforce/blip-image-captioning-base", int8: bool = ONNX_INT8,
+                 threads: int = ONNX_THREADS):
+        from transformers import BlipConfig, BlipForConditionalGeneration, BlipProcessor
+        self.processor = BlipProcessor.from_pretrained(model_id)
+        torch_model = None
+
+        def torch_blip():
+            nonlocal torch_model
+            if torch_model is None:
+                torch_model = BlipForConditionalGeneration.from_pretrained(model_id).eval()
+            return torch_model
+
+        def export_vision(path):
+            size = self.processor.image_processor.size["height"]
+            torch.onnx.export(_BlipVision(torch_blip()), (torch.zeros(1, 3, size, size),), str(path),
+                              opset_version=OPSET, input_names=["pixel_values"], output_names=["image_embeds"],
+                              dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}})
+
+        def export_decoder(path):
+            model = torch_blip()
+            ids = torch.ones(1, 4, dtype=torch.long)
+            embeds = torch.zeros(1, 577, model.config.vision_config.hidden_size)
+            torch.onnx.export(_BlipDecoder(model), (ids, torch.ones_like(ids), embeds), str(path),
+                              opset_version=OPSET, input_names=["input_ids", "attention_mask", "image_embeds"],
+                              output_names=["logits"],
+                              dynamic_axes={"input_ids": {0: "batch", 1: "seq"}, "attention_mask": {0: "batch", 1: "seq"},
+                                            "image_embeds": {0: "batch", 1: "patches"}, "logits": {0: "batch", 1: "seq"}})
+
+        self.vision_session = cached_session(model_id, "blip_vision", export_vision, int8, threads)
+        self.decoder_session = cached_session(model_id, "blip_decoder", export_decoder, int8, threads)
+        # Same start/stop tokens as BlipForConditionalGeneration.generate
+        text_config = BlipConfig.from_pretrained(model_id).text_config
+        self.bos_id = text_config.bos_token_id
+        self.eos_id = text_config.sep_token_id
+        self.pad_id = text_config.pad_token_id
+
+    def caption(self, images: List[Image.Image], max_new_tokens: int = 30) -> List[str]:
+        pixels = self.processor(images=[image.convert("RGB") for image in images], return_tensors="np")["pixel_values"]
+        image_embeds = self.vision_session.run(None, {"pixel_values": pixels.astype(np.float32)})[0]
+
+        ids = np.full((len(images), 1), self.bos_id, dtype=np.int64)
+        done = np.zeros(len(images), dtype=bool)
+        for _ in range(max_new_tokens):
+            logits = self.decoder_session.run(None, {"input_ids": ids, "attention_mask": np.ones_like(ids),
+                                                     "image_embeds": image_embeds})[0]
+            next_ids = np.where(done, self.pad_id, logits[:, -1].argmax(axis=-1))
+            ids = np.concatenate([ids, next_ids[:, None]], axis=1)
+            done |= next_ids == self.eos_id
+            if done.all():
+                break
+        return self.processor.batch_decode(ids, skip_special_tokens=True)
+
+
+# ---------- Parity + Latency ---------- #
+
+def _timed(fn, repeats: int = 3):
+    fn()  # warm-up (graph optimisation, allocator)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeats
+
+
+def check(frames_dir: str, summary_path: str, count: int, int8: bool, threads: int,
+          clip_id: str = "openai/clip-vit-base-patch32", blip_id: str = "Salesforce/blip-image-captioning-base"):
+    """Compare ONNX Runtime against eager PyTorch (same thread count) on real frames and step texts."""
+    from transformers import BlipForConditionalGeneration, BlipProcessor, CLIPModel, CLIPProcessor
+    torch.set_num_threads(threads)
+    names = sorted(f for f in os.listdir(frames_dir) if f.endswith(".jpg"))[:count]
+    images = [Image.open(os.path.join(frames_dir, name)).convert("RGB") for name in names]
+    with open(summary_path, "r", encoding="utf-8") as f:
+        texts = [step["description"] for step in json.load(f)]
+    label = "int8" if int8 else "fp32"
+
+    # CLIP
+    clip_torch, clip_proc = CLIPModel.from_pretrained(clip_id).eval(), CLIPProcessor.from_pretrained(clip_id)
+    clip_onnx = OnnxCLIP(clip_id, int8, threads)
+    with torch.no_grad():
+        ref_img, torch_img_s = _timed(lambda: _normalize(clip_torch.get_image_features(
+            **clip_proc(images=images, return_tensors="pt")).numpy()))
+        ref_txt, torch_txt_s = _timed(lambda: _normalize(clip_torch.get_text_features(
+            **clip_proc(text=texts, padding=True, truncation=True, max_length=77, return_tensors="pt")).numpy()))
+    out_img, onnx_img_s = _timed(lambda: clip_onnx.encode_images(images))
+    out_txt, onnx_txt_s = _timed(lambda: clip_onnx.encode_texts(texts))
+    logger.info(f"🔎 CLIP image ({label}): min cosine vs torch {float((ref_img * out_img).sum(-1).min()):.5f}, "
+                f"{torch_img_s / len(images) * 1000:.1f} → {onnx_img_s / len(images) * 1000:.1f} ms/frame")
+    logger.info(f"🔎 CLIP text  ({label}): min cosine vs torch {float((ref_txt * out_txt).sum(-1).min()):.5f}, "
+                f"{torch_txt_s / len(texts) * 1000:.1f} → {onnx_txt_s / len(texts) * 1000:.1f} ms/text")
+
+    # BLIP
+    blip_torch, blip_proc = BlipForConditionalGeneration.from_pretrained(blip_id).eval(), BlipProcessor.from_pretrained(blip_id)
+    blip_onnx = OnnxBLIPCaptioner(blip_id, int8, threads)
+    with torch.no_grad():
+        ref_caps, torch_cap_s = _timed(lambda: blip_proc.batch_decode(blip_torch.generate(
+            **blip_proc(images=images, return_tensors="pt"), max_new_tokens=30), skip_special_tokens=True), repeats=1)
+    out_caps, onnx_cap_s = _timed(lambda: blip_onnx.caption(images), repeats=1)
+    same = sum(a.strip() == b.strip() for a, b in zip(ref_caps, out_caps))
+    logger.info(f"🔎 BLIP captions ({label}): {same}/{len(images)} identical to torch, "
+                f"{torch_cap_s / len(images) * 1000:.0f} → {onnx_cap_s / len(images) * 1000:.0f} ms/frame")
+    for a, b in zip(ref_caps, out_caps):
+        if a.strip() != b.strip():
+            logger.info(f"   torch: {a!r}\n   onnx:  {b!r}")
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Export BLIP/CLIP to ONNX and compare against PyTorch")
+    cli.add_argument("--check", action="store_true", help="run the parity + latency comparison")
+    cli.add_argument("--frames", default="../output/frames")
+    cli.add_argument("--summary", default="../output/summary.json")
+    cli.add_argument("--count", type=int, default=16, help="frames to use")
+    cli.add_argument("--int8", action="store_true", default=ONNX_INT8)
+    cli.add_argument("--threads", type=int, default=ONNX_THREADS)
+    args = cli.parse_args()
+
+    if args.check:
+        check(args.frames, args.summary, args.count, args.int8, args.threads)
+    else:
+        OnnxCLIP("openai/clip-vit-base-patch32", args.int8, args.threads)
+        OnnxBLIPCaptioner(int8=args.int8, threads=args.threads)
+        logger.info(f"✅ ONNX graphs cached under {ONNX_CACHE_DIR}")
@@ -1,20 +1,42 @@
 # utils.py
+import functools
 import pixeltable as pxt
+from pixeltable.func import Batch
 from PIL import Image
 from dataclasses import dataclass
+from typing import List
 from transformers import BlipProcessor, BlipForConditionalGeneration
+import numpy as np
 import torch
+import torch.nn.functional as F
+
+from clip_encoder import SharedCLIP, embed_dim
+from onnx_backend import INFERENCE_BACKEND, OnnxBLIPCaptioner
 
-# Load BLIP model once
-processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model = model.to(device)
+
+
+@functools.lru_cache(maxsize=1)
+def load_blip():
+    """
+    BLIP, loaded once on the first caption rather than at import (the aligners import settings from here and
+    never caption). Returns (blip_onnx, processor, model); INFERENCE_BACKEND=onnx: exported graphs on ONNX
+    Runtime (see onnx_backend.py) and no torch model.
+    """
+    if INFERENCE_BACKEND == "onnx":
+        blip_onnx = OnnxBLIPCaptioner("Salesforce/blip-image-captioning-base")
+        return blip_onnx, blip_onnx.processor, None
+    processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
+    model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+    return None, processor, model.to(device)
 
 @pxt.udf
 def image_to_text(image: pxt.type_system.Image) -> str:
     if not isinstance(image, Image.Image):
         raise TypeError("Expected a PIL image")
+    blip_onnx, processor, model = load_blip()
+    if blip_onnx:
+        return blip_onnx.caption([image])[0]
     inputs = processor(images=image, return_tensors="pt").to(device)
     out = model.generate(**inputs, max_new_tokens=30)
     caption = processor.decode(out[0], skip_special_tokens=True)
@@ -34,6 +56,80 @@ class Settings:
     IMAGE_RESIZE_HEIGHT: int = 224
     IMAGE_SIMILARITY_EMBD_MODEL: str = "openai/clip-vit-base-patch32"
     CAPTION_SIMILARITY_EMBD_MODEL: str = "openai/clip-vit-base-patch32"
+    BATCHED_FRAME_UDFS: bool = True
+    FRAME_BATCH_SIZE: int = 16
+    SHARED_CLIP_ENCODER: bool = True
 
 def get_settings() -> Settings:
     return Settings()
+
+
+# ---------- Batched UDFs ---------- #
+# Pixeltable hands these up to FRAME_BATCH_SIZE rows per call: one BLIP forward pass / generate() for
+# the whole batch instead of one per frame, and one interpolate() per distinct frame size for resizing.
+
+def resize_batch(images: List[Image.Image], width: int, height: int) -> List[Image.Image]:
+    """Same result as thumbnail((width, height)) per image (fit inside, keep aspect, never upscale), vectorized."""
+    resized = [None] * len(images)
+    by_size = {}
+    for i, image in enumerate(images):
+        by_size.setdefault(image.size, []).append(i)
+
+    for (w, h), idxs in by_size.items():
+        scale = min(width / w, height / h, 1.0)
+        target = (max(1, round(h * scale)), max(1, round(w * scale)))
+        if target == (h, w):
+            for i in idxs:
+                resized[i] = images[i].copy()
+            continue
+        pixels = torch.from_numpy(np.stack([np.asarray(images[i].convert("RGB")) for i in idxs]))
+        pixels = F.interpolate(pixels.permute(0, 3, 1, 2).float(), size=target, mode="bilinear",
+                               antialias=True, align_corners=False)
+        pixels = pixels.round().clamp(0, 255).to(torch.uint8).permute(0, 2, 3, 1).numpy()
+        for i, array in zip(idxs, pixels):
+            resized[i] = Image.fromarray(array)
+    return resized
+
+
+def caption_batch(images: List[Image.Image]) -> List[str]:
+    blip_onnx, processor, model = load_blip()
+    if blip_onnx:
+        return blip_onnx.caption(images)
+    inputs = processor(images=images, return_tensors="pt").to(device)
+    with torch.no_grad():
+        out = model.generate(**inputs, max_new_tokens=30)
+    return processor.batch_decode(out, skip_special_tokens=True)
+
+
+@pxt.udf(batch_size=Settings.FRAME_BATCH_SIZE)
+def resize_images(images: Batch[Image.Image], *, width: int, height: int) -> Batch[Image.Image]:
+    return resize_batch(images, width, height)
+
+
+@pxt.udf(batch_size=Settings.FRAME_BATCH_SIZE)
+def images_to_text(images: Batch[Image.Image]) -> Batch[str]:
+    return caption_batch(images)
+
+
+# ---------- Shared CLIP UDFs ---------- #
+# Same embeddings as pixeltable's clip(), but every call for a given model id goes through one
+# SharedCLIP instance (one model in memory, content-memoised vectors) and a whole batch per forward.
+
+@pxt.udf(batch_size=Settings.FRAME_BATCH_SIZE)
+def clip_image_embed(images: Batch[Image.Image], *, model_id: str) -> Batch[pxt.Array[(None,), pxt.Float]]:
+    return SharedCLIP.get(model_id).encode_images(images)
+
+
+@pxt.udf(batch_size=Settings.FRAME_BATCH_SIZE)
+def clip_text_embed(texts: Batch[str], *, model_id: str) -> Batch[pxt.Array[(None,), pxt.Float]]:
+    return SharedCLIP.get(model_id).encode_texts(texts)
+
+
+# Embedding columns and indexes need a fixed width: resolve it from the configured checkpoint, as
+# pixeltable's own clip() does, instead of assuming ViT-B's 512
+def _clip_embed_type(model_id: str) -> pxt.type_system.ArrayType:
+    return pxt.type_system.ArrayType((embed_dim(model_id),), dtype=pxt.type_system.FloatType(), nullable=False)
+
+
+clip_image_embed.conditional_return_type(_clip_embed_type)
+clip_text_embed.conditional_return_type(_clip_embed_type)
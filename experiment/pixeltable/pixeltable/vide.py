@@ -12,7 +12,10 @@ import pixeltable as pxt
 
 # Print relevant columns clearly
 #print(filtered[['name', 'return_type', 'args', 'description']].to_string(index=False))
-frames = pxt.get_table("zeus_cache.demo_video_6dd4_table_frames")
+from batch_aligner import default_view_name
+
+# Shared frame view for the current ingestion settings (all ingested videos, keyed by video_hash)
+frames = pxt.get_table(default_view_name())
 print(frames.describe)
 
 
@@ -1,14 +1,54 @@
+import argparse
+import functools
+import hashlib
 import json
+import os
+import time
 from pathlib import Path
-from sentence_transformers import SentenceTransformer, util
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+import numpy as np
 
 HERCULES_JSON = Path("/data/shared/users/antara/rag/video/output/xml_parsed/hercules_plan_steps.json")
 LLM_REPORT_JSON = Path("/data/shared/users/antara/rag/video/output/comparison/llm_verification_report.json")
 OUTPUT_JSON = Path("/data/shared/users/antara/rag/video/output/hercules_similarity/step_alignment.json")
 
-# Load a small and effective sentence transformer model
-model = SentenceTransformer("paraphrase-MiniLM-L6-v2")
+# Small and effective sentence transformer model
+MODEL_NAME = "paraphrase-MiniLM-L6-v2"
+EMBED_CACHE_DIR = Path(os.getenv("EMBED_CACHE_DIR", os.path.expanduser("~/.cache/medusa_watcher/embeddings")))
+MATCH_MODE = os.getenv("MATCH_MODE", "argmax")      # argmax | hungarian | monotone
+MIN_SCORE = float(os.getenv("MATCH_MIN_SCORE", "0.3"))  # one-to-one modes leave weaker pairs unmatched
+TOP_K = int(os.getenv("MATCH_TOP_K", "3"))
+ROW_CHUNK = 4096  # rows of the similarity matrix computed at once, bounds peak memory
+# torch | onnx | onnx-int8: the ONNX variants are exported once into ONNX_CACHE_DIR and run on CPU
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch")
+ONNX_CACHE_DIR = Path(os.getenv("ONNX_CACHE_DIR", os.path.expanduser("~/.cache/medusa_watcher/onnx")))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", str(os.cpu_count() or 1)))
+
+
+@functools.lru_cache(maxsize=None)
+def get_model(backend: str = EMBED_BACKEND):
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        return SentenceTransformer(MODEL_NAME)
+
+    import onnxruntime as ort
+    export_dir = ONNX_CACHE_DIR / MODEL_NAME.replace("/", "__")
+    if not (export_dir / "onnx" / "model.onnx").exists():
+        SentenceTransformer(MODEL_NAME, backend="onnx").save_pretrained(str(export_dir))  # exports on load
+    file_name = "onnx/model.onnx"
+    if backend == "onnx-int8":
+        file_name = "onnx/model_qint8_avx2.onnx"
+        if not (export_dir / file_name).exists():
+            from sentence_transformers import export_dynamic_quantized_onnx_model
+            export_dynamic_quantized_onnx_model(SentenceTransformer(str(export_dir), backend="onnx"), "avx2", str(export_dir))
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = ONNX_THREADS
+    return SentenceTransformer(str(export_dir), backend="onnx", model_kwargs={
+        "file_name": file_name, "provider": "CPUExecutionProvider", "session_options": options,
+    })
+
 
 def load_hercules_steps() -> List[str]:
     with open(HERCULES_JSON, "r", encoding="utf-8") as f:
@@ -19,30 +59,163 @@ def load_llm_steps() -> List[Dict]:
         data = json.load(f)
         return data.get("matched", [])  # Safely extract matched steps
 
-def match_steps(hercules_steps: List[str], llm_steps: List[Dict]) -> List[Dict]:
+
+# ---------- Embedding Cache ---------- #
+
+def _cache_path(model_name: str, text: str) -> Path:
+    key = hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+    return EMBED_CACHE_DIR / model_name.replace("/", "__") / key[:2] / f"{key}.npy"
+
+
+def embed(texts: List[str], backend: str = EMBED_BACKEND) -> np.ndarray:
+    """L2-normalised float32 embeddings; repeated texts are encoded once and kept on disk."""
+    # ONNX outputs differ slightly (int8 more so), so they get their own cache entries
+    model_name = MODEL_NAME if backend == "torch" else f"{MODEL_NAME}@{backend}"
+    unique = list(dict.fromkeys(texts))
+    vectors, missing = {}, []
+    for text in unique:
+        path = _cache_path(model_name, text)
+        if path.exists():
+            vectors[text] = np.load(path)
+        else:
+            missing.append(text)
+
+    if missing:
+        encoded = get_model(backend).encode(missing, batch_size=256, convert_to_numpy=True, normalize_embeddings=True)
+        for text, vec in zip(missing, encoded.astype(np.float32)):
+            path = _cache_path(model_name, text)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, vec)
+            os.replace(tmp, path)
+            vectors[text] = vec
+
+    print(f"🧮 Embeddings: {len(unique) - len(missing)} cached, {len(missing)} encoded ({len(texts)} texts)")
+    return np.stack([vectors[t] for t in texts]) if texts else np.zeros((0, 0), dtype=np.float32)
+
+
+# ---------- Similarity ---------- #
+
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+def similarity_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row of `a` with every row of `b`: one matmul per ROW_CHUNK rows."""
+    a, b = normalize_rows(a), normalize_rows(b)
+    sim = np.empty((len(a), len(b)), dtype=np.float32)
+    for start in range(0, len(a), ROW_CHUNK):
+        np.matmul(a[start:start + ROW_CHUNK], b.T, out=sim[start:start + ROW_CHUNK])
+    return sim
+
+
+def top_k(a: np.ndarray, b: np.ndarray, k: int):
+    """
+    (indices, scores) of the k most similar rows of `b` for every row of `a`, best first. Streams over
+    ROW_CHUNK rows so the full matrix never exists; argpartition is O(m) per row instead of a sort.
+    """
+    a, b = normalize_rows(a), normalize_rows(b)
+    k = min(k, len(b))
+    indices = np.empty((len(a), k), dtype=np.int64)
+    scores = np.empty((len(a), k), dtype=np.float32)
+    for start in range(0, len(a), ROW_CHUNK):
+        sim = a[start:start + ROW_CHUNK] @ b.T
+        idx = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        part = np.take_along_axis(sim, idx, axis=1)
+        order = np.argsort(-part, axis=1)
+        indices[start:start + ROW_CHUNK] = np.take_along_axis(idx, order, axis=1)
+        scores[start:start + ROW_CHUNK] = np.take_along_axis(part, order, axis=1)
+    return indices, scores
+
+
+# ---------- Assignment ---------- #
+
+def assign_argmax(sim: np.ndarray) -> np.ndarray:
+    """Independent best column per row (several rows may share a column)."""
+    return sim.argmax(axis=1)
+
+
+def assign_hungarian(sim: np.ndarray, min_score: float = MIN_SCORE) -> np.ndarray:
+    """Optimal one-to-one assignment maximising total similarity; -1 for unmatched rows."""
+    from scipy.optimize import linear_sum_assignment
+    rows, cols = linear_sum_assignment(sim, maximize=True)
+    assignment = np.full(sim.shape[0], -1, dtype=np.int64)
+    keep = sim[rows, cols] >= min_score
+    assignment[rows[keep]] = cols[keep]
+    return assignment
+
+
+def assign_monotone(sim: np.ndarray, min_score: float = MIN_SCORE) -> np.ndarray:
+    """
+    Order-preserving one-to-one assignment (plan steps and executed steps run in the same order):
+    maximises the summed (similarity - min_score) over pairs whose columns strictly increase with the
+    rows. DP over rows with a vectorised running max; O(n*m) time and n*m bytes of backpointers.
+    """
+    n, m = sim.shape
+    gain = sim - min_score
+    prev = np.zeros(m + 1, dtype=np.float64)     # prev[j]: best total using earlier rows and columns < j
+    step = np.zeros((n, m + 1), dtype=np.uint8)  # backpointer at (i, j): 0 left, 1 up (row unmatched), 2 pair
+    for i in range(n):
+        diag = np.full(m + 1, -np.inf)
+        diag[1:] = prev[:-1] + gain[i]
+        cand = np.maximum(prev, diag)
+        cur = np.maximum.accumulate(cand)
+        reached = cand == cur
+        step[i] = np.where(reached, np.where(diag > prev, 2, 1), 0)
+        prev = cur
+
+    assignment = np.full(n, -1, dtype=np.int64)
+    i, j = n - 1, m
+    while i >= 0 and j > 0:
+        if step[i, j] == 2:
+            assignment[i] = j - 1
+            i, j = i - 1, j - 1
+        elif step[i, j] == 1:
+            i -= 1
+        else:
+            j -= 1  # best value was carried over from a smaller column
+    return assignment
+
+
+ASSIGNERS = {"argmax": assign_argmax, "hungarian": assign_hungarian, "monotone": assign_monotone}
+
+
+def match_steps(hercules_steps: List[str], llm_steps: List[Dict], mode: str = MATCH_MODE,
+                k: int = TOP_K) -> List[Dict]:
     if not llm_steps:
         raise ValueError("LLM steps are empty or missing from the report.")
+    if mode not in ASSIGNERS:
+        raise ValueError(f"Unknown match mode '{mode}', expected one of {sorted(ASSIGNERS)}")
 
-    herc_embeddings = model.encode(hercules_steps, convert_to_tensor=True)
-    llm_descriptions = [step["description"] for step in llm_steps]
-    llm_embeddings = model.encode(llm_descriptions, convert_to_tensor=True)
+    herc_embeddings = embed(hercules_steps)
+    llm_embeddings = embed([step["description"] for step in llm_steps])
+    candidates, candidate_scores = top_k(herc_embeddings, llm_embeddings, max(k, 1))
+    if mode == "argmax":
+        # Best of the streamed top-k, no full matrix needed
+        assignment, best = candidates[:, 0], candidate_scores[:, 0]
+    else:
+        sim = similarity_matrix(herc_embeddings, llm_embeddings)
+        assignment = ASSIGNERS[mode](sim)
+        best = sim[np.arange(len(assignment)), np.maximum(assignment, 0)]
 
     matches = []
-
-    for idx, (herc_step, herc_emb) in enumerate(zip(hercules_steps, herc_embeddings), start=1):
-        similarities = util.cos_sim(herc_emb, llm_embeddings)[0]
-        best_match_idx = int(similarities.argmax())
-        best_score = float(similarities[best_match_idx])
-        best_llm_step = llm_steps[best_match_idx]
-
-        match = {
-            "hercules_step_id": idx,
+    for idx, herc_step in enumerate(hercules_steps):
+        col = int(assignment[idx])
+        best_llm_step: Optional[Dict] = llm_steps[col] if col >= 0 else None
+        matches.append({
+            "hercules_step_id": idx + 1,
             "hercules_step": herc_step,
-            "matched_llm_step_id": best_llm_step.get("step_id"),
-            "llm_description": best_llm_step.get("description"),
-            "similarity_score": round(best_score, 4)
-        }
-        matches.append(match)
+            "matched_llm_step_id": best_llm_step.get("step_id") if best_llm_step else None,
+            "llm_description": best_llm_step.get("description") if best_llm_step else None,
+            "similarity_score": round(float(best[idx]), 4) if col >= 0 else None,
+            "top_k": [
+                {"llm_step_id": llm_steps[c].get("step_id"), "score": round(float(s), 4)}
+                for c, s in zip(candidates[idx], candidate_scores[idx])
+            ],
+        })
 
     return matches
 
@@ -52,10 +225,84 @@ def save_matches(matches: List[Dict]):
         json.dump(matches, f, indent=2)
     print(f"✅ Matches saved to: {OUTPUT_JSON}")
 
+
+# ---------- ONNX Parity ---------- #
+
+def onnx_check(texts: List[str], backend: str = "onnx", repeats: int = 3):
+    """Cosine parity and per-text latency of an ONNX backend against the PyTorch model on `texts`."""
+    timings, outputs = {}, {}
+    for name in ("torch", backend):
+        model = get_model(name)
+        model.encode(texts[:8], normalize_embeddings=True)  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            outputs[name] = model.encode(texts, batch_size=64, normalize_embeddings=True)
+        timings[name] = (time.perf_counter() - start) / repeats / len(texts) * 1000
+    cosine = (outputs["torch"] * outputs[backend]).sum(axis=1)
+    print(f"🔎 {backend} vs torch on {len(texts)} texts: min cosine {cosine.min():.5f}, mean {cosine.mean():.5f}; "
+          f"{timings['torch']:.2f} → {timings[backend]:.2f} ms/text ({ONNX_THREADS} ORT threads)")
+
+
+# ---------- Scaling Demo ---------- #
+
+def scaling_demo(sizes: List[int], dim: int = 384, k: int = TOP_K, full_matrix_max: int = 15000,
+                 hungarian_max: int = 5000):
+    """
+    Times each stage on synthetic n x n suites (MiniLM is 384-d). Executed steps are drawn from n/20
+    templates and half of them repeat a template verbatim, like "Validate that the results update";
+    plan steps are noisy copies, so the true alignment is the identity. Streamed top-k scales to any n;
+    the full matrix (4*n*n bytes) and the one-to-one modes are only run up to `full_matrix_max`.
+    """
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        templates = normalize_rows(rng.standard_normal((max(n // 20, 1), dim)))
+        variant = (rng.random(n) < 0.5)[:, None] * normalize_rows(rng.standard_normal((n, dim)))
+        llm = normalize_rows(templates[rng.integers(0, len(templates), n)] + 0.3 * variant)
+        herc = normalize_rows(llm + 0.3 * normalize_rows(rng.standard_normal((n, dim))))
+        timings, accuracy = {}, {}
+
+        start = time.perf_counter()
+        candidates, _ = top_k(herc, llm, k)
+        timings[f"top{k}+argmax"] = time.perf_counter() - start
+        accuracy["argmax"] = float((candidates[:, 0] == np.arange(n)).mean())
+
+        if n <= full_matrix_max:
+            start = time.perf_counter()
+            sim = similarity_matrix(herc, llm)
+            timings["matrix"] = time.perf_counter() - start
+            for mode in ("hungarian", "monotone"):
+                if mode == "hungarian" and n > hungarian_max:
+                    continue  # O(n^3): use monotone for very large suites
+                start = time.perf_counter()
+                assignment = ASSIGNERS[mode](sim)
+                timings[mode] = time.perf_counter() - start
+                accuracy[mode] = float((assignment == np.arange(n)).mean())
+            del sim
+
+        print(f"📈 n={n:>6}: " + ", ".join(f"{name} {secs:.2f}s" for name, secs in timings.items())
+              + " | correct: " + ", ".join(f"{mode} {acc:.3f}" for mode, acc in accuracy.items()))
+
+
 def main():
+    cli = argparse.ArgumentParser(description="Align Hercules plan steps with LLM-verified steps")
+    cli.add_argument("--mode", choices=sorted(ASSIGNERS), default=MATCH_MODE)
+    cli.add_argument("--top-k", type=int, default=TOP_K)
+    cli.add_argument("--onnx-check", choices=["onnx", "onnx-int8"],
+                     help="compare an ONNX backend with PyTorch on the Hercules and LLM step texts")
+    cli.add_argument("--scale-demo", type=int, nargs="*", metavar="N",
+                     help="benchmark on synthetic n x n suites instead, e.g. --scale-demo 1000 10000 50000")
+    args = cli.parse_args()
+
+    if args.scale_demo is not None:
+        scaling_demo(args.scale_demo or [1000, 10000, 50000], k=args.top_k)
+        return
+
     hercules_steps = load_hercules_steps()
     llm_steps = load_llm_steps()
-    matches = match_steps(hercules_steps, llm_steps)
+    if args.onnx_check:
+        onnx_check(hercules_steps + [step["description"] for step in llm_steps], args.onnx_check)
+        return
+    matches = match_steps(hercules_steps, llm_steps, mode=args.mode, k=args.top_k)
     save_matches(matches)
 
     print("\n📊 Top Matches:")
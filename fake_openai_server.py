@@ -0,0 +1,113 @@
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Azure OpenAI chat completions endpoint.
+# Point the pipeline at it with:
+#   AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8089 AZURE_API_KEY=fake python azure_gpt.py <run_dir> ...
+
+CANNED_REPORT = {
+    "steps_aligned": [],
+    "steps_with_deviation": [],
+    "overall_alignment_status": "fake_server",
+    "final_result": "Response generated by fake_openai_server.py",
+}
+
+
+class FakeState:
+    def __init__(self, latency: float, fail_every: int, error_status: int):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.error_status = error_status
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(state: FakeState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, payload: dict, headers: dict = None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, val in (headers or {}).items():
+                self.send_header(key, val)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not self.path.split("?")[0].endswith("/chat/completions"):
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            with state.lock:
+                state.requests += 1
+                count = state.requests
+
+            time.sleep(state.latency)
+            if state.fail_every and count % state.fail_every == 0:
+                self._send(
+                    state.error_status,
+                    {"error": {"code": str(state.error_status), "message": "Injected failure"}},
+                    {"Retry-After": "0.1"},
+                )
+                return
+
+            prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+            content = json.dumps(CANNED_REPORT)
+            self._send(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_chars // 4,
+                    "completion_tokens": len(content) // 4,
+                    "total_tokens": prompt_chars // 4 + len(content) // 4,
+                },
+            })
+
+    return Handler
+
+
+def serve(port: int = 8089, latency: float = 0.2, fail_every: int = 0, error_status: int = 429) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread and return it (call .shutdown() to stop)."""
+    state = FakeState(latency, fail_every, error_status)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completions server")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds to sleep per request")
+    parser.add_argument("--fail-every", type=int, default=0, help="Fail every Nth request (0 = never)")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status for injected failures")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.fail_every, args.error_status)
+    print(f"🧪 Fake OpenAI server listening on http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
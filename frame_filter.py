@@ -0,0 +1,87 @@
+import os
+import sys
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image
+
+# ---------- Config ---------- #
+# Cheap pre-OCR filter for frames with nothing to read: blank white/black pages, transition frames and
+# loading spinners. Statistics are computed on a 320x180 grayscale copy (~1 ms per frame), so a skipped
+# frame costs nothing next to a 7B VLM generation. Thresholds are deliberately conservative: a
+# half-rendered page with only a nav bar (entropy ~0.2, edge density ~0.002) still goes to OCR.
+FRAME_FILTER = os.getenv("FRAME_FILTER", "1") == "1"
+UNIFORM_MAX_STD = float(os.getenv("FRAME_FILTER_MAX_STD", "1.5"))
+BLANK_MAX_ENTROPY = float(os.getenv("FRAME_FILTER_MAX_ENTROPY", "0.1"))
+BLANK_MAX_EDGE_DENSITY = float(os.getenv("FRAME_FILTER_MAX_EDGE_DENSITY", "0.0002"))
+SPINNER_MAX_AREA = float(os.getenv("FRAME_FILTER_SPINNER_MAX_AREA", "0.03"))
+
+STATS_SIZE = (320, 180)
+EDGE_THRESHOLD = 40  # |dx| + |dy| in gray levels
+
+BLANK_DESCRIPTION = "There is no text or UI elements visible in this frame."
+
+
+def filter_settings() -> Dict:
+    """Everything that decides which frames are skipped; part of the OCR results cache key."""
+    return {
+        "enabled": FRAME_FILTER,
+        "max_std": UNIFORM_MAX_STD,
+        "max_entropy": BLANK_MAX_ENTROPY,
+        "max_edge_density": BLANK_MAX_EDGE_DENSITY,
+        "spinner_max_area": SPINNER_MAX_AREA,
+        "stats_size": list(STATS_SIZE),
+        "edge_threshold": EDGE_THRESHOLD,
+    }
+
+
+def frame_stats(image: Image.Image) -> Dict[str, float]:
+    gray = np.asarray(image.convert("L").resize(STATS_SIZE, Image.BOX), dtype=np.int16)
+    hist = np.bincount(gray.ravel(), minlength=256) / gray.size
+    nonzero = hist[hist > 0]
+
+    dx = np.abs(np.diff(gray, axis=1))[:-1]
+    dy = np.abs(np.diff(gray, axis=0))[:, :-1]
+    edges = (dx + dy) > EDGE_THRESHOLD
+
+    # Bounding box of all edge pixels: a spinner is one small, roughly square blob
+    bbox_area, bbox_aspect = 0.0, 0.0
+    if edges.any():
+        rows, cols = np.where(edges.any(axis=1))[0], np.where(edges.any(axis=0))[0]
+        height, width = rows[-1] - rows[0] + 1, cols[-1] - cols[0] + 1
+        bbox_area = height * width / edges.size
+        bbox_aspect = width / height
+
+    return {
+        "entropy": float(-(nonzero * np.log2(nonzero)).sum()),
+        "edge_density": float(edges.mean()),
+        "std": float(gray.std()),
+        "dominant_ratio": float(hist.max()),
+        "edge_bbox_area": float(bbox_area),
+        "edge_bbox_aspect": float(bbox_aspect),
+    }
+
+
+def classify(stats: Dict[str, float]) -> Optional[str]:
+    """Reason to skip OCR for a frame ("uniform", "blank", "spinner"), or None if it may contain text."""
+    if stats["std"] <= UNIFORM_MAX_STD:
+        return "uniform"
+    if stats["entropy"] <= BLANK_MAX_ENTROPY and stats["edge_density"] <= BLANK_MAX_EDGE_DENSITY:
+        return "blank"
+    if 0 < stats["edge_bbox_area"] <= SPINNER_MAX_AREA and 0.5 <= stats["edge_bbox_aspect"] <= 2.0:
+        return "spinner"
+    return None
+
+
+def skip_reason(image: Image.Image) -> Optional[str]:
+    return classify(frame_stats(image)) if FRAME_FILTER else None
+
+
+if __name__ == "__main__":
+    # python frame_filter.py output/frames  -> prints the stats and verdict for every frame
+    folder = sys.argv[1] if len(sys.argv) > 1 else "output/frames"
+    for name in sorted(f for f in os.listdir(folder) if f.endswith(".jpg")):
+        stats = frame_stats(Image.open(os.path.join(folder, name)))
+        verdict = classify(stats)
+        print(f"{'⏭️ ' + verdict if verdict else '🖼️ ocr':<12} {name:<18} "
+              + " ".join(f"{k}={v:.3f}" for k, v in stats.items()))
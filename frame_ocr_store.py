@@ -0,0 +1,288 @@
+import argparse
+import difflib
+import os
+import random
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# ---------- Config ---------- #
+# Cross-run OCR store: nightly runs revisit the same screens, so OCR text is stored against a
+# perceptual hash of the frame and reused for any near-identical frame from any earlier run.
+# Lookup: 64-bit DCT pHash in a BK-tree (Hamming distance <= MAX_DISTANCE) finds candidates, then a
+# 256x144 grayscale thumbnail confirms them tile by tile (max per-tile mean abs difference <=
+# MAX_TILE_DIFF). pHash alone maps the same page with a different search term to one hash; the tile
+# check separates those while tolerating video compression noise. Single-glyph edits can still fall
+# under the threshold, which the drift sampling below is there to catch.
+# Expiry when the app UI changes:
+#   - entries are tagged with OCR_STORE_UI_VERSION and only match the same version
+#   - entries older than OCR_STORE_TTL_DAYS are ignored and removed by `expire`
+#   - a sample of hits (OCR_STORE_VERIFY_RATE) is re-transcribed; if the text drifted below
+#     OCR_STORE_DRIFT_RATIO similarity the entry is replaced with the fresh result
+STORE_DB = Path(os.getenv("OCR_STORE_DB", os.path.expanduser("~/.cache/medusa_watcher/ocr_store.sqlite")))
+STORE_MODE = os.getenv("OCR_STORE_MODE", "on")  # on / off
+UI_VERSION = os.getenv("OCR_STORE_UI_VERSION", "default")
+MAX_DISTANCE = int(os.getenv("OCR_STORE_MAX_DISTANCE", "4"))
+MAX_TILE_DIFF = float(os.getenv("OCR_STORE_MAX_TILE_DIFF", "4.0"))
+TTL_DAYS = float(os.getenv("OCR_STORE_TTL_DAYS", "14"))
+VERIFY_RATE = float(os.getenv("OCR_STORE_VERIFY_RATE", "0.05"))
+DRIFT_RATIO = float(os.getenv("OCR_STORE_DRIFT_RATIO", "0.8"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frame_ocr (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    settings_key TEXT NOT NULL,
+    ui_version   TEXT NOT NULL,
+    phash        TEXT NOT NULL,
+    thumbnail    BLOB NOT NULL,
+    text         TEXT NOT NULL,
+    source       TEXT,
+    created_at   REAL NOT NULL,
+    last_hit_at  REAL,
+    hit_count    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_frame_ocr_scope ON frame_ocr (settings_key, ui_version);
+"""
+
+
+# ---------- Perceptual Hashes ---------- #
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    m = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    m[0] *= 1 / np.sqrt(2)
+    return m * np.sqrt(2 / n)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(image: Image.Image) -> int:
+    """64-bit DCT perceptual hash: low 8x8 frequencies of a 32x32 grayscale, thresholded at the median."""
+    pixels = np.asarray(image.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT32 @ pixels @ _DCT32.T)[:8, :8].flatten()[1:]  # drop the DC term
+    bits = low > np.median(low)
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+THUMB_SIZE = (256, 144)
+TILE = 8
+
+
+def thumbnail(image: Image.Image) -> np.ndarray:
+    return np.asarray(image.convert("L").resize(THUMB_SIZE, Image.BOX), dtype=np.uint8)
+
+
+def tile_diff(a: np.ndarray, b: np.ndarray) -> float:
+    """Largest mean absolute difference over TILE x TILE tiles; localized changes (text) stand out."""
+    h, w = a.shape
+    diff = np.abs(a.astype(np.int16) - b.astype(np.int16))
+    return float(diff.reshape(h // TILE, TILE, w // TILE, TILE).mean(axis=(1, 3)).max())
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance: radius queries touch only a fraction of the keys."""
+
+    def __init__(self):
+        self.root = None  # [key, values, {distance: child}]
+        self.size = 0
+
+    def add(self, key: int, value):
+        self.size += 1
+        if self.root is None:
+            self.root = [key, [value], {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(key, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            if d not in node[2]:
+                node[2][d] = [key, [value], {}]
+                return
+            node = node[2][d]
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, object]]:
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(key, node[0])
+            if d <= radius:
+                results.extend((d, value) for value in node[1])
+            for child_d, child in node[2].items():
+                if d - radius <= child_d <= d + radius:
+                    stack.append(child)
+        return sorted(results, key=lambda r: r[0])
+
+
+# ---------- Store ---------- #
+
+class FrameOCRStore:
+    def __init__(self, settings_key: str, db_path: Path = STORE_DB, mode: str = STORE_MODE,
+                 ui_version: str = UI_VERSION, max_distance: int = MAX_DISTANCE,
+                 max_tile_diff: float = MAX_TILE_DIFF, ttl_days: float = TTL_DAYS,
+                 verify_rate: float = VERIFY_RATE, drift_ratio: float = DRIFT_RATIO):
+        if mode not in ("on", "off"):
+            raise ValueError(f"Unknown OCR store mode '{mode}', expected on/off")
+        self.settings_key = settings_key
+        self.db_path = Path(db_path)
+        self.mode = mode
+        self.ui_version = ui_version
+        self.max_distance = max_distance
+        self.max_tile_diff = max_tile_diff
+        self.ttl_s = ttl_days * 24 * 3600
+        self.verify_rate = verify_rate
+        self.drift_ratio = drift_ratio
+        self.metrics = {"lookups": 0, "hits": 0, "misses": 0, "verified": 0, "drifted": 0, "added": 0}
+        self.entries = {}  # id -> text; thumbnails stay in SQLite and are read only for pHash candidates
+        self.tree = BKTree()
+        self.conn = None
+        if mode == "on":
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+            self._load()
+
+    def _load(self):
+        rows = self.conn.execute(
+            "SELECT id, phash, text FROM frame_ocr WHERE settings_key = ? AND ui_version = ? AND created_at >= ?",
+            (self.settings_key, self.ui_version, time.time() - self.ttl_s),
+        )
+        for entry_id, ph, text in rows:
+            self.entries[entry_id] = text
+            self.tree.add(int(ph, 16), entry_id)
+
+    def _thumbnail(self, entry_id: int) -> np.ndarray:
+        (blob,) = self.conn.execute("SELECT thumbnail FROM frame_ocr WHERE id = ?", (entry_id,)).fetchone()
+        return np.frombuffer(blob, dtype=np.uint8).reshape(THUMB_SIZE[1], THUMB_SIZE[0])
+
+    # ---------- Lookup / Add ---------- #
+
+    def hashes(self, image: Image.Image) -> Tuple[int, np.ndarray]:
+        return phash(image), thumbnail(image)
+
+    def lookup(self, hashes: Tuple[int, np.ndarray]) -> Optional[Tuple[int, str]]:
+        """(entry_id, text) of the closest stored frame passing both the pHash and the tile check, or None."""
+        if self.mode == "off":
+            return None
+        self.metrics["lookups"] += 1
+        ph, thumb = hashes
+        best = None
+        for d, entry_id in self.tree.search(ph, self.max_distance):
+            if entry_id not in self.entries:
+                continue  # replaced after drift
+            td = tile_diff(thumb, self._thumbnail(entry_id))
+            if td <= self.max_tile_diff and (best is None or td < best[0]):
+                best = (td, entry_id, self.entries[entry_id])
+        if best is None:
+            self.metrics["misses"] += 1
+            return None
+        self.metrics["hits"] += 1
+        with self.conn:
+            self.conn.execute("UPDATE frame_ocr SET hit_count = hit_count + 1, last_hit_at = ? WHERE id = ?",
+                              (time.time(), best[1]))
+        return best[1], best[2]
+
+    def add(self, hashes: Tuple[int, np.ndarray], text: str, source: str = None) -> Optional[int]:
+        if self.mode == "off":
+            return None
+        ph, thumb = hashes
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO frame_ocr (settings_key, ui_version, phash, thumbnail, text, source, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.settings_key, self.ui_version, f"{ph:016x}", thumb.tobytes(), text, source, time.time()),
+            )
+        self.entries[cur.lastrowid] = text
+        self.tree.add(ph, cur.lastrowid)
+        self.metrics["added"] += 1
+        return cur.lastrowid
+
+    # ---------- Drift Verification ---------- #
+
+    def should_verify(self) -> bool:
+        return self.mode == "on" and random.random() < self.verify_rate
+
+    def verify(self, entry_id: int, hashes: Tuple[int, np.ndarray], fresh_text: str, source: str = None) -> bool:
+        """Compare a fresh transcription with a stored hit; replace the entry if the UI drifted. Returns drifted."""
+        self.metrics["verified"] += 1
+        stored = self.entries.get(entry_id, "")
+        if difflib.SequenceMatcher(None, stored, fresh_text).ratio() >= self.drift_ratio:
+            return False
+        self.metrics["drifted"] += 1
+        with self.conn:
+            self.conn.execute("DELETE FROM frame_ocr WHERE id = ?", (entry_id,))
+        self.entries.pop(entry_id, None)
+        self.add(hashes, fresh_text, source)
+        return True
+
+    # ---------- Maintenance ---------- #
+
+    def stats(self) -> Dict:
+        lookups = self.metrics["lookups"]
+        return {
+            **self.metrics,
+            "hit_rate": round(self.metrics["hits"] / lookups, 3) if lookups else 0.0,
+            "entries": len(self.entries),
+            "ui_version": self.ui_version,
+        }
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def expire(db_path: Path = STORE_DB, ttl_days: float = TTL_DAYS, keep_ui_version: str = None) -> int:
+    """Delete entries older than `ttl_days` and, with `keep_ui_version`, every entry from another UI version."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    with conn:
+        deleted = conn.execute("DELETE FROM frame_ocr WHERE created_at < ?", (time.time() - ttl_days * 24 * 3600,)).rowcount
+        if keep_ui_version is not None:
+            deleted += conn.execute("DELETE FROM frame_ocr WHERE ui_version != ?", (keep_ui_version,)).rowcount
+    conn.execute("VACUUM")
+    conn.close()
+    return deleted
+
+
+def summary(db_path: Path = STORE_DB) -> List[Tuple]:
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    rows = conn.execute("""
+        SELECT ui_version, COUNT(*), SUM(hit_count), MIN(created_at), MAX(COALESCE(last_hit_at, created_at))
+        FROM frame_ocr GROUP BY ui_version ORDER BY 5 DESC
+    """).fetchall()
+    conn.close()
+    return rows
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Cross-run OCR store keyed by perceptual frame hash")
+    cli.add_argument("--db", type=Path, default=STORE_DB)
+    sub = cli.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Entries and hits per UI version")
+    expire_cmd = sub.add_parser("expire", help="Drop old entries and entries from other UI versions")
+    expire_cmd.add_argument("--ttl-days", type=float, default=TTL_DAYS)
+    expire_cmd.add_argument("--keep-ui-version", help="Delete every entry not tagged with this UI version")
+    args = cli.parse_args()
+
+    if args.command == "expire":
+        print(f"🧹 Expired {expire(args.db, args.ttl_days, args.keep_ui_version)} entries from {args.db}")
+        return
+    print(f"{'ui_version':<20} {'entries':>8} {'hits':>8}  last used")
+    for ui_version, entries, hits, _, last_used in summary(args.db):
+        print(f"{ui_version:<20} {entries:>8} {hits or 0:>8}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# ---------- Config ---------- #
+# Frame hand-off between a decode process and inference processes without pickling pixels or going
+# through JPEG files. A FrameRing is one shared-memory block cut into fixed-size slots. The producer
+# copies a decoded frame into a free slot and sends only a FrameDescriptor (slot, shape, dtype, pts)
+# over a queue; the consumer maps the slot as a numpy view and hands the slot back when it is done.
+# The free-slot queue is the backpressure: with every slot in flight, put() blocks the decoder.
+RING_SLOTS = int(os.getenv("FRAME_RING_SLOTS", "8"))
+RING_SLOT_MB = float(os.getenv("FRAME_RING_SLOT_MB", "6"))  # one 1920x1080 BGR frame is 5.9 MiB
+RING_TIMEOUT_S = float(os.getenv("FRAME_RING_TIMEOUT_S", "120"))
+
+
+class FrameDescriptor(NamedTuple):
+    slot: int
+    shape: Tuple[int, ...]
+    dtype: str
+    pts: float
+
+
+class FrameRing:
+    """
+    Create in the parent process and pass to multiprocessing.Process args; children re-attach to the same
+    block by name. Any number of producers and consumers may share one ring. Only the creating process
+    unlinks the block (close()).
+    """
+
+    def __init__(self, slots: int = RING_SLOTS, slot_bytes: int = int(RING_SLOT_MB * 1024 ** 2), ctx=None):
+        ctx = ctx or mp.get_context()
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.name = self.shm.name
+        self.owner = True
+        self.free = ctx.Queue()
+        self.ready = ctx.Queue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.stats = {"frames": 0, "bytes": 0, "backpressure_s": 0.0}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["shm"]
+        state["owner"] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=self.name)
+
+    # ---------- Producer ---------- #
+
+    def put(self, frame: np.ndarray, pts: float, timeout: float = RING_TIMEOUT_S) -> FrameDescriptor:
+        """Copy `frame` into a free slot (blocking while all slots are in use) and publish its descriptor."""
+        if frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes does not fit a {self.slot_bytes}-byte slot")
+        start = time.perf_counter()
+        try:
+            slot = self.free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free frame slot within {timeout}s; is the consumer still running?")
+        self.stats["backpressure_s"] += time.perf_counter() - start
+
+        desc = FrameDescriptor(slot, tuple(frame.shape), frame.dtype.str, float(pts))
+        self.view(desc)[...] = frame
+        self.ready.put(desc)
+        self.stats["frames"] += 1
+        self.stats["bytes"] += frame.nbytes
+        return desc
+
+    def finish(self, consumers: int = 1):
+        """End of stream: one sentinel per consumer process."""
+        for _ in range(consumers):
+            self.ready.put(None)
+
+    # ---------- Consumer ---------- #
+
+    def view(self, desc: FrameDescriptor) -> np.ndarray:
+        return np.ndarray(desc.shape, dtype=np.dtype(desc.dtype), buffer=self.shm.buf,
+                          offset=desc.slot * self.slot_bytes)
+
+    def get(self, timeout: float = RING_TIMEOUT_S) -> Optional[FrameDescriptor]:
+        """Next descriptor, or None once the producer has finished."""
+        try:
+            return self.ready.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No frame within {timeout}s; is the producer still running?")
+
+    def release(self, slot: int):
+        self.free.put(slot)
+
+    def frames(self, timeout: float = RING_TIMEOUT_S) -> Iterator[Tuple[FrameDescriptor, np.ndarray]]:
+        """
+        Yield (descriptor, zero-copy view) until the end of stream. A slot is recycled as soon as the next
+        frame is requested, so copy (or convert) the view if it has to outlive the iteration.
+        """
+        desc = None
+        try:
+            while True:
+                desc = self.get(timeout)
+                if desc is None:
+                    return
+                yield desc, self.view(desc)
+                self.release(desc.slot)
+                desc = None
+        finally:
+            if desc is not None:
+                self.release(desc.slot)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ---------- Benchmark ---------- #
+# Decode process -> inference process, three ways: FrameRing descriptors, pickled arrays over an
+# mp.Queue, and JPEG files on disk with paths over an mp.Queue. The consumer touches every frame the
+# same way (a strided checksum) so each mode pays for actually reading the pixels.
+
+def _synthetic_frame(shape, idx: int) -> np.ndarray:
+    frame = np.full(shape, idx % 251, dtype=np.uint8)
+    frame[::32, ::32] = 255 - idx % 251
+    return frame
+
+
+def _touch(frame: np.ndarray) -> int:
+    return int(frame[::16, ::16].sum())
+
+
+def _produce(mode, channel, shape, count, tmp_dir, report):
+    import cv2
+    start = time.perf_counter()
+    for idx in range(count):
+        frame = _synthetic_frame(shape, idx)
+        if mode == "shm":
+            channel.put(frame, pts=idx)
+        elif mode == "pickle":
+            channel.put((frame, idx))
+        else:
+            path = os.path.join(tmp_dir, f"frame_{idx}.jpg")
+            cv2.imwrite(path, frame)
+            channel.put((path, idx))
+    if mode == "shm":
+        channel.finish()
+        report.put(("producer", time.perf_counter() - start, channel.stats["backpressure_s"]))
+    else:
+        channel.put(None)
+        report.put(("producer", time.perf_counter() - start, 0.0))
+
+
+def _consume(mode, channel, report):
+    import cv2
+    checksum = 0
+    if mode == "shm":
+        for _, view in channel.frames():
+            checksum += _touch(view)
+    else:
+        while True:
+            item = channel.get()
+            if item is None:
+                break
+            frame = item[0] if mode == "pickle" else cv2.imread(item[0])
+            checksum += _touch(frame)
+    report.put(("consumer", checksum, 0.0))
+
+
+def benchmark(count: int = 300, shape=(720, 1280, 3), slots: int = RING_SLOTS) -> dict:
+    import tempfile
+    results = {}
+    for mode in ("shm", "pickle", "disk"):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if mode == "shm":
+                channel = FrameRing(slots, int(np.prod(shape)))
+            else:
+                channel = mp.Queue(maxsize=slots)  # same in-flight bound as the ring
+            report = mp.Queue()
+            start = time.perf_counter()
+            workers = [mp.Process(target=_produce, args=(mode, channel, shape, count, tmp_dir, report)),
+                       mp.Process(target=_consume, args=(mode, channel, report))]
+            for worker in workers:
+                worker.start()
+            done = dict((role, (a, b)) for role, a, b in (report.get(), report.get()))
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            if mode == "shm":
+                channel.close()
+
+        mb = count * int(np.prod(shape)) / 1024 ** 2
+        results[mode] = {"seconds": round(elapsed, 3), "fps": round(count / elapsed, 1),
+                         "mb_per_s": round(mb / elapsed, 1)}
+        if mode == "shm":
+            results[mode]["producer_blocked_s"] = round(done["producer"][1], 3)
+        blocked = f" (decoder blocked on a full ring {done['producer'][1]:.2f}s)" if mode == "shm" else ""
+        print(f"🚚 {mode:<6}: {count} frames {shape} in {elapsed:.2f}s → {count / elapsed:7.1f} frames/s, "
+              f"{mb / elapsed:8.1f} MiB/s{blocked}")
+    return results
+
+
+if __name__ == "__main__":
+    # python frame_transport.py [frames] [height] [width]
+    import sys
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 720
+    width = int(sys.argv[3]) if len(sys.argv) > 3 else 1280
+    benchmark(frames, (height, width, 3))
@@ -1,33 +1,124 @@
 import cv2
 import os
 
+from video_cache import VideoCache
+
 # Load video
 video_path = "/data/shared/users/antara/rag/video/media/video.webm"
 output_dir = "/data/shared/users/antara/rag/video/output/frames"
-os.makedirs(output_dir, exist_ok=True)
+FRAME_INTERVAL_S = 3
+
+
+def frame_settings(interval_s=FRAME_INTERVAL_S):
+    # Everything that changes the extracted frames; part of the video cache key
+    return {"interval_s": interval_s, "extractor": "cv2", "format": "jpg", "naming": "frame_<sec>s"}
+
+
+def extract_frames(video_path, output_dir, interval_s=FRAME_INTERVAL_S):
+    """Save one JPEG every `interval_s` seconds of video as frame_<sec>s.jpg; returns the paths."""
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Open the video
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = int(fps * interval_s)
+
+    frame_count = 0
+    saved_frames = []
+
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        if frame_count % frame_interval == 0:
+            timestamp_sec = int(frame_count / fps)
+            frame_filename = f"frame_{timestamp_sec}s.jpg"
+            frame_path = os.path.join(output_dir, frame_filename)
+            cv2.imwrite(frame_path, frame)
+            saved_frames.append(frame_path)
+
+        frame_count += 1
+
+    cap.release()
+    return saved_frames
+
+
+def extract_frames_in_window(video_path, output_dir, start_s, end_s, interval_s):
+    """
+    Save one JPEG every `interval_s` seconds within [start_s, end_s], same naming as extract_frames.
+    Seeks to the window instead of decoding from the start; frames already on disk are left alone.
+    Returns the paths of newly written frames. Names have one-second resolution, so `interval_s` is at least 1.
+    """
+    interval_s = max(interval_s, 1)
+    os.makedirs(output_dir, exist_ok=True)
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_MSEC, max(start_s, 0) * 1000)
+
+    new_frames = []
+    next_target = start_s
+    while cap.grab():
+        timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if timestamp > end_s:
+            break
+        if timestamp + 1e-3 < next_target:
+            continue
+        frame_path = os.path.join(output_dir, f"frame_{int(timestamp)}s.jpg")
+        if not os.path.exists(frame_path):
+            ret, frame = cap.retrieve()
+            if ret:
+                cv2.imwrite(frame_path, frame)
+                new_frames.append(frame_path)
+        next_target = timestamp + interval_s
+
+    cap.release()
+    return new_frames
+
+
+def stream_frames(video_path, ring, interval_s=FRAME_INTERVAL_S, consumers=1):
+    """
+    extract_frames() into a frame_transport.FrameRing instead of JPEG files: one decoded BGR frame every
+    `interval_s` seconds, published with its timestamp. Run it in a decode process; blocks while the ring is full.
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = int(fps * interval_s)
 
-# Open the video
-cap = cv2.VideoCapture(video_path)
-fps = cap.get(cv2.CAP_PROP_FPS)
-frame_interval = int(fps * 3)  
+    frame_count = 0
+    sent = 0
+    try:
+        while cap.isOpened():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame_count % frame_interval == 0:
+                ring.put(frame, pts=frame_count / fps)
+                sent += 1
+            frame_count += 1
+    finally:
+        cap.release()
+        ring.finish(consumers)
+    return sent
 
-frame_count = 0
-saved_frames = []
 
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
-        break
+def frames_from_ring(ring):
+    """Consumer side of stream_frames: (frame_<sec>s.jpg name, RGB PIL image) pairs; each slot is freed right away."""
+    from PIL import Image
+    for desc, view in ring.frames():
+        # cvtColor writes a new array, so the slot can be recycled as soon as this returns
+        yield f"frame_{int(desc.pts)}s.jpg", Image.fromarray(cv2.cvtColor(view, cv2.COLOR_BGR2RGB))
 
-    if frame_count % frame_interval == 0:
-        timestamp_sec = int(frame_count / fps)
-        frame_filename = f"frame_{timestamp_sec}s.jpg"
-        frame_path = os.path.join(output_dir, frame_filename)
-        cv2.imwrite(frame_path, frame)
-        saved_frames.append(frame_path)
 
-    frame_count += 1
+def extract_frames_cached(video_path, output_dir, interval_s=FRAME_INTERVAL_S, cache=None):
+    """extract_frames(), skipped entirely when this exact recording was already decoded with these settings."""
+    cache = cache or VideoCache()
+    saved_frames, _ = cache.frames(
+        video_path, output_dir, frame_settings(interval_s),
+        lambda: extract_frames(video_path, output_dir, interval_s),
+    )
+    return saved_frames
 
-cap.release()
 
-saved_frames[:5]  # Show first few saved frame paths for confirmation
+if __name__ == "__main__":
+    saved_frames = extract_frames_cached(video_path, output_dir)
+    print(saved_frames[:5])  # Show first few saved frame paths for confirmation
@@ -0,0 +1,526 @@
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+
+import batch_pipeline as bp
+from video_cache import VideoCache, read_manifest
+
+# Multi-node work distribution over a shared (NFS) directory.
+#   python job_queue.py submit runs.jsonl --out /mnt/shared/runs --chunked     # once, from any node
+#   python job_queue.py worker                                                 # on every node
+#   python job_queue.py status
+#   python job_queue.py local runs.jsonl --workers 4                           # N local processes as "nodes"
+#   python job_queue.py demo --workers 4                                       # crash/re-queue check, no models
+#
+# Queue layout (one JSON file per job, every state change is a single atomic rename):
+#   pending/<job>.json                  claimable once every id in job["after"] is in done/
+#   leased/<job>@<worker>@<expires>.json  claimed; the expiry lives in the name, heartbeats rename it forward
+#   staging/                            files in transit, owned by whoever renamed them there
+#   done/<job>.json, failed/<job>.json
+# Only rename is relied on for mutual exclusion because SQLite/fcntl locking is not dependable on
+# NFS. Node clocks are compared through lease expiries, so keep them NTP-synced and the lease long
+# relative to any skew.
+
+QUEUE_DIR = Path(os.getenv("JOB_QUEUE_DIR", "output/job_queue"))
+LEASE_S = float(os.getenv("JOB_LEASE_S", "300"))
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+POLL_S = float(os.getenv("JOB_POLL_S", "2"))
+
+OCR_CHUNK_FRAMES = int(os.getenv("JOB_OCR_CHUNK_FRAMES", "20"))
+DETECTIVE_CHUNK_STEPS = int(os.getenv("JOB_DETECTIVE_CHUNK_STEPS", "5"))
+CHUNK_DIR = Path("output/chunks")
+
+STATES = ["pending", "leased", "staging", "done", "failed"]
+
+
+def job_id_for(*parts) -> str:
+    return ".".join(str(p) for p in parts).replace(os.sep, "__").replace("@", "_")
+
+
+class LeaseLost(RuntimeError):
+    """The lease expired and was reaped (or renewed by nobody) while the job was running."""
+
+
+# ---------- Queue ---------- #
+
+class FileLeaseQueue:
+    def __init__(self, root: Path = QUEUE_DIR, lease_s: float = LEASE_S, max_attempts: int = MAX_ATTEMPTS):
+        self.root = Path(root)
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        for state in STATES:
+            (self.root / state).mkdir(parents=True, exist_ok=True)
+
+    def _dir(self, state: str) -> Path:
+        return self.root / state
+
+    @staticmethod
+    def _read(path: Path) -> dict:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write(self, job: dict, dst: Path):
+        """Write via staging so readers never see a partial file under a claimable name."""
+        tmp_path = self._dir("staging") / f"{dst.name}.{socket.gethostname()}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, indent=2)
+        os.replace(tmp_path, dst)
+
+    def _own(self, path: Path) -> Path:
+        """Atomically take exclusive ownership of a queue file; raises FileNotFoundError if someone else won."""
+        # rename keeps the old mtime, so the ownership time goes in the name for the staging reaper
+        owned = self._dir("staging") / f"{path.name}@{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}@{time.time():.3f}"
+        os.rename(path, owned)
+        return owned
+
+    @staticmethod
+    def _lease_name(job_id: str, worker: str, expires: float) -> str:
+        return f"{job_id}@{worker}@{expires:.3f}.json"
+
+    @staticmethod
+    def _parse_lease(path: Path):
+        job_id, worker, expires = path.name[:-len(".json")].rsplit("@", 2)
+        return job_id, worker, float(expires)
+
+    def exists(self, job_id: str) -> bool:
+        if any((self._dir(s) / f"{job_id}.json").exists() for s in ("pending", "done", "failed")):
+            return True
+        return any(self._dir("leased").glob(f"{job_id}@*.json"))
+
+    # ---------- Producer ---------- #
+
+    def submit(self, job: dict) -> bool:
+        """Enqueue a job unless one with the same id exists in any state (submission is idempotent)."""
+        if self.exists(job["id"]):
+            return False
+        job.setdefault("after", [])
+        job.setdefault("attempts", 0)
+        job["submitted_at"] = time.time()
+        self._write(job, self._dir("pending") / f"{job['id']}.json")
+        return True
+
+    # ---------- Consumer ---------- #
+
+    def claim(self, worker: str):
+        """Lease the first pending job whose dependencies are done. Returns (job, lease_path) or None."""
+        done = {p.stem for p in self._dir("done").iterdir()}
+        failed = {p.stem for p in self._dir("failed").iterdir()}
+        for path in sorted(self._dir("pending").glob("*.json")):
+            try:
+                job = self._read(path)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            blocked_by = [dep for dep in job.get("after", []) if dep in failed]
+            if blocked_by:
+                self._finish_unclaimed(path, job, f"dependency failed: {', '.join(blocked_by)}")
+                continue
+            if any(dep not in done for dep in job.get("after", [])):
+                continue
+            lease_path = self._dir("leased") / self._lease_name(job["id"], worker, time.time() + self.lease_s)
+            try:
+                os.rename(path, lease_path)
+            except FileNotFoundError:
+                continue  # another node claimed it first
+            return job, lease_path
+        return None
+
+    def _finish_unclaimed(self, path: Path, job: dict, error: str):
+        try:
+            owned = self._own(path)
+        except FileNotFoundError:
+            return
+        job["error"] = error
+        self._write(job, self._dir("failed") / f"{job['id']}.json")
+        owned.unlink()
+
+    def renew(self, lease_path: Path, worker: str) -> Path:
+        """Heartbeat: move the lease expiry forward. Raises LeaseLost if it was reaped meanwhile."""
+        job_id, _, _ = self._parse_lease(lease_path)
+        new_path = self._dir("leased") / self._lease_name(job_id, worker, time.time() + self.lease_s)
+        try:
+            os.rename(lease_path, new_path)
+        except FileNotFoundError:
+            raise LeaseLost(job_id)
+        return new_path
+
+    def complete(self, lease_path: Path, result: dict = None):
+        try:
+            owned = self._own(lease_path)
+        except FileNotFoundError:
+            raise LeaseLost(lease_path.name)
+        job = self._read(owned)
+        job.update({"result": result or {}, "finished_at": time.time(), "worker": self._parse_lease(lease_path)[1]})
+        self._write(job, self._dir("done") / f"{job['id']}.json")
+        owned.unlink()
+
+    def fail(self, lease_path: Path, error: str):
+        """Count a failed attempt; re-queue the job, or park it in failed/ after max_attempts."""
+        try:
+            owned = self._own(lease_path)
+        except FileNotFoundError:
+            raise LeaseLost(lease_path.name)
+        self._retry_or_fail(owned, error)
+
+    def _retry_or_fail(self, owned: Path, error: str):
+        job = self._read(owned)
+        job["attempts"] = job.get("attempts", 0) + 1
+        job.setdefault("errors", []).append(error)
+        state = "failed" if job["attempts"] >= self.max_attempts else "pending"
+        self._write(job, self._dir(state) / f"{job['id']}.json")
+        owned.unlink()
+
+    def reap_expired(self) -> int:
+        """Re-queue jobs whose lease ran out (crashed or hung node); returns how many were reaped."""
+        now = time.time()
+        reaped = 0
+        for path in self._dir("leased").glob("*.json"):
+            try:
+                job_id, worker, expires = self._parse_lease(path)
+            except ValueError:
+                continue
+            if expires > now:
+                continue
+            try:
+                owned = self._own(path)
+            except FileNotFoundError:
+                continue  # renewed or reaped by another node
+            self._retry_or_fail(owned, f"lease expired on worker {worker}")
+            print(f"♻️ Re-queued {job_id} (lease held by {worker} expired)")
+            reaped += 1
+
+        # A node that died between _own() and the final rename leaves its file in staging/
+        for path in self._dir("staging").iterdir():
+            try:
+                if path.name.endswith(".tmp"):
+                    if now - path.stat().st_mtime > self.lease_s:
+                        path.unlink()
+                    continue
+                if now - float(path.name.rsplit("@", 1)[1]) <= self.lease_s:
+                    continue
+                owned = self._own(path)
+                job = self._read(owned)
+                if not self.exists(job["id"]):
+                    self._write(job, self._dir("pending") / f"{job['id']}.json")
+                owned.unlink()
+                reaped += 1
+            except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError, IndexError):
+                continue
+        return reaped
+
+    # ---------- Status ---------- #
+
+    def counts(self) -> dict:
+        return {state: sum(1 for p in self._dir(state).iterdir()) for state in STATES}
+
+    def drained(self) -> bool:
+        counts = self.counts()
+        return counts["pending"] == 0 and counts["leased"] == 0 and counts["staging"] == 0
+
+
+# ---------- Job Kinds ---------- #
+
+def _chunk_path(run_dir: Path, what: str, start: int, end: int) -> Path:
+    return run_dir / CHUNK_DIR / f"{what}_{start:05d}_{end:05d}.json"
+
+
+def chunk_jobs(queue: FileLeaseQueue, run_id: str, run_dir: Path, frame_count: int, step_count: int,
+               ocr_chunk: int = OCR_CHUNK_FRAMES, step_chunk: int = DETECTIVE_CHUNK_STEPS,
+               after: list = None, ocr_cached: bool = False) -> list:
+    """
+    Fan a prepared run out into OCR frame-range and detective step-range jobs plus their merges.
+    With `ocr_cached` the OCR results are already in place and the OCR jobs are left out.
+    """
+    jobs = []
+    ocr_ids = []
+    ocr_chunks = []
+    if ocr_cached:
+        ocr_merge = (after or [None])[0]
+    else:
+        for start in range(0, frame_count, ocr_chunk):
+            end = min(start + ocr_chunk, frame_count)
+            ocr_ids.append(job_id_for(run_id, "ocr", f"{start:05d}"))
+            ocr_chunks.append([start, end])
+            jobs.append({"id": ocr_ids[-1], "kind": "ocr_chunk", "run_dir": str(run_dir),
+                         "start": start, "end": end, "after": list(after or [])})
+        ocr_merge = job_id_for(run_id, "ocr", "merge")
+        jobs.append({"id": ocr_merge, "kind": "merge", "run_dir": str(run_dir), "what": "ocr",
+                     "chunks": ocr_chunks, "after": ocr_ids})
+
+    detective_ids = []
+    detective_chunks = []
+    for start in range(0, step_count, step_chunk):
+        end = min(start + step_chunk, step_count)
+        detective_ids.append(job_id_for(run_id, "detective", f"{start:05d}"))
+        detective_chunks.append([start, end])
+        jobs.append({"id": detective_ids[-1], "kind": "detective_chunk", "run_dir": str(run_dir),
+                     "start": start, "end": end, "after": [ocr_merge] if ocr_merge else []})
+    detective_merge = job_id_for(run_id, "detective", "merge")
+    jobs.append({"id": detective_merge, "kind": "merge", "run_dir": str(run_dir), "what": "detective",
+                 "chunks": detective_chunks, "after": detective_ids or ([ocr_merge] if ocr_merge else [])})
+    jobs.append({"id": job_id_for(run_id, "report"), "kind": "stages", "run_dir": str(run_dir),
+                 "stages": ["refine", "postprocess", "deviation"], "after": [detective_merge]})
+
+    for job in jobs:
+        queue.submit(job)
+    return jobs
+
+
+def _ocr_cache_key(run_dir: Path):
+    import ocr
+    manifest = read_manifest(run_dir / bp.FRAMES_DIR)
+    return VideoCache().ocr_key(manifest["frames_key"], ocr.OCR_SETTINGS) if manifest else None
+
+
+def _cached_ocr(run_dir: Path) -> bool:
+    """Write the run's OCR results from the video cache if this recording was already transcribed."""
+    key = _ocr_cache_key(run_dir)
+    results = VideoCache().get_ocr(key) if key else None
+    if results is None:
+        return False
+    import ocr
+    ocr.save_results(results, str(run_dir / bp.OCR_RESULTS))
+    return True
+
+
+def _store_ocr(run_dir: Path, results: list):
+    key = _ocr_cache_key(run_dir)
+    if key:
+        VideoCache().put_ocr(key, results)
+
+
+def execute(job: dict, queue: FileLeaseQueue, models: bp.SharedModels) -> dict:
+    kind = job["kind"]
+    run_dir = Path(job.get("run_dir", "."))
+
+    if kind == "stages":
+        for stage in job["stages"]:
+            if stage in bp.CPU_STAGES:
+                bp.STAGE_FUNCS[stage](run_dir)
+            else:
+                bp.STAGE_FUNCS[stage](run_dir, models)
+        return {"stages": job["stages"]}
+
+    if kind == "prepare":
+        bp.stage_parse(run_dir)
+        bp.stage_frames(run_dir, stream_ocr=False)  # OCR chunks are frame ranges of the JPEGs
+        frame_count = len(list((run_dir / bp.FRAMES_DIR).glob("*.jpg")))
+        with open(run_dir / bp.SUMMARY_JSON, "r", encoding="utf-8") as f:
+            step_count = len(json.load(f))
+        ocr_cached = _cached_ocr(run_dir)
+        chunk_jobs(queue, job["run_id"], run_dir, frame_count, step_count,
+                   job.get("ocr_chunk", OCR_CHUNK_FRAMES), job.get("step_chunk", DETECTIVE_CHUNK_STEPS),
+                   after=[job["id"]], ocr_cached=ocr_cached)
+        return {"frames": frame_count, "steps": step_count, "ocr_cached": ocr_cached}
+
+    if kind == "ocr_chunk":
+        import ocr
+        model, processor = models.get("ocr")
+        results = ocr.ocr_frames(model, processor, str(run_dir / bp.FRAMES_DIR), job["start"], job["end"],
+                                 store=models.get("ocr_store"))
+        ocr.save_results(results, str(_chunk_path(run_dir, "ocr", job["start"], job["end"])))
+        return {"frames": len(results)}
+
+    if kind == "detective_chunk":
+        import detective
+        with open(run_dir / bp.SUMMARY_JSON, "r", encoding="utf-8") as f:
+            steps = json.load(f)[job["start"]:job["end"]]
+        with open(run_dir / bp.OCR_RESULTS, "r", encoding="utf-8") as f:
+            frames = json.load(f)
+        chunk_output = str(_chunk_path(run_dir, "detective", job["start"], job["end"]))
+        from screen_segments import SCREEN_SEGMENTS, segment_frames
+        if SCREEN_SEGMENTS:
+            # Deterministic and cheap, so every chunk recomputes the same segmentation
+            segmentation = segment_frames(run_dir / bp.FRAMES_DIR, frames)
+            detective.verify_steps_by_segment(models.get("detective"), steps, frames, segmentation,
+                                              chunk_output, start_no=job["start"] + 1)
+        else:
+            detective.verify_steps(models.get("detective"), steps, frames, chunk_output, start_no=job["start"] + 1)
+        return {"steps": len(steps)}
+
+    if kind == "merge":
+        target = bp.OCR_RESULTS if job["what"] == "ocr" else bp.STEP_VERIFICATION
+        # Exactly this fan-out's chunks: files left by an earlier enqueue with another chunk size would overlap
+        chunks = [_chunk_path(run_dir, job["what"], start, end) for start, end in job["chunks"]]
+        missing = [chunk.name for chunk in chunks if not chunk.exists()]
+        if missing:
+            raise FileNotFoundError(f"Missing {job['what']} chunk results in {run_dir / CHUNK_DIR}: {missing}")
+        merged = []
+        for chunk in chunks:
+            with open(chunk, "r", encoding="utf-8") as f:
+                merged.extend(json.load(f))
+        (run_dir / target).parent.mkdir(parents=True, exist_ok=True)
+        with open(run_dir / target, "w", encoding="utf-8") as f:
+            json.dump(merged, f, indent=2)
+        if job["what"] == "ocr":
+            _store_ocr(run_dir, merged)
+        return {"items": len(merged)}
+
+    if kind == "sleep":  # used by `demo`
+        time.sleep(job["seconds"])
+        return {"slept": job["seconds"]}
+
+    raise ValueError(f"Unknown job kind '{kind}'")
+
+
+# ---------- Worker ---------- #
+
+class Worker:
+    def __init__(self, queue: FileLeaseQueue, worker_id: str = None):
+        self.queue = queue
+        self.worker_id = (worker_id or f"{socket.gethostname()}-{os.getpid()}").replace("@", "_")
+        self.models = bp.SharedModels()  # loaded once per node, reused by every job it claims
+        self.processed = 0
+
+    def _heartbeat(self, state: dict, stop: threading.Event):
+        while not stop.wait(self.queue.lease_s / 3):
+            with state["lock"]:
+                try:
+                    state["lease"] = self.queue.renew(state["lease"], self.worker_id)
+                except LeaseLost:
+                    state["lost"] = True
+                    return
+
+    def run_one(self) -> bool:
+        claimed = self.queue.claim(self.worker_id)
+        if claimed is None:
+            return False
+        job, lease_path = claimed
+        print(f"🔧 {self.worker_id} claimed {job['id']} ({job['kind']}, attempt {job.get('attempts', 0) + 1})")
+
+        state = {"lease": lease_path, "lost": False, "lock": threading.Lock()}
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(state, stop), daemon=True)
+        heartbeat.start()
+        start = time.perf_counter()
+        try:
+            result = execute(job, self.queue, self.models)
+            error = None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+        stop.set()
+        heartbeat.join()
+
+        with state["lock"]:
+            try:
+                if error is None:
+                    self.queue.complete(state["lease"], {**result, "seconds": round(time.perf_counter() - start, 2)})
+                    print(f"✅ {self.worker_id} finished {job['id']} in {time.perf_counter() - start:.1f}s")
+                else:
+                    self.queue.fail(state["lease"], error)
+                    print(f"❌ {self.worker_id} failed {job['id']}: {error}")
+            except LeaseLost:
+                print(f"⚠️ {self.worker_id} lost the lease on {job['id']}; result discarded, another node will redo it")
+        self.processed += 1
+        return True
+
+    def run(self, poll_s: float = POLL_S, exit_when_drained: bool = False):
+        print(f"👷 Worker {self.worker_id} polling {self.queue.root}")
+        while True:
+            self.queue.reap_expired()
+            if self.run_one():
+                continue
+            if exit_when_drained and self.queue.drained():
+                print(f"🏁 {self.worker_id}: queue drained after {self.processed} jobs")
+                return
+            time.sleep(poll_s)
+
+
+def _worker_process(queue_dir: str, lease_s: float, worker_id: str, poll_s: float):
+    queue = FileLeaseQueue(Path(queue_dir), lease_s)
+    Worker(queue, worker_id).run(poll_s, exit_when_drained=True)
+
+
+def run_local_workers(queue: FileLeaseQueue, workers: int, poll_s: float = 0.5, kill_after_s: float = None):
+    """Start `workers` local processes standing in for nodes; optionally SIGKILL one mid-batch."""
+    procs = [
+        multiprocessing.Process(target=_worker_process, args=(str(queue.root), queue.lease_s, f"local{i}", poll_s))
+        for i in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    if kill_after_s is not None:
+        time.sleep(kill_after_s)
+        os.kill(procs[0].pid, signal.SIGKILL)
+        print(f"💥 Killed worker local0 (pid {procs[0].pid}) to simulate a crashed node")
+    for proc in procs:
+        proc.join()
+
+
+# ---------- Submission ---------- #
+
+def submit_manifest(queue: FileLeaseQueue, entries: list, output_root: Path, chunked: bool = False,
+                    ocr_chunk: int = OCR_CHUNK_FRAMES, step_chunk: int = DETECTIVE_CHUNK_STEPS) -> int:
+    submitted = 0
+    for entry in entries:
+        run_dir = bp.prepare_run_dir(entry, Path(output_root))
+        if chunked:
+            job = {"id": job_id_for(entry["run_id"], "prepare"), "kind": "prepare", "run_id": entry["run_id"],
+                   "run_dir": str(run_dir), "ocr_chunk": ocr_chunk, "step_chunk": step_chunk}
+        else:
+            job = {"id": job_id_for(entry["run_id"], "run"), "kind": "stages", "run_dir": str(run_dir),
+                   "stages": bp.STAGES}
+        submitted += queue.submit(job)
+    print(f"📬 Submitted {submitted} jobs to {queue.root}")
+    return submitted
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Distribute pipeline jobs across nodes through a shared lease queue")
+    cli.add_argument("--queue", type=Path, default=QUEUE_DIR, help="Queue directory on the shared mount")
+    cli.add_argument("--lease-s", type=float, default=LEASE_S)
+    sub = cli.add_subparsers(dest="command", required=True)
+
+    for name in ("submit", "local"):
+        cmd = sub.add_parser(name, help="Enqueue runs" if name == "submit" else "Enqueue runs and work them locally")
+        cmd.add_argument("manifest", type=Path)
+        cmd.add_argument("--out", type=Path, default=bp.OUTPUT_ROOT)
+        cmd.add_argument("--chunked", action="store_true", help="Split OCR by frame range and verification by step range")
+        cmd.add_argument("--ocr-chunk", type=int, default=OCR_CHUNK_FRAMES)
+        cmd.add_argument("--step-chunk", type=int, default=DETECTIVE_CHUNK_STEPS)
+        if name == "local":
+            cmd.add_argument("--workers", type=int, default=2)
+
+    worker_cmd = sub.add_parser("worker", help="Claim and run jobs until stopped")
+    worker_cmd.add_argument("--worker-id")
+    worker_cmd.add_argument("--poll-s", type=float, default=POLL_S)
+    worker_cmd.add_argument("--exit-when-drained", action="store_true")
+
+    sub.add_parser("status", help="Job counts per state")
+
+    demo_cmd = sub.add_parser("demo", help="Sleep jobs on local workers, one of which is killed mid-batch")
+    demo_cmd.add_argument("--workers", type=int, default=3)
+    demo_cmd.add_argument("--jobs", type=int, default=12)
+    args = cli.parse_args()
+
+    if args.command == "demo":
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = FileLeaseQueue(Path(tmp), lease_s=2.0)
+            for i in range(args.jobs):
+                queue.submit({"id": f"sleep.{i:03d}", "kind": "sleep", "seconds": 0.5})
+            start = time.perf_counter()
+            run_local_workers(queue, args.workers, poll_s=0.2, kill_after_s=0.7)
+            counts = queue.counts()
+            print(f"📊 {counts['done']}/{args.jobs} done, {counts['failed']} failed in {time.perf_counter() - start:.1f}s: {counts}")
+        return
+
+    queue = FileLeaseQueue(args.queue, args.lease_s)
+    if args.command in ("submit", "local"):
+        submit_manifest(queue, bp.load_manifest(args.manifest), args.out, args.chunked, args.ocr_chunk, args.step_chunk)
+        if args.command == "local":
+            run_local_workers(queue, args.workers)
+            print(f"📊 {queue.counts()}")
+    elif args.command == "worker":
+        Worker(queue, args.worker_id).run(args.poll_s, args.exit_when_drained)
+    else:
+        print(json.dumps(queue.counts(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import importlib
+import json
+import os
+import time
+from pathlib import Path
+
+import parser as log_parser
+from adaptive_sampling import frame_time
+from batch_pipeline import (
+    FRAMES_DIR, LOG_FILE, OCR_RESULTS, SUMMARY_JSON, CSV_REPORT, STAGE_RETRIES, STEP_VERIFICATION, TEST_REPORT,
+    VERIFICATION_REPORT, VIDEO_FILE, RunStatus, SharedModels, prepare_run_dir, run_with_retries,
+)
+
+# Follows a Hercules run while it is still recording and verifies steps as their evidence arrives.
+#   python live_watch.py --log .../agent_inner_logs.json --video .../video.webm --report .../test_result.html \
+#       --out output/live --run-id run_01
+#
+# Every poll re-streams the growing agent log (parser.iter_log stops cleanly at the half-written tail, so
+# only complete planner exchanges become steps) and extracts frames from the growing recording after the
+# last one taken. New frames are OCR'd, every step is checked only against frames it has not been checked
+# against yet, and summary.json / OCR results / step verification / report are rewritten after each round.
+# Without --video, frames written into <run>/output/frames by an external capture are picked up instead.
+# The run counts as finished when test_result.html appears or nothing has grown for LIVE_IDLE_S; one last
+# round then covers the tail and the remaining batch stages (refine, postprocess, deviation) run as usual.
+# The run directory uses the batch_pipeline layout and status.json, so batch_pipeline can resume it.
+
+LIVE_POLL_S = float(os.getenv("LIVE_POLL_S", "2"))
+LIVE_IDLE_S = float(os.getenv("LIVE_IDLE_S", "60"))
+LIVE_INTERVAL_S = float(os.getenv("LIVE_INTERVAL_S", "3"))
+# Externally written frames younger than this may still be mid-write
+LIVE_SETTLE_S = float(os.getenv("LIVE_SETTLE_S", "1"))
+LIVE_OUTPUT_ROOT = Path(os.getenv("LIVE_OUTPUT_ROOT", "output/live_runs"))
+
+FINAL_STAGES = ["refine", "postprocess", "deviation"]
+PARTIAL_JSON_ERRORS = (ValueError,) + ((log_parser.ijson.JSONError,) if log_parser.ijson else ())
+
+
+# ---------- Sources ---------- #
+
+def _signature(path: Path):
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def complete_steps(log_path: Path) -> list:
+    """Steps whose planner/user exchange is fully written; a truncated tail just ends the stream."""
+    steps = []
+    try:
+        for step in log_parser.parse_steps(log_parser.iter_log(log_path)):
+            steps.append(step)
+    except PARTIAL_JSON_ERRORS:
+        pass
+    return steps
+
+
+class LiveRun:
+    def __init__(self, run_dir: Path, models: SharedModels, interval_s: float = LIVE_INTERVAL_S,
+                 extract_video: bool = True):
+        self.run_dir = Path(run_dir)
+        self.models = models
+        self.interval_s = interval_s
+        self.extract_video = extract_video
+        self.frames_dir = self.run_dir / FRAMES_DIR
+        self.frames_dir.mkdir(parents=True, exist_ok=True)
+        (self.run_dir / STEP_VERIFICATION).parent.mkdir(parents=True, exist_ok=True)
+
+        self.steps = []
+        self.frames = {}    # frame name -> OCR result
+        self.checked = {}   # step_id -> frame names already verified against it
+        self.refs = {}      # step_id -> matched frame refs
+        self.literal = set()  # step_ids with literal-index matches
+        self.next_frame_s = 0.0
+        self.signatures = {}
+        self.last_growth = time.time()
+        self.metrics = {"rounds": 0, "frames": 0, "steps": 0, "checks": 0}
+
+    # ---------- Polling ---------- #
+
+    def _grew(self, path: Path) -> bool:
+        signature = _signature(path)
+        if signature is None or signature == self.signatures.get(path):
+            return False
+        self.signatures[path] = signature
+        self.last_growth = time.time()
+        return True
+
+    def poll_steps(self) -> int:
+        if not self._grew(self.run_dir / LOG_FILE):
+            return 0
+        steps = complete_steps(self.run_dir / LOG_FILE)
+        new = len(steps) - len(self.steps)
+        if new > 0:
+            self.steps = steps
+            print(f"📜 {new} new step(s), {len(self.steps)} so far")
+        return max(new, 0)
+
+    def poll_frames(self) -> list:
+        video_path = self.run_dir / VIDEO_FILE
+        if self.extract_video and self._grew(video_path):
+            import frames
+            written = frames.extract_frames_in_window(
+                str(video_path), str(self.frames_dir), self.next_frame_s, float("inf"), self.interval_s
+            )
+            if written:
+                self.next_frame_s = max(frame_time(p) for p in written) + self.interval_s
+
+        now = time.time()
+        settle_s = 0 if self.extract_video else LIVE_SETTLE_S  # our own frames are complete once written
+        new = sorted((name for name in os.listdir(self.frames_dir)
+                      if name.endswith(".jpg") and name not in self.frames
+                      and now - os.path.getmtime(self.frames_dir / name) >= settle_s), key=frame_time)
+        if new and not self.extract_video:
+            self.last_growth = now
+        return new
+
+    # ---------- Incremental OCR & Verification ---------- #
+
+    def ocr(self, names: list):
+        import ocr
+        results = ocr.ocr_frames(*self.models.get("ocr"), str(self.frames_dir), store=self.models.get("ocr_store"),
+                                 names=names)
+        for result in results:
+            self.frames[result["frame"]] = result
+        self.metrics["frames"] += len(results)
+
+    def ordered_frames(self) -> list:
+        return sorted(self.frames.values(), key=lambda f: frame_time(f["frame"]))
+
+    def verify(self):
+        """Check each step against the frames it has not seen yet; same total checks as one batch pass."""
+        import detective
+        frames = self.ordered_frames()
+        index = detective.build_index(frames)
+        with open(str(self.run_dir / STEP_VERIFICATION).replace(".json", "_debug.txt"), "a") as debug_f:
+            for step_no, step in enumerate(self.steps, start=1):
+                seen = self.checked.setdefault(step["step_id"], set())
+                delta = [f for f in frames if f["frame"] not in seen]
+                if not delta:
+                    continue
+                entry = detective.verify_step(self.models.get("detective"), step_no, step, delta, debug_f, index)
+                seen.update(f["frame"] for f in delta)
+                self.refs.setdefault(step["step_id"], []).extend(entry["frame_refs"])
+                if entry.get("resolved_by"):
+                    self.literal.add(step["step_id"])
+                self.metrics["checks"] += len(delta)
+
+    def verification(self) -> list:
+        import detective
+        entries = []
+        for step_no, step in enumerate(self.steps, start=1):
+            refs = sorted(self.refs.get(step["step_id"], []), key=lambda r: frame_time(r["frame_no"]))
+            entry = detective.verification_entry(step, step_no, refs)
+            if step["step_id"] in self.literal:
+                entry["resolved_by"] = "literal_index"
+            entries.append(entry)
+        return entries
+
+    def write(self):
+        import ocr
+        log_parser.write_outputs(self.steps, self.run_dir / SUMMARY_JSON, self.run_dir / CSV_REPORT)
+        ocr.save_results(self.ordered_frames(), str(self.run_dir / OCR_RESULTS))
+        verification = self.verification()
+        with open(self.run_dir / STEP_VERIFICATION, "w") as f:
+            json.dump(verification, f, indent=2)
+        importlib.import_module("output-postprocessing").postprocess(
+            self.run_dir / STEP_VERIFICATION, self.run_dir / VERIFICATION_REPORT
+        )
+        matched = sum(1 for entry in verification if entry["status"] == "matched")
+        print(f"📝 Live report: {matched}/{len(verification)} steps matched over {len(self.frames)} frames")
+
+    def round(self) -> bool:
+        """One poll/OCR/verify/write cycle; True if anything changed."""
+        new_steps = self.poll_steps()
+        new_frames = self.poll_frames()
+        if new_frames:
+            self.ocr(new_frames)
+        if not (new_steps or new_frames):
+            return False
+        self.verify()
+        self.write()
+        self.metrics["rounds"] += 1
+        self.metrics["steps"] = len(self.steps)
+        return True
+
+    def finished(self) -> bool:
+        return (self.run_dir / TEST_REPORT).exists() or time.time() - self.last_growth >= LIVE_IDLE_S
+
+    # ---------- Driver ---------- #
+
+    def watch(self, poll_s: float = LIVE_POLL_S, retries: int = STAGE_RETRIES) -> dict:
+        print(f"👀 Watching {self.run_dir} (poll {poll_s}s, frame every {self.interval_s}s)")
+        while not self.finished():
+            if not self.round():
+                time.sleep(poll_s)
+
+        # The writers may have flushed between the last poll and the end signal
+        ended = max((s[1] for s in self.signatures.values()), default=time.time())
+        self.signatures.clear()
+        if not self.extract_video:
+            time.sleep(LIVE_SETTLE_S)
+        while self.round():
+            pass
+        if not self.steps:
+            raise RuntimeError(f"No planner steps found in {self.run_dir / LOG_FILE}")
+
+        status = RunStatus(self.run_dir.name, self.run_dir)
+        for stage in ("parse", "frames", "ocr", "detective"):
+            status.record(stage, "done")
+        for stage in FINAL_STAGES:
+            if stage == "deviation" and not (self.run_dir / TEST_REPORT).exists():
+                print("⚠️ No test report, skipping the deviation stage")
+                continue
+            ok, attempts, seconds, error = run_with_retries(stage, self.run_dir, retries, self.models)
+            status.record(stage, "done" if ok else "failed", attempts, seconds, error)
+
+        self.metrics["report_lag_s"] = round(time.time() - ended, 1)
+        print(f"✅ Live run complete: {self.metrics['steps']} steps, {self.metrics['frames']} frames, "
+              f"{self.metrics['checks']} step/frame checks in {self.metrics['rounds']} rounds; "
+              f"report ready {self.metrics['report_lag_s']}s after the recording stopped")
+        return self.metrics
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Verify a Hercules run while it is still recording")
+    cli.add_argument("--log", required=True, help="agent_inner_logs.json being written by the run")
+    cli.add_argument("--video", help="video.webm being recorded; omit when frames arrive in <run>/output/frames")
+    cli.add_argument("--report", help="test_result.html; its appearance marks the end of the run")
+    cli.add_argument("--run-id", default=time.strftime("live_%Y%m%d_%H%M%S"))
+    cli.add_argument("--out", type=Path, default=LIVE_OUTPUT_ROOT, help="Root for the run directory")
+    cli.add_argument("--interval", type=float, default=LIVE_INTERVAL_S, help="Seconds between extracted frames")
+    cli.add_argument("--poll", type=float, default=LIVE_POLL_S)
+    args = cli.parse_args()
+
+    run_dir = prepare_run_dir({"run_id": args.run_id, "log": args.log, "video": args.video, "report": args.report},
+                              args.out)
+    LiveRun(run_dir, SharedModels(), args.interval, extract_video=bool(args.video)).watch(args.poll)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional
+
+import openai
+
+from response_cache import ResponseCache
+
+# ---------- Retry Policy ---------- #
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class CallMetrics:
+    label: str
+    latency_s: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    attempts: int = 0
+    throttled_s: float = 0.0
+    status: str = "pending"
+    error: str = ""
+
+
+def estimate_tokens(messages: List[Dict], max_tokens: int) -> int:
+    """Rough pre-call token reservation: ~4 characters per token plus the completion budget."""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 4 + max_tokens
+
+
+# ---------- Rate Budget ---------- #
+
+class RateBudget:
+    """Token-bucket limiter for requests-per-minute and tokens-per-minute quotas."""
+
+    def __init__(self, rpm_limit: Optional[int] = None, tpm_limit: Optional[int] = None):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self._requests = float(rpm_limit or 0)
+        self._tokens = float(tpm_limit or 0)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm_limit:
+            self._requests = min(self.rpm_limit, self._requests + elapsed * self.rpm_limit / 60)
+        if self.tpm_limit:
+            self._tokens = min(self.tpm_limit, self._tokens + elapsed * self.tpm_limit / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = 0.0
+        if self.rpm_limit and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm_limit)
+        if self.tpm_limit:
+            # A single request larger than the whole bucket is let through once it is full.
+            needed = min(tokens, self.tpm_limit)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tpm_limit)
+        return wait
+
+    async def acquire(self, tokens: int) -> float:
+        """Block until one request and `tokens` tokens are available. Returns seconds waited."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+                waited += wait
+            if self.rpm_limit:
+                self._requests -= 1
+            if self.tpm_limit:
+                self._tokens -= min(tokens, self.tpm_limit)
+        return waited
+
+    def reconcile(self, reserved: int, actual: int):
+        """Return over-reserved tokens (or charge the shortfall) once real usage is known."""
+        if self.tpm_limit:
+            self._tokens = min(self.tpm_limit, self._tokens + reserved - actual)
+
+
+# ---------- Async Client ---------- #
+
+class AsyncLLMClient:
+    """Bounded-concurrency chat completion client with quota budgeting and backoff retries."""
+
+    def __init__(
+        self,
+        client,
+        deployment: str,
+        max_concurrency: int = 8,
+        rpm_limit: Optional[int] = None,
+        tpm_limit: Optional[int] = None,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        cache: Optional[ResponseCache] = None,
+        cache_scope: Optional[Dict] = None,
+    ):
+        self.client = client
+        self.deployment = deployment
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = RateBudget(rpm_limit, tpm_limit)
+        self.cache = cache
+        self.cache_scope = cache_scope or {}
+        self.metrics: List[CallMetrics] = []
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+        return delay * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+            return True
+        return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+    async def chat(self, messages: List[Dict], label: str = "", max_tokens: int = 2048,
+                   validate: Optional[Callable[[str], object]] = None, **params) -> str:
+        """`validate` as in ResponseCache.get_or_call: unusable content is neither cached nor kept cached."""
+        if self.cache is None:
+            return await self._chat(messages, label, max_tokens, **params)
+
+        request = {**self.cache_scope, "model": self.deployment, "messages": messages, "max_tokens": max_tokens, **params}
+        content = self.cache.lookup(request)
+        if content is not None:
+            self.metrics.append(CallMetrics(label=label, status="cached"))
+            if validate:
+                try:
+                    validate(content)
+                except Exception:
+                    self.cache.invalidate(request)
+                    raise
+            return content
+        content = await self._chat(messages, label, max_tokens, **params)
+        if validate:
+            validate(content)
+        self.cache.put(request, content)
+        return content
+
+    async def _chat(self, messages: List[Dict], label: str, max_tokens: int, **params) -> str:
+        metrics = CallMetrics(label=label)
+        self.metrics.append(metrics)
+        reserved = estimate_tokens(messages, max_tokens)
+        start = time.perf_counter()
+
+        async with self._semaphore:
+            while True:
+                metrics.attempts += 1
+                metrics.throttled_s += await self.budget.acquire(reserved)
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.deployment,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        **params,
+                    )
+                except Exception as e:
+                    # A failed attempt consumed no tokens; only its request slot stays spent
+                    self.budget.reconcile(reserved, 0)
+                    if not self._is_retryable(e) or metrics.attempts > self.max_retries:
+                        metrics.status = "failed"
+                        metrics.error = f"{type(e).__name__}: {e}"
+                        metrics.latency_s = time.perf_counter() - start
+                        raise
+                    delay = self._backoff(metrics.attempts, e)
+                    print(f"🔁 [{label}] {type(e).__name__}, retry {metrics.attempts}/{self.max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                break
+
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.prompt_tokens = usage.prompt_tokens or 0
+            metrics.completion_tokens = usage.completion_tokens or 0
+            self.budget.reconcile(reserved, usage.total_tokens or 0)
+        metrics.latency_s = time.perf_counter() - start
+        metrics.status = "ok"
+        return response.choices[0].message.content
+
+    def summary(self) -> Dict:
+        done = [m for m in self.metrics if m.status == "ok"]
+        latencies = sorted(m.latency_s for m in done)
+        return {
+            "calls": len(self.metrics),
+            "succeeded": len(done),
+            "failed": sum(m.status == "failed" for m in self.metrics),
+            "cached": sum(m.status == "cached" for m in self.metrics),
+            "retries": sum(max(m.attempts - 1, 0) for m in self.metrics),
+            "prompt_tokens": sum(m.prompt_tokens for m in done),
+            "completion_tokens": sum(m.completion_tokens for m in done),
+            "throttled_s": round(sum(m.throttled_s for m in self.metrics), 3),
+            "latency_p50_s": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "latency_max_s": round(latencies[-1], 3) if latencies else None,
+            "per_call": [asdict(m) for m in self.metrics],
+        }
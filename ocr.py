@@ -3,65 +3,317 @@ from transformers import Qwen2VLForConditionalGeneration, AutoProcessor
 from qwen_vl_utils import process_vision_info
 from PIL import Image
 import os
+import sys
+import time
+import functools
 import torch
 import json
 
+from frame_filter import BLANK_DESCRIPTION, filter_settings, skip_reason
+from frame_ocr_store import FrameOCRStore
+from frame_prefetch import CopyPool, FramePrefetcher
+from ui_index import ELEMENTS_PROMPT, parse_elements, render_description
+from video_cache import VideoCache, settings_key
+
 # Set device
 device = "cuda:0" if torch.cuda.is_available() else "cpu"
 
-# Load ColPali retriever
-rag = RAGMultiModalModel.from_pretrained("vidore/colpali")
+image_folder = "/data/shared/users/antara/rag/video/output/frames"
+output_path = "/data/shared/users/antara/rag/video/output/ocr_caption_results.json"
+
+OCR_MODEL_ID = "Qwen/Qwen2-VL-7B-Instruct"
+# "text": free transcription + caption; "elements": JSON list of {text, role, bbox} per frame (see ui_index.py)
+OCR_MODE = os.getenv("OCR_MODE", "text")
+OCR_MAX_NEW_TOKENS = 512 if OCR_MODE == "elements" else 256
+OCR_PROMPT = ELEMENTS_PROMPT if OCR_MODE == "elements" else "You are acting as a strict OCR engine. Read and transcribe **all visible text and UI elements** exactly as they appear in this frame. Do not infer or summarize. List each element you detect. At the end, give a one-line caption describing the purpose of the screen."
 
-# Load Qwen2VL model
-model = Qwen2VLForConditionalGeneration.from_pretrained(
-    "Qwen/Qwen2-VL-7B-Instruct", 
-    torch_dtype=torch.bfloat16,
-    device_map=device
-)
-processor = AutoProcessor.from_pretrained("Qwen/Qwen2-VL-7B-Instruct")
 
-# Index image frames
-image_folder = "/data/shared/users/antara/rag/video/output/frames"
-rag.index(
-    input_path=image_folder,
-    index_name="video_ocr",
-    store_collection_with_index=False,
-    overwrite=True
-)
-
-# ✅ Define local results list
-results = []
-
-# Loop through frames for captioning
-for image_file in sorted(os.listdir(image_folder)):
-    if not image_file.endswith(".jpg"):
-        continue
-    image_path = os.path.join(image_folder, image_file)
-    image = Image.open(image_path)
+# Everything that changes one frame's transcription; scopes the cross-run OCR store
+OCR_MODEL_SETTINGS = {"model": OCR_MODEL_ID, "prompt": OCR_PROMPT, "max_new_tokens": OCR_MAX_NEW_TOKENS, "do_sample": False}
+# Everything that changes a run's OCR results, including which frames the pre-OCR filter skips; part of the video cache key
+OCR_SETTINGS = {**OCR_MODEL_SETTINGS, "frame_filter": filter_settings()}
+
+# Speculative decoding, same output as plain greedy decoding (so not part of OCR_SETTINGS):
+#   "draft":  Qwen2-VL-2B proposes tokens, the 7B model verifies them (HF assisted generation)
+#   "lookup": tokens are copied from the previous frame's transcription wherever the last few generated
+#             tokens occur in it (menus, banners and footers repeat frame to frame), verified in one pass
+OCR_SPECULATIVE = os.getenv("OCR_SPECULATIVE", "off")
+OCR_DRAFT_MODEL_ID = os.getenv("OCR_DRAFT_MODEL_ID", "Qwen/Qwen2-VL-2B-Instruct")
+OCR_LOOKUP_TOKENS = int(os.getenv("OCR_LOOKUP_TOKENS", "10"))
+OCR_LOOKUP_NGRAM = int(os.getenv("OCR_LOOKUP_NGRAM", "3"))
+
+# Decoding counters for tokens/sec reporting (new_tokens, seconds, forward passes, accepted draft tokens)
+DECODE_STATS = {"frames": 0, "new_tokens": 0, "seconds": 0.0, "forward_passes": 0, "accepted": 0}
+
+
+def load_ocr_model():
+    # Load Qwen2VL model
+    model = Qwen2VLForConditionalGeneration.from_pretrained(
+        OCR_MODEL_ID,
+        torch_dtype=torch.bfloat16,
+        device_map=device
+    )
+    processor = AutoProcessor.from_pretrained(OCR_MODEL_ID)
+    return model, processor
+
+
+@functools.lru_cache(maxsize=1)
+def load_draft_model():
+    return Qwen2VLForConditionalGeneration.from_pretrained(OCR_DRAFT_MODEL_ID, torch_dtype=torch.bfloat16, device_map=device)
+
 
+def _propose(context: list, reference: list, k: int, ngram: int) -> list:
+    """Up to k tokens following the latest occurrence of the context's last n-gram (n = ngram..1)."""
+    for n in range(min(ngram, len(context)), 0, -1):
+        tail = context[-n:]
+        for source in (reference, context[:-1]):
+            for start in range(len(source) - n, -1, -1):
+                if source[start:start + n] == tail and start + n < len(source):
+                    return source[start + n:start + n + k]
+    return []
+
+
+def lookup_generate(model, inputs, reference_ids: list, max_new_tokens: int, eos_ids: set,
+                    k: int = OCR_LOOKUP_TOKENS, ngram: int = OCR_LOOKUP_NGRAM) -> list:
+    """
+    Greedy decoding where drafted tokens from `reference_ids` are checked in a single forward pass:
+    the longest prefix the model itself would have produced is kept plus the model's next token, and
+    the KV cache is cropped back past any rejected ones. Token-for-token identical to greedy.
+    """
+    from transformers import DynamicCache
+    cache = DynamicCache()
+    prompt_len = inputs.input_ids.shape[1]
+    out = model(**inputs, past_key_values=cache, use_cache=True,
+                cache_position=torch.arange(prompt_len, device=model.device))
+    generated = [int(out.logits[0, -1].argmax())]
+    DECODE_STATS["forward_passes"] += 1
+
+    while len(generated) < max_new_tokens and generated[-1] not in eos_ids:
+        candidates = _propose(generated, reference_ids, min(k, max_new_tokens - len(generated)), ngram)
+        past = cache.get_seq_length()
+        tokens = torch.tensor([[generated[-1]] + candidates], device=model.device)
+        out = model(input_ids=tokens, past_key_values=cache, use_cache=True,
+                    attention_mask=torch.ones(1, past + tokens.shape[1], dtype=torch.long, device=model.device),
+                    cache_position=torch.arange(past, past + tokens.shape[1], device=model.device))
+        predicted = out.logits[0].argmax(dim=-1).tolist()
+        DECODE_STATS["forward_passes"] += 1
+
+        accepted = 0
+        while accepted < len(candidates) and predicted[accepted] == candidates[accepted]:
+            accepted += 1
+            if candidates[accepted - 1] in eos_ids:
+                break
+        DECODE_STATS["accepted"] += accepted
+        new_tokens = candidates[:accepted]
+        if not new_tokens or new_tokens[-1] not in eos_ids:
+            new_tokens.append(predicted[accepted])
+        cache.crop(past + 1 + accepted)
+        for token in new_tokens:
+            generated.append(token)
+            if token in eos_ids or len(generated) >= max_new_tokens:
+                break
+    return generated
+
+
+# id(processor) -> copies used by prefetch threads; the original stays with the generating thread
+_LOADER_PROCESSORS = {}
+
+
+def prepare_inputs(processor, image):
+    """CPU half of ocr_image: chat template, vision resize and tensorization (see loader_inputs for threads)."""
     messages = [{
         "role": "user",
         "content": [
             {"type": "image", "image": image},
-            {"type": "text", "text": "You are acting as a strict OCR engine. Read and transcribe **all visible text and UI elements** exactly as they appear in this frame. Do not infer or summarize. List each element you detect. At the end, give a one-line caption describing the purpose of the screen."}
+            {"type": "text", "text": OCR_PROMPT}
         ]
     }]
 
     text = processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
     image_inputs, _ = process_vision_info(messages)
-    inputs = processor(text=[text], images=image_inputs, padding=True, return_tensors="pt").to(device)
+    return processor(text=[text], images=image_inputs, padding=True, return_tensors="pt")
+
+
+def loader_inputs(processor, image):
+    """prepare_inputs on a private processor copy, for prefetch threads running next to ocr_image."""
+    pool = _LOADER_PROCESSORS.setdefault(id(processor), CopyPool(processor))
+    with pool.borrow() as private:
+        return prepare_inputs(private, image)
+
+
+def ocr_image(model, processor, image, reference: str = None, mode: str = None, inputs=None) -> str:
+    """
+    Transcribe one frame; `reference` (previous frame's transcription) feeds OCR_SPECULATIVE=lookup.
+    `inputs` may carry prepare_inputs() output computed ahead of time by the prefetcher.
+    """
+    mode = mode or OCR_SPECULATIVE
+    inputs = (inputs if inputs is not None else prepare_inputs(processor, image)).to(device)
 
+    start = time.perf_counter()
     with torch.no_grad():
-        output_ids = model.generate(**inputs, max_new_tokens=256)
-        trimmed_ids = [out[len(inp):] for inp, out in zip(inputs.input_ids, output_ids)]
-        output = processor.batch_decode(trimmed_ids, skip_special_tokens=True)[0]
+        if mode == "lookup":
+            eos = model.generation_config.eos_token_id
+            eos_ids = set(eos if isinstance(eos, list) else [eos])
+            reference_ids = processor.tokenizer(reference or "", add_special_tokens=False).input_ids
+            trimmed_ids = [lookup_generate(model, inputs, reference_ids, OCR_MAX_NEW_TOKENS, eos_ids)]
+        else:
+            extra = {"assistant_model": load_draft_model()} if mode == "draft" else {}
+            output_ids = model.generate(**inputs, max_new_tokens=OCR_MAX_NEW_TOKENS, do_sample=False, **extra)
+            trimmed_ids = [out[len(inp):].tolist() for inp, out in zip(inputs.input_ids, output_ids)]
+    DECODE_STATS["frames"] += 1
+    DECODE_STATS["new_tokens"] += len(trimmed_ids[0])
+    DECODE_STATS["seconds"] += time.perf_counter() - start
+    return processor.batch_decode(trimmed_ids, skip_special_tokens=True)[0]
 
-    print(f"🖼️ {image_file}: {output}")
-    results.append({"frame": image_file, "description": output})
 
-# Save the result as a JSON file
-output_path = "/data/shared/users/antara/rag/video/output/ocr_caption_results.json"
-with open(output_path, "w") as f:
-    json.dump(results, f, indent=2)
+def decode_summary() -> str:
+    tps = DECODE_STATS["new_tokens"] / DECODE_STATS["seconds"] if DECODE_STATS["seconds"] else 0.0
+    return (f"{DECODE_STATS['new_tokens']} tokens in {DECODE_STATS['seconds']:.1f}s = {tps:.1f} tok/s"
+            + (f", {DECODE_STATS['accepted']} drafted tokens accepted over {DECODE_STATS['forward_passes']} passes"
+               if DECODE_STATS["forward_passes"] else ""))
+
+
+def list_frames(image_folder) -> list:
+    return sorted(f for f in os.listdir(image_folder) if f.endswith(".jpg"))
+
+
+def open_ocr_store() -> FrameOCRStore:
+    # Cross-run store of OCR text by perceptual frame hash, scoped to the current OCR settings
+    return FrameOCRStore(settings_key(OCR_MODEL_SETTINGS))
+
+
+def ocr_result(image_file, output) -> dict:
+    if OCR_MODE != "elements":
+        return {"frame": image_file, "description": output}
+    # Keep a text description too, so LLM-based consumers work unchanged
+    elements, caption = parse_elements(output)
+    return {"frame": image_file, "description": render_description(elements, caption),
+            "elements": elements, "caption": caption}
+
+
+def ocr_frames(model, processor, image_folder, start=0, end=None, store=None, names=None, source=None) -> list:
+    """`source`, if given, is an iterable of (frame name, PIL image) pairs used instead of reading image_folder."""
+    results = []
+    previous = None  # last transcription, draft source for OCR_SPECULATIVE=lookup
+
+    def load_frame(item):
+        # Runs on a prefetch thread while the model is busy with an earlier frame
+        if source is None:
+            image = Image.open(os.path.join(image_folder, item))
+            image.load()
+        else:
+            image = item[1]
+        reason = skip_reason(image)
+        if reason:
+            return image, reason, None, None
+        return image, None, store.hashes(image) if store else None, loader_inputs(processor, image)
+
+    # Loop through frames for captioning (optionally only the [start:end) slice, or only `names`)
+    items = source if source is not None else names if names is not None else list_frames(image_folder)[start:end]
+    prefetcher = FramePrefetcher(items, load_frame)
+    for item, (image, reason, hashes, inputs) in prefetcher:
+        image_file = item if source is None else item[0]
+        # Streamed frames never touch disk, so there is no file for the OCR store to point at
+        image_path = os.path.join(image_folder, image_file) if source is None else None
+
+        # Blank pages, transitions and spinners: tagged, no VLM call
+        if reason:
+            print(f"⏭️ {image_file}: skipped ({reason})")
+            results.append({"frame": image_file, "description": BLANK_DESCRIPTION, "skipped": reason})
+            continue
+
+        # Near-identical screen already transcribed in an earlier run?
+        hit = store.lookup(hashes) if store else None
+        if hit is None:
+            output = ocr_image(model, processor, image, reference=previous, inputs=inputs)
+            if store:
+                store.add(hashes, output, image_path)
+        else:
+            output = hit[1]
+            if store.should_verify():
+                fresh = ocr_image(model, processor, image, reference=previous, inputs=inputs)
+                if store.verify(hit[0], hashes, fresh, image_path):
+                    print(f"🔄 {image_file}: screen changed since it was stored, entry replaced")
+                output = fresh
+        print(f"🖼️ {image_file}{' (stored)' if hit else ''}: {output}")
+        results.append(ocr_result(image_file, output))
+        previous = output
+
+    skipped = sum(1 for r in results if r.get("skipped"))
+    print(f"📊 OCR: {len(results) - skipped} transcribed, {skipped} blank/loading frames skipped")
+    if DECODE_STATS["frames"]:
+        print(f"📊 Decoding ({OCR_SPECULATIVE}): {decode_summary()}")
+    print(f"📥 Prefetch: {prefetcher.summary()}")
+    if store:
+        print(f"📊 OCR store: {store.stats()}")
+    return results
+
+
+def ocr_video(model, processor, video_path, interval_s=None, store=None) -> list:
+    """
+    OCR straight from the recording: a decode process feeds frames through a shared-memory FrameRing
+    (frame_transport.py), so no JPEGs are written and no pixels are pickled between the processes.
+    """
+    import multiprocessing as mp
+    import frames
+    from frame_transport import FrameRing
+
+    ring = FrameRing()
+    decoder = mp.Process(target=frames.stream_frames,
+                         args=(video_path, ring, interval_s or frames.FRAME_INTERVAL_S), daemon=True)
+    decoder.start()
+    try:
+        results = ocr_frames(model, processor, None, store=store, source=frames.frames_from_ring(ring))
+    except BaseException:
+        # The decoder may be blocked on a full ring that nobody drains any more
+        decoder.terminate()
+        raise
+    finally:
+        decoder.join()
+        ring.close()
+    return results
+
+
+def save_results(results, output_path):
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def speculative_benchmark(image_folder, count=10, modes=("lookup", "draft")):
+    """Greedy vs each speculative mode on the first `count` OCR-able frames: identical output and tok/s."""
+    model, processor = load_ocr_model()
+    names = [n for n in list_frames(image_folder) if not skip_reason(Image.open(os.path.join(image_folder, n)))][:count]
+    runs = {}
+    for mode in ("off",) + tuple(modes):
+        DECODE_STATS.update(frames=0, new_tokens=0, seconds=0.0, forward_passes=0, accepted=0)
+        outputs, previous = [], None
+        for name in names:
+            outputs.append(ocr_image(model, processor, Image.open(os.path.join(image_folder, name)), previous, mode))
+            previous = outputs[-1]
+        runs[mode] = (outputs, DECODE_STATS["new_tokens"] / DECODE_STATS["seconds"])
+        same = sum(a == b for a, b in zip(outputs, runs["off"][0]))
+        print(f"⚡ {mode:<6} {decode_summary()} | identical to greedy: {same}/{len(names)} | "
+              f"speedup {runs[mode][1] / runs['off'][1]:.2f}x")
+
+
+if __name__ == "__main__" and "--speculative-benchmark" in sys.argv:
+    # python ocr.py --speculative-benchmark [frames]
+    args = [a for a in sys.argv[1:] if a != "--speculative-benchmark"]
+    speculative_benchmark(image_folder, int(args[0]) if args else 10)
+elif __name__ == "__main__":
+    # Load ColPali retriever and index image frames
+    rag = RAGMultiModalModel.from_pretrained("vidore/colpali")
+    rag.index(
+        input_path=image_folder,
+        index_name="video_ocr",
+        store_collection_with_index=False,
+        overwrite=True
+    )
+
+    # Reuses OCR results when these frames came from an already-transcribed recording (see frames.py)
+    results = VideoCache().ocr(image_folder, OCR_SETTINGS, lambda: ocr_frames(*load_ocr_model(), image_folder, store=open_ocr_store()))
 
-print(f"\n✅ OCR and caption results saved to: {output_path}")
+    # Save the result as a JSON file
+    save_results(results, output_path)
+    print(f"\n✅ OCR and caption results saved to: {output_path}")
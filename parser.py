@@ -1,26 +1,131 @@
 import json
 import csv
+import re
 from pathlib import Path
 
+try:
+    import ijson
+except ImportError:  # optional: fall back to the stdlib incremental decoder below
+    ijson = None
+
 INPUT_FILE = Path("logs/agent_inner_logs.json")
 SUMMARY_JSON = Path("output/summary.json")
 CSV_REPORT = Path("output/report.csv")
-
-
-def load_log():
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        return data.get("planner_agent", [])  ]
+LOG_KEY = "planner_agent"
+CSV_FIELDS = [
+    "step_id", "step_type", "description", "is_assert", "is_passed",
+    "assert_summary", "status", "verification", "details", "validation"
+]
+
+
+class _JsonStream:
+    """Minimal pull decoder over a text file: decodes one JSON value at a time from a sliding buffer."""
+
+    _WS = re.compile(r"\s*")
+    # Characters that may legally follow a complete JSON value
+    _AFTER_VALUE = frozenset(",]}: \t\r\n")
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        if self.pos > self.chunk_size:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        data = self.f.read(size)
+        if not data:
+            self.eof = True
+        self.buf += data
+
+    def peek(self):
+        while True:
+            self.pos = self._WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ""
+            self._fill(self.chunk_size)
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' in the input JSON, found '{self.peek()}'")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number cut at the buffer edge still decodes ("1." -> 1), so only trust a value
+                # followed by a delimiter, or one that ends the file.
+                if (end < len(self.buf) and self.buf[end] in self._AFTER_VALUE) or (end == len(self.buf) and self.eof):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # Grow geometrically so a huge entry is re-decoded O(log n) times, not O(n).
+            self._fill(max(self.chunk_size, len(self.buf) - self.pos))
+
+
+def iter_log(path=INPUT_FILE, key=LOG_KEY):
+    """
+    Stream the `key` array of an agent log entry by entry.
+    Other top-level arrays (e.g. other agents with DOM dumps) are skipped element by element,
+    so peak memory is bounded by the largest single entry rather than the whole file.
+    """
+    if ijson is not None:
+        found = False
+        with open(path, "rb") as f:
+            for entry in ijson.items(f, f"{key}.item"):
+                found = True
+                yield entry
+        if not found:
+            # Nothing yielded: an empty array, or `key` holds something else, which the stdlib path rejects too
+            with open(path, "rb") as f:
+                for prefix, event, _ in ijson.parse(f):
+                    if prefix == key:
+                        if event != "start_array":
+                            raise ValueError(f"Expected a list of log entries under '{key}' in the input JSON.")
+                        break
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        stream.expect("{")
+        while stream.peek() != "}":
+            name = stream.value()
+            stream.expect(":")
+            if stream.peek() == "[":
+                stream.pos += 1
+                while stream.peek() != "]":
+                    entry = stream.value()
+                    if name == key:
+                        yield entry
+                    if stream.peek() == ",":
+                        stream.pos += 1
+                stream.pos += 1
+            elif name == key:
+                raise ValueError(f"Expected a list of log entries under '{key}' in the input JSON.")
+            else:
+                stream.value()
+            if stream.peek() == ",":
+                stream.pos += 1
 
 
 def parse_steps(data):
-    steps = []
+    """Yield one step per planner assistant/user exchange; `data` may be a list or a stream."""
     current_step = {}
     step_id = 1
 
     for entry in data:
         if not isinstance(entry, dict):
-            continue  
+            continue  # Skip malformed entries
 
         role = entry.get("role", "")
         content = entry.get("content", {})
@@ -66,53 +171,64 @@ def parse_steps(data):
                     "validation": parsed.get("Task_Completion_Validation", "")
                 }
 
-            steps.append(current_step)
+            yield current_step
             current_step = {}
 
-    return steps
+
+def csv_row(step):
+    exec_result = step.get("execution_result", {})
+    return {
+        "step_id": step.get("step_id", ""),
+        "step_type": step.get("step_type", ""),
+        "description": step.get("description", ""),
+        "is_assert": step.get("is_assert", False),
+        "is_passed": step.get("is_passed", False),
+        "assert_summary": step.get("assert_summary", ""),
+        "status": exec_result.get("status", ""),
+        "verification": exec_result.get("verification", ""),
+        "details": exec_result.get("details", ""),
+        "validation": exec_result.get("validation", "")
+    }
 
 
 def save_summary(parsed_steps):
     SUMMARY_JSON.parent.mkdir(parents=True, exist_ok=True)
     with open(SUMMARY_JSON, "w", encoding="utf-8") as f:
-        json.dump(parsed_steps, f, indent=2)
+        json.dump(list(parsed_steps), f, indent=2)
 
 
 def export_to_csv(parsed_steps):
     CSV_REPORT.parent.mkdir(parents=True, exist_ok=True)
     with open(CSV_REPORT, "w", encoding="utf-8", newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            "step_id", "step_type", "description", "is_assert", "is_passed",
-            "assert_summary", "status", "verification", "details", "validation"
-        ])
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
         writer.writeheader()
 
         for step in parsed_steps:
-            exec_result = step.get("execution_result", {})
-            writer.writerow({
-                "step_id": step.get("step_id", ""),
-                "step_type": step.get("step_type", ""),
-                "description": step.get("description", ""),
-                "is_assert": step.get("is_assert", False),
-                "is_passed": step.get("is_passed", False),
-                "assert_summary": step.get("assert_summary", ""),
-                "status": exec_result.get("status", ""),
-                "verification": exec_result.get("verification", ""),
-                "details": exec_result.get("details", ""),
-                "validation": exec_result.get("validation", "")
-            })
+            writer.writerow(csv_row(step))
+
+
+def write_outputs(parsed_steps, summary_json=SUMMARY_JSON, csv_report=CSV_REPORT):
+    """Single pass over a step stream into summary.json (same layout as json.dump indent=2) and report.csv."""
+    summary_json, csv_report = Path(summary_json), Path(csv_report)
+    summary_json.parent.mkdir(parents=True, exist_ok=True)
+    csv_report.parent.mkdir(parents=True, exist_ok=True)
+    count = 0
+    with open(summary_json, "w", encoding="utf-8") as json_f, \
+            open(csv_report, "w", encoding="utf-8", newline='') as csv_f:
+        writer = csv.DictWriter(csv_f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        json_f.write("[")
+        for step in parsed_steps:
+            json_f.write(("," if count else "") + "\n  " + json.dumps(step, indent=2).replace("\n", "\n  "))
+            writer.writerow(csv_row(step))
+            count += 1
+        json_f.write("\n]" if count else "]")
+    return count
 
 
 def main():
-    log_entries = load_log()
-
-    if not isinstance(log_entries, list):
-        raise ValueError("Expected a list of log entries under 'planner_agent' in the input JSON.")
-
-    parsed_steps = parse_steps(log_entries)
-    save_summary(parsed_steps)
-    export_to_csv(parsed_steps)
-    print(f"✅ Parsed {len(parsed_steps)} steps. Output written to:\n- {SUMMARY_JSON}\n- {CSV_REPORT}")
+    step_count = write_outputs(parse_steps(iter_log(INPUT_FILE)))
+    print(f"✅ Parsed {step_count} steps. Output written to:\n- {SUMMARY_JSON}\n- {CSV_REPORT}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import parser as log_parser
+
+# Compares peak memory and wall time of json.load + parse_steps against the streaming
+# iter_log + parse_steps path on a synthetic multi-agent Hercules log.
+#   python parser_benchmark.py --size-mb 300
+
+
+def _dom_dump(rng, size):
+    tags = ["div", "span", "button", "input", "a", "li"]
+    parts, total = [], 0
+    while total < size:
+        tag = rng.choice(tags)
+        part = f'<{tag} class="c{rng.randint(0, 999)}" id="e{rng.randint(0, 99999)}">item {rng.random():.6f}</{tag}>'
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)
+
+
+def _planner_pair(rng, idx, dom_size):
+    assistant = {
+        "role": "assistant",
+        "content": {
+            "plan": "1. Open site\n2. Search\n3. Filter",
+            "next_step": f"Step {idx}: interact with the page",
+            "next_step_summary": f"Synthetic step {idx}",
+            "is_assert": idx % 5 == 0,
+            "assert_summary": "",
+            "is_passed": idx % 7 != 0,
+            "terminate": False,
+            "final_response": "",
+        },
+    }
+    user = {
+        "role": "user",
+        "content": {
+            "previous_step_status": "success",
+            "current_output": _dom_dump(rng, dom_size),
+            "Verification_Status": "Verified",
+            "Verification_Details": "ok",
+            "Task_Completion_Validation": "",
+        },
+    }
+    return [assistant, user]
+
+
+def generate_log(path: Path, size_mb: int, dom_kb: int = 256, seed: int = 0):
+    """Write a log with a large browser agent section followed by the planner section."""
+    rng = random.Random(seed)
+    target = size_mb * 1024 ** 2
+    dom_size = dom_kb * 1024
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"browser_nav_agent": [')
+        written, idx = 0, 0
+        while written < target // 2:
+            entry = json.dumps({"role": "tool", "content": _dom_dump(rng, dom_size)})
+            f.write(("," if idx else "") + entry)
+            written += len(entry)
+            idx += 1
+        f.write('], "planner_agent": [')
+        idx = 0
+        while written < target:
+            entry = ",".join(json.dumps(e) for e in _planner_pair(rng, idx, dom_size))
+            f.write(("," if idx else "") + entry)
+            written += len(entry)
+            idx += 1
+        f.write("]}")
+
+
+def run_mode(mode: str, path: str):
+    """Child process body: parse once, print step count, seconds and peak RSS (MiB)."""
+    start = time.perf_counter()
+    if mode == "json.load":
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f).get("planner_agent", [])
+    else:
+        entries = log_parser.iter_log(path)
+    count = sum(1 for _ in log_parser.parse_steps(entries))
+    elapsed = time.perf_counter() - start
+    peak_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"mode": mode, "steps": count, "seconds": round(elapsed, 2), "peak_rss_mib": round(peak_mib, 1)}))
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Benchmark streaming vs full-load parsing of agent logs")
+    cli.add_argument("--size-mb", type=int, default=300)
+    cli.add_argument("--dom-kb", type=int, default=256, help="Size of each embedded DOM dump")
+    cli.add_argument("--log", help="Use an existing log instead of generating one")
+    cli.add_argument("--child", help=argparse.SUPPRESS)
+    args = cli.parse_args()
+
+    if args.child:
+        run_mode(args.child, args.log)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = args.log
+        if not log_path:
+            log_path = str(Path(tmp) / "agent_inner_logs.json")
+            start = time.perf_counter()
+            generate_log(Path(log_path), args.size_mb, args.dom_kb)
+            print(f"🧪 Generated {Path(log_path).stat().st_size / 1024 ** 2:.0f} MiB log in {time.perf_counter() - start:.1f}s")
+
+        backend = "ijson" if log_parser.ijson is not None else "stdlib"
+        for mode in ["json.load", "stream"]:
+            out = subprocess.run(
+                [sys.executable, __file__, "--child", mode, "--log", log_path],
+                capture_output=True, text=True, check=True,
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            label = f"{mode} ({backend})" if mode == "stream" else mode
+            print(f"📊 {label:<16} steps={result['steps']:<6} time={result['seconds']:>7}s  peak RSS={result['peak_rss_mib']:>8} MiB")
+
+
+if __name__ == "__main__":
+    main()
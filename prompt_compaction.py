@@ -0,0 +1,172 @@
+import hashlib
+import re
+from collections import Counter
+from typing import Callable, Dict, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character heuristic
+    tiktoken = None
+
+# The OCR prompt from ocr.py is sometimes echoed back by Qwen2-VL into the transcription.
+OCR_INSTRUCTION = (
+    "You are acting as a strict OCR engine. Read and transcribe **all visible text and UI elements** "
+    "exactly as they appear in this frame. Do not infer or summarize. List each element you detect. "
+    "At the end, give a one-line caption describing the purpose of the screen."
+)
+
+# Snippet lengths tried in order until the prompt fits the token budget (0 = ids only).
+SNIPPET_LADDER = [400, 200, 120, 60, 0]
+
+# A line present in at least this share of evidence entries is treated as shared screen chrome.
+COMMON_LINE_RATIO = 0.5
+
+
+# ---------- Token Counting ---------- #
+
+class TokenCounter:
+    def __init__(self, model: str = "gpt-4o"):
+        self.model = model
+        self._encoding = None
+        if tiktoken is None:
+            print("⚠️ tiktoken not installed, estimating tokens as characters / 4")
+            return
+        try:
+            self._encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:  # BPE file could not be downloaded (offline worker)
+            print(f"⚠️ tiktoken encoding unavailable ({type(e).__name__}), estimating tokens as characters / 4")
+
+    @property
+    def backend(self) -> str:
+        return self._encoding.name if self._encoding is not None else "chars/4"
+
+    def count(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return len(text) // 4
+
+
+# ---------- Description Cleanup ---------- #
+
+def clean_description(text: str) -> str:
+    """Drop the echoed OCR instruction and repeated lines, keeping first-seen order."""
+    text = text.replace(OCR_INSTRUCTION, "")
+    seen = set()
+    lines = []
+    for line in text.splitlines():
+        line = re.sub(r"\s+", " ", line).strip()
+        if not line or line.lower() in seen:
+            continue
+        seen.add(line.lower())
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(text.lower().encode("utf-8")).hexdigest()
+
+
+def snippet(text: str, max_chars: int) -> str:
+    flat = " | ".join(text.splitlines())
+    if len(flat) <= max_chars:
+        return flat
+    return flat[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+
+# ---------- Compaction ---------- #
+
+def compact_video_evidence(video_data: Dict, snippet_chars: int) -> Dict:
+    """
+    Replace per-step `matched_descriptions` with references into a shared evidence table.
+    Identical (post-cleanup) descriptions across frames and steps are stored once.
+    """
+    evidence: Dict[str, Dict] = {}
+    ids_by_fingerprint: Dict[str, str] = {}
+    matched = []
+
+    for step in video_data.get("matched", []):
+        frames = step.get("matched_frames", [])
+        descriptions = step.get("matched_descriptions", [])
+        refs = []
+        for frame, description in zip(frames, descriptions):
+            cleaned = clean_description(description)
+            key = _fingerprint(cleaned)
+            if key not in ids_by_fingerprint:
+                evidence_id = f"E{len(ids_by_fingerprint) + 1}"
+                ids_by_fingerprint[key] = evidence_id
+                evidence[evidence_id] = {"frames": [], "text": cleaned}
+            evidence_id = ids_by_fingerprint[key]
+            if frame not in evidence[evidence_id]["frames"]:
+                evidence[evidence_id]["frames"].append(frame)
+            if evidence_id not in refs:
+                refs.append(evidence_id)
+
+        matched.append({
+            "step_id": step.get("step_id"),
+            "step_no": step.get("step_no"),
+            "matched_frames": frames,
+            "evidence_ids": refs,
+        })
+
+    # Lines on most screens (nav bars, footers) are listed once instead of in every snippet.
+    line_counts = Counter()
+    first_seen = {}
+    for item in evidence.values():
+        for line in item["text"].splitlines():
+            first_seen.setdefault(line.lower(), line)
+        line_counts.update({line.lower() for line in item["text"].splitlines()})
+    threshold = max(2, COMMON_LINE_RATIO * len(evidence))
+    common = {line for line, count in line_counts.items() if count >= threshold}
+    common_lines = [original for key, original in first_seen.items() if key in common]
+
+    evidence_table = {}
+    for evidence_id, item in evidence.items():
+        entry = {"frames": item["frames"]}
+        if snippet_chars > 0:
+            specific = "\n".join(line for line in item["text"].splitlines() if line.lower() not in common)
+            entry["snippet"] = snippet(specific, snippet_chars)
+        evidence_table[evidence_id] = entry
+
+    return {
+        "matched": matched,
+        "missing": video_data.get("missing", []),
+        "evidence": evidence_table,
+        "common_screen_text": snippet("\n".join(common_lines), 400) if snippet_chars > 0 else "",
+    }
+
+
+def compact_to_budget(
+    video_data: Dict,
+    render: Callable[[Dict], str],
+    counter: TokenCounter,
+    token_budget: int,
+) -> Tuple[str, Dict]:
+    """
+    Render the prompt from progressively smaller evidence snippets until it fits `token_budget`.
+    Returns the prompt and a stats dict with the input-token savings.
+    """
+    original_tokens = counter.count(render(video_data))
+
+    prompt, tokens, used = "", 0, None
+    for snippet_chars in SNIPPET_LADDER:
+        prompt = render(compact_video_evidence(video_data, snippet_chars))
+        tokens = counter.count(prompt)
+        used = snippet_chars
+        if tokens <= token_budget:
+            break
+    else:
+        print(f"⚠️ Compacted prompt still {tokens} tokens, above budget {token_budget}")
+
+    stats = {
+        "tokenizer": counter.backend,
+        "token_budget": token_budget,
+        "original_tokens": original_tokens,
+        "compacted_tokens": tokens,
+        "saved_tokens": original_tokens - tokens,
+        "saved_pct": round(100 * (original_tokens - tokens) / original_tokens, 1) if original_tokens else 0.0,
+        "snippet_chars": used,
+        "within_budget": tokens <= token_budget,
+    }
+    return prompt, stats
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+# ---------- Config ---------- #
+# LLM_CACHE_MODE: "on" (read + write), "off" (always call), "strict" (never call, fail on miss)
+CACHE_DIR = Path(os.getenv("LLM_CACHE_DIR", os.path.expanduser("~/.cache/medusa_watcher/llm")))
+CACHE_MODE = os.getenv("LLM_CACHE_MODE", "on")
+CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(30 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+# Full directory scans for eviction run every this many puts, or sooner once the running size estimate
+# crosses CACHE_MAX_BYTES
+CACHE_SCAN_EVERY = int(os.getenv("LLM_CACHE_SCAN_EVERY", "64"))
+
+
+class CacheMissError(RuntimeError):
+    """Raised in strict mode when a request has no cached response."""
+
+
+class ResponseCache:
+    """
+    On-disk cache of chat completion responses keyed by a fingerprint of the full request
+    (model, deployment, messages, sampling params). Entries expire after `ttl_s` and the
+    least recently used ones are evicted once the directory exceeds `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, mode: str = CACHE_MODE,
+                 ttl_s: float = CACHE_TTL_S, max_bytes: int = CACHE_MAX_BYTES):
+        if mode not in ("on", "off", "strict"):
+            raise ValueError(f"Unknown cache mode '{mode}', expected on/off/strict")
+        self.cache_dir = Path(cache_dir)
+        self.mode = mode
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._approx_bytes = None  # size estimate since the last scan; None until the first one
+        self._puts_since_scan = 0
+
+    @staticmethod
+    def fingerprint(request: Dict) -> str:
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    # ---------- Read / Write ---------- #
+
+    def get(self, request: Dict) -> Optional[str]:
+        if self.mode == "off":
+            return None
+        path = self._path(self.fingerprint(request))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if self.ttl_s and time.time() - entry["created"] > self.ttl_s:
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)  # mtime doubles as last-access time for LRU eviction
+        return entry["content"]
+
+    def put(self, request: Dict, content: str):
+        if self.mode != "on":
+            return
+        path = self._path(self.fingerprint(request))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "request": request, "content": content}, f)
+        size = tmp_path.stat().st_size
+        os.replace(tmp_path, path)
+
+        self._puts_since_scan += 1
+        if (self._approx_bytes is None or self._puts_since_scan >= CACHE_SCAN_EVERY
+                or self._approx_bytes + size > self.max_bytes):
+            self.evict()
+        else:
+            self._approx_bytes += size
+
+    def invalidate(self, request: Dict):
+        self._path(self.fingerprint(request)).unlink(missing_ok=True)
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under `max_bytes`."""
+        entries = []
+        now = time.time()
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = kept = 0
+        for mtime, size, path in sorted(entries, reverse=True):
+            total += size
+            if total > self.max_bytes:
+                path.unlink(missing_ok=True)
+            else:
+                kept += size
+        # Expiry is judged on creation time inside the entry, checked lazily in get();
+        # files untouched for longer than the TTL cannot be fresh, so drop them here too.
+        if self.ttl_s:
+            for mtime, _, path in entries:
+                if now - mtime > self.ttl_s:
+                    path.unlink(missing_ok=True)
+        self._approx_bytes = kept
+        self._puts_since_scan = 0
+
+    # ---------- Call Wrappers ---------- #
+
+    def lookup(self, request: Dict) -> Optional[str]:
+        """Cached content or None; counts hits/misses and enforces strict mode."""
+        content = self.get(request)
+        if content is not None:
+            self.hits += 1
+            return content
+        self.misses += 1
+        if self.mode == "strict":
+            raise CacheMissError(f"No cached response for request {self.fingerprint(request)[:12]} (strict mode)")
+        return None
+
+    def get_or_call(self, request: Dict, call: Callable[[], str], validate: Callable[[str], object] = None) -> str:
+        """
+        `validate(content)` should raise if the caller cannot use the content (e.g. malformed JSON): a fresh
+        response is then not stored, and a cached one is dropped so the next run asks again.
+        """
+        content = self.lookup(request)
+        if content is not None:
+            if validate:
+                try:
+                    validate(content)
+                except Exception:
+                    self.invalidate(request)
+                    raise
+            return content
+        content = call()
+        if validate:
+            validate(content)
+        self.put(request, content)
+        return content
+
+    def stats(self) -> Dict:
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
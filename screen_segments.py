@@ -0,0 +1,147 @@
+import json
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from adaptive_sampling import frame_time
+
+# ---------- Config ---------- #
+# Groups consecutive frames into screen segments (homepage, search open, results, filtered results)
+# from a small visual embedding plus OCR token overlap, so step verification can check one
+# representative per segment instead of every frame. On the sample run the visual term carries most
+# of the signal: OCR of an unchanged screen varies a lot between frames (token Jaccard 0.3-0.7).
+SCREEN_SEGMENTS = os.getenv("SCREEN_SEGMENTS", "1") == "1"
+VISUAL_WEIGHT = float(os.getenv("SCREEN_VISUAL_WEIGHT", "0.7"))
+SPLIT_THRESHOLD = float(os.getenv("SCREEN_SPLIT_THRESHOLD", "0.6"))    # vs. previous frame
+DRIFT_THRESHOLD = float(os.getenv("SCREEN_DRIFT_THRESHOLD", "0.5"))    # vs. first frame of the segment
+SAME_SCREEN_THRESHOLD = float(os.getenv("SCREEN_SAME_THRESHOLD", "0.8"))
+COHESION_THRESHOLD = float(os.getenv("SCREEN_COHESION_THRESHOLD", "0.75"))
+EXPAND_TOP_K = int(os.getenv("SCREEN_EXPAND_TOP_K", "2"))
+
+EMBED_SIZE = (64, 36)
+_TOKEN = re.compile(r"[a-z0-9]{2,}")
+
+
+def frame_embedding(image: Image.Image) -> np.ndarray:
+    """Mean-centred, L2-normalised 64x36 grayscale: cosine similarity ~ layout similarity."""
+    vec = np.asarray(image.convert("L").resize(EMBED_SIZE, Image.BOX), dtype=np.float32).ravel()
+    vec -= vec.mean()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def text_tokens(text: str) -> set:
+    return set(_TOKEN.findall(text.lower()))
+
+
+def jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+class FrameFeatures:
+    def __init__(self, frames_dir, ocr_results: List[Dict]):
+        self.names = [r["frame"] for r in ocr_results]
+        self.text = {r["frame"]: r["description"] for r in ocr_results}
+        self.tokens = {name: text_tokens(self.text[name]) for name in self.names}
+        self.vectors = {name: frame_embedding(Image.open(os.path.join(frames_dir, name))) for name in self.names}
+
+    def similarity(self, a: str, b: str) -> float:
+        va, vb = self.vectors[a], self.vectors[b]
+        # Two flat frames (zero vectors after centring) are the same blank screen
+        visual = 1.0 if not va.any() and not vb.any() else float(va @ vb)
+        return VISUAL_WEIGHT * visual + (1 - VISUAL_WEIGHT) * jaccard(self.tokens[a], self.tokens[b])
+
+
+# ---------- Segmentation ---------- #
+
+def _medoid(features: FrameFeatures, members: List[str]) -> str:
+    if len(members) <= 2:
+        return members[-1]  # later frame: page has settled
+    scores = [np.mean([features.similarity(m, o) for o in members if o != m]) for m in members]
+    return members[int(np.argmax(scores))]
+
+
+def segment_frames(frames_dir, ocr_results: List[Dict]) -> Dict:
+    """
+    Split the frame timeline into screen segments. A new segment starts when a frame differs from the
+    previous one (SPLIT_THRESHOLD) or has drifted from the segment's first frame (DRIFT_THRESHOLD, e.g.
+    scrolling). Segments showing the same screen again later share a screen_id.
+    """
+    usable = sorted((r for r in ocr_results if not r.get("skipped")), key=lambda r: frame_time(r["frame"]))
+    features = FrameFeatures(frames_dir, usable)
+
+    groups = []
+    for name in features.names:
+        if groups and features.similarity(groups[-1][-1], name) >= SPLIT_THRESHOLD \
+                and features.similarity(groups[-1][0], name) >= DRIFT_THRESHOLD:
+            groups[-1].append(name)
+        else:
+            groups.append([name])
+
+    segments, screens = [], []  # screens: representative frame per distinct screen id
+    for idx, members in enumerate(groups):
+        rep = _medoid(features, members)
+        screen_id = next((sid for sid, other in enumerate(screens)
+                          if features.similarity(rep, other) >= SAME_SCREEN_THRESHOLD), None)
+        if screen_id is None:
+            screen_id = len(screens)
+            screens.append(rep)
+        segments.append({
+            "segment_id": idx,
+            "screen_id": screen_id,
+            "start_s": frame_time(members[0]),
+            "end_s": frame_time(members[-1]),
+            "representative": rep,
+            "frames": members,
+            "cohesion": round(min(features.similarity(rep, m) for m in members), 3),
+            "tokens": sorted(set().union(*(features.tokens[m] for m in members))),
+        })
+
+    return {
+        "frames": len(ocr_results),
+        "skipped_frames": [r["frame"] for r in ocr_results if r.get("skipped")],
+        "segments": segments,
+        "screens": len(screens),
+    }
+
+
+def save_segments(segmentation: Dict, output_path):
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(segmentation, f, indent=2)
+
+
+# ---------- Expansion Policy ---------- #
+
+def expansion_candidates(step_text: str, segments: List[Dict], top_k: int = EXPAND_TOP_K) -> List[Dict]:
+    """
+    Segments whose member frames should be checked individually when no representative matched:
+    every non-cohesive segment, plus the `top_k` segments sharing most tokens with the step.
+    """
+    step_tokens = text_tokens(step_text)
+    loose = [s for s in segments if s["cohesion"] < COHESION_THRESHOLD and len(s["frames"]) > 1]
+    ranked = sorted(
+        (s for s in segments if len(s["frames"]) > 1),
+        key=lambda s: len(step_tokens & set(s["tokens"])), reverse=True,
+    )
+    picked = {s["segment_id"]: s for s in loose + ranked[:top_k]}
+    return sorted(picked.values(), key=lambda s: s["segment_id"])
+
+
+if __name__ == "__main__":
+    # python screen_segments.py <frames_dir> <ocr_caption_results.json>
+    frames_dir = sys.argv[1] if len(sys.argv) > 1 else "output/frames"
+    ocr_path = sys.argv[2] if len(sys.argv) > 2 else "output/ocr_caption_results.json"
+    with open(ocr_path, "r", encoding="utf-8") as f:
+        segmentation = segment_frames(frames_dir, json.load(f))
+    for seg in segmentation["segments"]:
+        print(f"🧩 segment {seg['segment_id']:>2} screen {seg['screen_id']:>2} "
+              f"{seg['start_s']:>4}s-{seg['end_s']:<4}s {len(seg['frames']):>2} frames "
+              f"cohesion={seg['cohesion']:.2f} rep={seg['representative']}")
+    print(f"📊 {segmentation['frames']} frames → {len(segmentation['segments'])} segments, "
+          f"{segmentation['screens']} distinct screens, {len(segmentation['skipped_frames'])} skipped")
@@ -0,0 +1,225 @@
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from parser import iter_log, parse_steps
+
+# Columnar-ish step store for cross-run analysis: every parsed step of every run lands in one
+# indexed SQLite table, so flaky / most-failing step queries never re-parse agent logs.
+#   python step_store.py ingest /data/runs --workers 8
+#   python step_store.py flaky
+#   python step_store.py failing --limit 20
+
+STORE_DB = Path("output/step_store.sqlite")
+LOG_NAMES = ("agent_inner_logs.json", "agent_inner_log.json")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    log_path    TEXT NOT NULL,
+    log_size    INTEGER NOT NULL,
+    log_mtime   REAL NOT NULL,
+    step_count  INTEGER NOT NULL,
+    ingested_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    run_id         TEXT NOT NULL,
+    step_id        INTEGER NOT NULL,
+    step_key       TEXT NOT NULL,
+    step_type      TEXT,
+    description    TEXT,
+    is_assert      INTEGER,
+    is_passed      INTEGER,
+    is_failed      INTEGER,
+    assert_summary TEXT,
+    status         TEXT,
+    verification   TEXT,
+    details        TEXT,
+    validation     TEXT,
+    PRIMARY KEY (run_id, step_id)
+);
+CREATE INDEX IF NOT EXISTS idx_steps_run_id ON steps (run_id);
+CREATE INDEX IF NOT EXISTS idx_steps_step_type ON steps (step_type);
+CREATE INDEX IF NOT EXISTS idx_steps_is_passed ON steps (is_passed);
+CREATE INDEX IF NOT EXISTS idx_steps_key_failed ON steps (step_key, is_failed);
+"""
+
+STEP_COLUMNS = [
+    "run_id", "step_id", "step_key", "step_type", "description", "is_assert", "is_passed",
+    "is_failed", "assert_summary", "status", "verification", "details", "validation"
+]
+
+
+def connect(db_path: Path = STORE_DB) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# ---------- Parsing (process workers) ---------- #
+
+def run_id_for(log_path: Path, root: Path) -> str:
+    run_dir = log_path.parent.parent if log_path.parent.name == "logs" else log_path.parent
+    return str(run_dir.relative_to(root)) if run_dir != root else root.name
+
+
+def step_failed(step) -> bool:
+    result = step.get("execution_result", {})
+    if str(result.get("verification", "")).startswith("VERIFICATION_FAILED"):
+        return True
+    if result.get("status") and not str(result["status"]).startswith("COMPLETED_SUCCESSFULLY"):
+        return True
+    return bool(step.get("is_assert")) and not step.get("is_passed")
+
+
+def parse_run(run_id: str, log_path: str):
+    rows = []
+    for step in parse_steps(iter_log(log_path)):
+        result = step.get("execution_result", {})
+        rows.append((
+            run_id,
+            step["step_id"],
+            " ".join(step.get("description", "").lower().split()),
+            step.get("step_type", ""),
+            step.get("description", ""),
+            int(bool(step.get("is_assert"))),
+            int(bool(step.get("is_passed"))),
+            int(step_failed(step)),
+            step.get("assert_summary", ""),
+            str(result.get("status", "")),
+            str(result.get("verification", "")),
+            str(result.get("details", "")),
+            str(result.get("validation", "")),
+        ))
+    return run_id, rows
+
+
+# ---------- Ingestion ---------- #
+
+def find_run_logs(root: Path):
+    for dirpath, _, filenames in os.walk(root):
+        for name in LOG_NAMES:
+            if name in filenames:
+                yield Path(dirpath) / name
+
+
+def ingest(root: Path, db_path: Path = STORE_DB, workers: int = None) -> dict:
+    """Parse every new or changed run log under `root` in a process pool and append its steps."""
+    root = Path(root)
+    conn = connect(db_path)
+    known = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT run_id, log_size, log_mtime FROM runs")}
+
+    pending, skipped = {}, 0
+    for log_path in find_run_logs(root):
+        stat = log_path.stat()
+        run_id = run_id_for(log_path, root)
+        if known.get(run_id) == (stat.st_size, stat.st_mtime):
+            skipped += 1
+            continue
+        pending[run_id] = (log_path, stat)
+
+    start = time.perf_counter()
+    ingested, failed = 0, 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {run_id: pool.submit(parse_run, run_id, str(log_path)) for run_id, (log_path, _) in pending.items()}
+        for run_id, future in futures.items():
+            log_path, stat = pending[run_id]
+            try:
+                _, rows = future.result()
+            except Exception as e:
+                print(f"❌ {run_id}: {type(e).__name__}: {e}")
+                failed += 1
+                continue
+            with conn:
+                conn.execute("DELETE FROM steps WHERE run_id = ?", (run_id,))
+                conn.executemany(
+                    f"INSERT INTO steps ({', '.join(STEP_COLUMNS)}) VALUES ({', '.join('?' * len(STEP_COLUMNS))})",
+                    rows,
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+                    (run_id, str(log_path), stat.st_size, stat.st_mtime, len(rows), time.time()),
+                )
+            ingested += 1
+
+    conn.close()
+    stats = {
+        "ingested_runs": ingested,
+        "failed_runs": failed,
+        "skipped_unchanged": skipped,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    print(f"✅ Ingested {ingested} runs into {db_path} ({stats['seconds']}s, {failed} failed, {skipped} unchanged)")
+    return stats
+
+
+# ---------- Cross-run Queries ---------- #
+# A step can repeat within one run (retries, re-asserts); counts are per run, and a run counts as a
+# failure of the step if any of its occurrences failed.
+STEP_RUNS = """
+    WITH step_runs AS (
+        SELECT step_key, run_id, MAX(COALESCE(is_failed, 0)) AS failed
+        FROM steps
+        GROUP BY step_key, run_id
+    )
+"""
+
+
+def most_failing_steps(conn: sqlite3.Connection, limit: int = 20):
+    return conn.execute(STEP_RUNS + """
+        SELECT step_key, COUNT(DISTINCT run_id) AS runs, SUM(failed) AS failures,
+               ROUND(1.0 * SUM(failed) / COUNT(DISTINCT run_id), 3) AS failure_rate
+        FROM step_runs
+        GROUP BY step_key
+        HAVING failures > 0
+        ORDER BY failures DESC, failure_rate DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+
+
+def flaky_steps(conn: sqlite3.Connection, min_runs: int = 2, limit: int = 20):
+    """Steps that both passed and failed across runs, most evenly split first."""
+    return conn.execute(STEP_RUNS + """
+        SELECT step_key, COUNT(DISTINCT run_id) AS runs, SUM(failed) AS failures,
+               ROUND(1.0 * SUM(failed) / COUNT(DISTINCT run_id), 3) AS failure_rate
+        FROM step_runs
+        GROUP BY step_key
+        HAVING runs >= ? AND failures > 0 AND failures < runs
+        ORDER BY ABS(0.5 - failure_rate) ASC, runs DESC
+        LIMIT ?
+    """, (min_runs, limit)).fetchall()
+
+
+def main():
+    cli = argparse.ArgumentParser(description="Bulk multi-run step store")
+    cli.add_argument("--db", type=Path, default=STORE_DB)
+    sub = cli.add_subparsers(dest="command", required=True)
+    ingest_cmd = sub.add_parser("ingest", help="Parse all run logs under a directory tree")
+    ingest_cmd.add_argument("root", type=Path)
+    ingest_cmd.add_argument("--workers", type=int, default=None)
+    flaky_cmd = sub.add_parser("flaky", help="Steps that pass in some runs and fail in others")
+    flaky_cmd.add_argument("--min-runs", type=int, default=2)
+    flaky_cmd.add_argument("--limit", type=int, default=20)
+    failing_cmd = sub.add_parser("failing", help="Steps that fail most often")
+    failing_cmd.add_argument("--limit", type=int, default=20)
+    args = cli.parse_args()
+
+    if args.command == "ingest":
+        ingest(args.root, args.db, args.workers)
+        return
+
+    conn = connect(args.db)
+    rows = flaky_steps(conn, args.min_runs, args.limit) if args.command == "flaky" else most_failing_steps(conn, args.limit)
+    print(f"{'failures':>8} {'runs':>6} {'rate':>6}  step")
+    for step_key, runs, failures, rate in rows:
+        print(f"{failures:>8} {runs:>6} {rate:>6}  {step_key}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
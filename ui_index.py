@@ -0,0 +1,189 @@
+import json
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# ---------- Config ---------- #
+# Structured view of OCR output: per-frame UI elements (text, role, approximate bbox) and an inverted
+# index from normalised tokens to the frames/elements containing them. Steps that quote literals
+# ('Rainbow sweater', 'Turtle Neck') are resolved by index lookup before any LLM is asked; only when
+# a quoted literal is not on any candidate frame does verification fall back to the LLM.
+# Works on both OCR modes: OCR_MODE=elements output is parsed as JSON, plain transcriptions are split
+# into one "text" element per line.
+LITERAL_INDEX = os.getenv("LITERAL_INDEX", "1") == "1"
+
+ROLES = ["button", "input", "filter", "heading", "link", "menu", "label", "text"]
+
+ELEMENTS_PROMPT = (
+    "You are acting as a strict OCR engine. Read **all visible text and UI elements** exactly as they "
+    "appear in this frame. Do not infer or summarize. Reply with JSON only, in this form: "
+    '{"elements": [{"text": "...", "role": "button|input|filter|heading|link|menu|label|text", '
+    '"bbox": [x0, y0, x1, y1]}], "caption": "..."} '
+    "where bbox is the approximate box in 0-1000 coordinates of the frame and caption is one line "
+    "describing the purpose of the screen."
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# 'single' or "double" (incl. curly) quotes, not apostrophes inside words like Wrangler's
+_QUOTED = re.compile(r"""(?<![A-Za-z0-9])(?:'([^'\n]{2,60})'|"([^"\n]{2,60})"|‘([^’\n]{2,60})’|“([^”\n]{2,60})”)""")
+
+
+def normalize(text: str) -> Tuple[str, ...]:
+    return tuple(_TOKEN.findall(text.lower()))
+
+
+def quoted_literals(text: str) -> List[str]:
+    return [next(g for g in m.groups() if g) for m in _QUOTED.finditer(text)]
+
+
+# ---------- Parsing ---------- #
+
+def _element(item) -> Optional[Dict]:
+    if isinstance(item, str):
+        item = {"text": item}
+    if not isinstance(item, dict) or not str(item.get("text", "")).strip():
+        return None
+    role = str(item.get("role", "text")).lower()
+    bbox = item.get("bbox")
+    valid_bbox = isinstance(bbox, list) and len(bbox) == 4 and all(isinstance(v, (int, float)) for v in bbox)
+    return {
+        "text": str(item["text"]).strip(),
+        "role": role if role in ROLES else "text",
+        "bbox": [int(v) for v in bbox] if valid_bbox else None,
+    }
+
+
+def parse_elements(output: str) -> Tuple[List[Dict], str]:
+    """(elements, caption) from a VLM reply: the JSON of ELEMENTS_PROMPT, or a plain line-per-element transcription."""
+    start, end = output.find("{"), output.rfind("}")
+    if start != -1 and end > start:
+        try:
+            parsed = json.loads(output[start:end + 1])
+            elements = [e for e in map(_element, parsed.get("elements", [])) if e]
+            return elements, str(parsed.get("caption", "")).strip()
+        except (json.JSONDecodeError, AttributeError):
+            pass  # truncated or prose around it: fall through to line parsing
+
+    elements, caption = [], ""
+    for line in output.splitlines():
+        line = line.strip().lstrip("-*• ").strip()
+        if line.lower().startswith("caption:"):
+            caption = line.split(":", 1)[1].strip()
+        elif line:
+            elements.append({"text": line, "role": "text", "bbox": None})
+    return elements, caption
+
+
+def render_description(elements: List[Dict], caption: str) -> str:
+    """Text form of structured OCR for consumers that feed descriptions to an LLM."""
+    lines = [e["text"] if e["role"] == "text" else f"[{e['role']}] {e['text']}" for e in elements]
+    if caption:
+        lines.append(f"Caption: {caption}")
+    return "\n".join(lines)
+
+
+# ---------- Inverted Index ---------- #
+
+class UIIndex:
+    def __init__(self, ocr_results: List[Dict]):
+        self.elements: Dict[str, List[Dict]] = {}
+        self.frame_tokens: Dict[str, Tuple[str, ...]] = {}
+        self.postings: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+
+        for result in ocr_results:
+            if result.get("skipped"):
+                continue
+            frame = result["frame"]
+            elements = result.get("elements")
+            if elements is None:
+                elements, _ = parse_elements(result["description"])
+            self.elements[frame] = [dict(e, tokens=normalize(e["text"])) for e in elements]
+            self.frame_tokens[frame] = tuple(t for e in self.elements[frame] for t in e["tokens"])
+            for idx, element in enumerate(self.elements[frame]):
+                for token in set(element["tokens"]):
+                    self.postings[token][frame].append(idx)
+
+    def find(self, literal: str, frames=None) -> Dict[str, List[Dict]]:
+        """frame -> elements containing `literal` as a contiguous token sequence, optionally within `frames`."""
+        needle = normalize(literal)
+        if not needle:
+            return {}
+        candidates = set(self.postings.get(needle[0], {}))
+        for token in needle[1:]:
+            candidates &= set(self.postings.get(token, {}))
+        if frames is not None:
+            candidates &= set(frames)
+
+        hits = {}
+        for frame in candidates:
+            elements = [e for e in self.elements[frame] if _contains(e["tokens"], needle)]
+            if not elements and _contains(self.frame_tokens[frame], needle):
+                # Literal wrapped over two OCR lines, e.g. "Turtle" / "Neck"
+                elements = [e for e in self.elements[frame] if needle[0] in e["tokens"]][:1]
+            if elements:
+                hits[frame] = [{k: e[k] for k in ("text", "role", "bbox")} for e in elements]
+        return hits
+
+    def resolve(self, step_text: str, frames=None) -> Optional[List[Dict]]:
+        """
+        Frames showing every literal quoted in the step, as detective frame refs (step_no filled in by the
+        caller). None if the step quotes nothing or some literal is not visible on any candidate frame.
+        """
+        literals = quoted_literals(step_text)
+        if not literals:
+            return None
+        found = [self.find(literal, frames) for literal in literals]
+        common = set(found[0]).intersection(*found[1:])
+        if not common:
+            return None
+
+        refs = []
+        for frame in sorted(common, key=_frame_order):
+            seen = "; ".join(f"'{lit}' as {hits[frame][0]['role']} \"{hits[frame][0]['text']}\""
+                             for lit, hits in zip(literals, found))
+            refs.append({"frame_no": frame, "description": render_description(self.elements[frame], ""),
+                         "reason": f"Literal index: {seen}"})
+        return refs
+
+    def stats(self) -> Dict:
+        return {"frames": len(self.elements), "elements": sum(map(len, self.elements.values())),
+                "tokens": len(self.postings)}
+
+
+def _contains(tokens: Tuple[str, ...], needle: Tuple[str, ...]) -> bool:
+    n = len(needle)
+    return any(tokens[i:i + n] == needle for i in range(len(tokens) - n + 1))
+
+
+def _frame_order(name: str):
+    match = re.search(r"(\d+)s\.jpg$", name)
+    return (int(match.group(1)) if match else 0, name)
+
+
+if __name__ == "__main__":
+    # python ui_index.py output/ocr_caption_results.json output/summary.json
+    ocr_path = sys.argv[1] if len(sys.argv) > 1 else "output/ocr_caption_results.json"
+    summary_path = sys.argv[2] if len(sys.argv) > 2 else "output/summary.json"
+    with open(ocr_path, "r", encoding="utf-8") as f:
+        ocr_results = json.load(f)
+    with open(summary_path, "r", encoding="utf-8") as f:
+        steps = json.load(f)
+
+    start = time.perf_counter()
+    index = UIIndex(ocr_results)
+    print(f"📇 Indexed {index.stats()} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for step in steps:
+        start = time.perf_counter()
+        refs = index.resolve(step["description"])
+        took_us = (time.perf_counter() - start) * 1e6
+        literals = quoted_literals(step["description"])
+        if not literals:
+            print(f"➖ step {step['step_id']}: no quoted literals, LLM only")
+        elif refs:
+            print(f"✅ step {step['step_id']}: {literals} on {[r['frame_no'] for r in refs]} ({took_us:.0f} µs)")
+        else:
+            print(f"❓ step {step['step_id']}: {literals} not visible on any frame, LLM fallback ({took_us:.0f} µs)")
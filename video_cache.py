@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# ---------- Config ---------- #
+# Content-addressed cache for re-reported recordings: the same video.webm (by SHA-256 of its bytes)
+# with the same extraction settings reuses its frames, and with the same OCR settings its OCR results.
+#   <VIDEO_CACHE_DIR>/frames/<frames_key>/frame_*.jpg + manifest.json
+#   <VIDEO_CACHE_DIR>/ocr/<ocr_key>.json
+# frames_key = H(video sha256, extraction settings); ocr_key = H(frames_key, OCR settings), so a new
+# OCR prompt or model still reuses the decoded frames.
+CACHE_DIR = Path(os.getenv("VIDEO_CACHE_DIR", os.path.expanduser("~/.cache/medusa_watcher/video")))
+CACHE_MODE = os.getenv("VIDEO_CACHE_MODE", "on")  # on / off
+CACHE_MAX_BYTES = int(os.getenv("VIDEO_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+
+MANIFEST = "manifest.json"
+
+
+def file_sha256(path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def settings_key(*parts) -> str:
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(src: Path, dst: Path):
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)  # same filesystem: no copy, and survives eviction of the cache entry
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def read_manifest(frames_dir) -> Optional[Dict]:
+    """Manifest written next to extracted frames (video hash, frames key, settings), if any."""
+    try:
+        with open(Path(frames_dir) / MANIFEST, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class VideoCache:
+    def __init__(self, cache_dir: Path = CACHE_DIR, mode: str = CACHE_MODE, max_bytes: int = CACHE_MAX_BYTES):
+        if mode not in ("on", "off"):
+            raise ValueError(f"Unknown video cache mode '{mode}', expected on/off")
+        self.cache_dir = Path(cache_dir)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = {"frames": 0, "ocr": 0}
+        self.misses = {"frames": 0, "ocr": 0}
+
+    # ---------- Frames ---------- #
+
+    def frames(self, video_path, output_dir, settings: Dict, extract: Callable[[], List[str]]):
+        """
+        Frames of `video_path` in `output_dir`, from the cache when this exact recording was already
+        decoded with `settings`, otherwise via `extract()` (which must write into `output_dir`).
+        Returns (frame_paths, frames_key) and leaves a manifest in `output_dir` for the OCR stage.
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        video_sha = file_sha256(video_path)
+        key = settings_key(video_sha, settings)
+        entry = self.cache_dir / "frames" / key
+        manifest = {"video_sha256": video_sha, "frames_key": key, "settings": settings}
+
+        cached = read_manifest(entry) if self.mode == "on" else None
+        if cached is not None:
+            self.hits["frames"] += 1
+            frame_paths = []
+            for name in cached["frames"]:
+                _link_or_copy(entry / name, output_dir / name)
+                frame_paths.append(str(output_dir / name))
+            os.utime(entry / MANIFEST)  # LRU: mtime is last access
+            print(f"♻️ Reused {len(frame_paths)} cached frames for video {video_sha[:12]}")
+        else:
+            self.misses["frames"] += 1
+            frame_paths = extract()
+            if self.mode == "on":
+                self._store_frames(entry, frame_paths, manifest)
+
+        manifest["frames"] = [Path(p).name for p in frame_paths]
+        with open(output_dir / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return frame_paths, key
+
+    def _store_frames(self, entry: Path, frame_paths: List[str], manifest: Dict):
+        tmp_entry = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        tmp_entry.mkdir(parents=True, exist_ok=True)
+        for path in frame_paths:
+            _link_or_copy(Path(path), tmp_entry / Path(path).name)
+        with open(tmp_entry / MANIFEST, "w", encoding="utf-8") as f:
+            json.dump({**manifest, "frames": [Path(p).name for p in frame_paths]}, f, indent=2)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:  # another process stored the same recording first
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict()
+
+    # ---------- OCR ---------- #
+
+    def ocr_key(self, frames_key: str, settings: Dict) -> str:
+        return settings_key(frames_key, settings)
+
+    def get_ocr(self, key: str) -> Optional[List[Dict]]:
+        if self.mode == "off":
+            return None
+        path = self.cache_dir / "ocr" / f"{key}.json"
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                results = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses["ocr"] += 1
+            return None
+        os.utime(path)
+        self.hits["ocr"] += 1
+        return results
+
+    def put_ocr(self, key: str, results: List[Dict]):
+        if self.mode == "off":
+            return
+        path = self.cache_dir / "ocr" / f"{key}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def ocr(self, frames_dir, settings: Dict, compute: Callable[[], List[Dict]]) -> List[Dict]:
+        """OCR results for the frames in `frames_dir`, cached when they came through frames()."""
+        manifest = read_manifest(frames_dir)
+        if manifest is None:
+            return compute()
+        key = self.ocr_key(manifest["frames_key"], settings)
+        results = self.get_ocr(key)
+        if results is not None:
+            print(f"♻️ Reused cached OCR results for video {manifest['video_sha256'][:12]}")
+            return results
+        results = compute()
+        self.put_ocr(key, results)
+        return results
+
+    # ---------- Eviction ---------- #
+
+    def _entries(self):
+        """(last_access, size_bytes, path) for every frames directory and OCR file."""
+        entries = []
+        for entry in (self.cache_dir / "frames").glob("*"):
+            if entry.name.endswith(".tmp") or not (entry / MANIFEST).exists():
+                continue
+            size = sum(p.stat().st_size for p in entry.iterdir())
+            entries.append(((entry / MANIFEST).stat().st_mtime, size, entry))
+        for path in (self.cache_dir / "ocr").glob("*.json"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Drop least recently used entries until the cache is under `max_bytes`."""
+        total = 0
+        for _, size, path in sorted(self._entries(), reverse=True):
+            total += size
+            if total > self.max_bytes:
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict:
+        return {"mode": self.mode, "hits": dict(self.hits), "misses": dict(self.misses)}